@@ -0,0 +1,272 @@
+"""Deferred execution of mixed operations in a single round trip per server."""
+from .exceptions import ConnectionError, OperationalError
+from .multiplex import MultiplexMixin
+
+
+class Deferred(object):
+    """Result of an operation queued in a :class:`~.Batch`, available once
+    the batch is executed.
+    """
+
+    def __init__(self, convert):
+        self.convert = convert
+        self.finished = False
+        self.value = None
+        self.error = None
+
+    def done(self):
+        """Checks if the result is available.
+
+        :rtype: bool
+        """
+        return self.finished
+
+    def result(self):
+        """Returns the result of the operation, the same a direct
+        :class:`~.manager.Manager` call would return, or raises its error.
+        Raises :exc:`~.exceptions.OperationalError` if the batch hasn't been
+        executed yet.
+        """
+        if not self.finished:
+            raise OperationalError('Batch has not been executed yet.')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _resolve(self, data):
+        """Sets the result out of a parsed response or an exception.
+        Private method.
+        """
+        self.finished = True
+        if isinstance(data, Exception):
+            self.error = data
+        else:
+            self.value = self.convert(data)
+
+
+class Batch(object):
+    """Collects operations of a :class:`~.manager.Manager` and performs them
+    together, see :meth:`~.manager.Manager.batch`.
+
+    Each operation returns a :class:`~.Deferred` right away. Indexes are
+    opened while operations are queued, so invalid arguments are reported
+    immediately. On :meth:`~.execute` requests are grouped per connection:
+    every group is sent in one go, all of them before any response is read,
+    so the servers work on them concurrently and the whole batch takes about
+    one round trip to the slowest server.
+
+    Requests of a connection are performed in order, but reads and writes use
+    different connections, so a read doesn't see writes of the same batch.
+    Failed requests don't affect the rest of the batch, connection errors fail
+    the whole group of the connection. Nothing is retried, as it's unknown
+    which writes the server applied before the connection failed.
+
+    With a multiplexed manager all requests are queued on the shared
+    connections at once instead.
+
+    Caching and batching of the manager are bypassed and reads aren't checked
+    against Bloom filters, inserted and updated keys are added to them though.
+    """
+
+    def __init__(self, manager, deadline=None):
+        """
+        :param manager: manager to perform operations with.
+        :type manager: :class:`~.manager.Manager`
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the batch must complete by.
+        :type deadline: number or None
+        """
+        self.manager = manager
+        self.deadline = deadline
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.requests = []
+
+    def _queue(self, socket, index_id, query, convert):
+        """Queues a request and returns its deferred result.
+        Private method.
+        """
+        deferred = Deferred(convert)
+        self.requests.append((socket, index_id, list(query), deferred))
+        return deferred
+
+    def get(self, db, table, fields, value, index_name=None):
+        """Queues :meth:`~.manager.Manager.get`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        socket = self.manager.read_socket
+        index_id = socket.get_index_id(db, table, fields, index_name, self.deadline)
+        query = socket._find_query(index_id, '=', [str(value)])
+        return self._queue(socket, index_id, query,
+                           lambda data: data and list(zip(fields, data[0])) or [])
+
+    def find(self, db, table, operation, fields, values, index_name=None, limit=0,
+             offset=0, in_values=None):
+        """Queues :meth:`~.manager.Manager.find`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        socket = self.manager.read_socket
+        index_id = socket.get_index_id(db, table, fields, index_name, self.deadline)
+        query = socket._find_query(index_id, operation, values, limit, offset, in_values)
+        return self._queue(socket, index_id, query,
+                           lambda data: [list(zip(fields, row)) for row in data])
+
+    def insert(self, db, table, fields, index_name=None):
+        """Queues :meth:`~.manager.Manager.insert`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        keys, values = list(zip(*fields))
+        if self.manager.bloom_filters:
+            self.manager._bloom_add(db, table, keys, values)
+        socket = self.manager.write_socket
+        index_id = socket.get_index_id(db, table, keys, index_name, self.deadline)
+        return self._queue(socket, index_id, socket._insert_query(index_id, values),
+                           lambda data: True)
+
+    def _modify(self, db, table, operation, fields, values, op, modify_values,
+                index_name, limit, offset, return_original):
+        """Queues a modification, see :meth:`~.update`.
+        Private method.
+        """
+        if op == 'U' and self.manager.bloom_filters:
+            self.manager._bloom_add(db, table, fields, modify_values)
+        socket = self.manager.write_socket
+        index_id = socket.get_index_id(db, table, fields, index_name, self.deadline)
+        op += return_original and '?' or ''
+        query = socket._find_modify_query(index_id, operation, values, op, modify_values,
+                                          limit, offset)
+
+        def convert(data):
+            if return_original:
+                return [list(zip(fields, row)) for row in data]
+            return data and int(data[0][0]) or 0
+
+        return self._queue(socket, index_id, query, convert)
+
+    def update(self, db, table, operation, fields, values, update_values,
+               index_name=None, limit=0, offset=0, return_original=False):
+        """Queues :meth:`~.manager.Manager.update`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        return self._modify(db, table, operation, fields, values, 'U', update_values,
+                            index_name, limit, offset, return_original)
+
+    def incr(self, db, table, operation, fields, values, step=['1'], index_name=None,
+             limit=0, offset=0, return_original=False):
+        """Queues :meth:`~.manager.Manager.incr`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        return self._modify(db, table, operation, fields, values, '+', step,
+                            index_name, limit, offset, return_original)
+
+    def decr(self, db, table, operation, fields, values, step=['1'], index_name=None,
+             limit=0, offset=0, return_original=False):
+        """Queues :meth:`~.manager.Manager.decr`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        return self._modify(db, table, operation, fields, values, '-', step,
+                            index_name, limit, offset, return_original)
+
+    def delete(self, db, table, operation, fields, values, index_name=None,
+               limit=0, offset=0, return_original=False):
+        """Queues :meth:`~.manager.Manager.delete`.
+
+        :rtype: :class:`~.Deferred`
+        """
+        return self._modify(db, table, operation, fields, values, 'D', [],
+                            index_name, limit, offset, return_original)
+
+    def execute(self):
+        """Performs all queued operations and resolves their results.
+        Called automatically when the ``with`` block of the batch ends.
+        """
+        requests, self.requests = self.requests, []
+        groups = {}
+        submitted = []
+        try:
+            for socket, index_id, query, deferred in requests:
+                if isinstance(socket, MultiplexMixin):
+                    try:
+                        future = socket.pool.submit(index_id, ['\t'.join(query) + '\n'])[0]
+                        submitted.append((socket, future, deferred))
+                    except (ConnectionError, OperationalError) as e:
+                        deferred._resolve(e)
+                    continue
+                try:
+                    conn = socket._get_connection(index_id, True, self.deadline)
+                except (ConnectionError, OperationalError) as e:
+                    self._fail(socket, [(index_id, query, deferred)], e)
+                    continue
+                group = groups.setdefault((id(socket), id(conn)), (socket, conn, []))
+                group[2].append((index_id, query, deferred))
+
+            # Every group is sent before any response is read, so servers
+            # process them in parallel
+            sent = []
+            for socket, conn, group in groups.values():
+                try:
+                    conn.send(''.join('\t'.join(query) + '\n' for index_id, query, deferred
+                                      in group), self.deadline)
+                    sent.append((socket, conn, group))
+                except ConnectionError as e:
+                    self._fail(socket, group, e)
+
+            for socket, conn, group in sent:
+                for position, (index_id, query, deferred) in enumerate(group):
+                    try:
+                        raw_data = conn.readline(self.deadline)
+                    except ConnectionError as e:
+                        self._fail(socket, group[position:], e)
+                        break
+                    self._parse(socket, raw_data, deferred)
+
+            for socket, future, deferred in submitted:
+                try:
+                    raw_data = socket.pool._wait(future, self.deadline)
+                except ConnectionError as e:
+                    deferred._resolve(e)
+                    continue
+                self._parse(socket, raw_data, deferred)
+        finally:
+            # Left over by an unexpected error, responses of the rest of
+            # a group can't be told apart anymore
+            error = OperationalError('Batch was not completed.')
+            for socket, conn, group in groups.values():
+                pending = [request for request in group if not request[2].done()]
+                if pending:
+                    conn.disconnect()
+                    self._fail(socket, pending, error)
+            for socket, index_id, query, deferred in requests:
+                if not deferred.done():
+                    deferred._resolve(error)
+
+    def _parse(self, socket, raw_data, deferred):
+        """Resolves a deferred result with a response.
+        Private method.
+        """
+        try:
+            deferred._resolve(socket._parse_response(raw_data))
+        except OperationalError as e:
+            deferred._resolve(e)
+
+    def _fail(self, socket, group, error):
+        """Fails requests of a group and forgets indexes of its connection.
+        Private method.
+        """
+        for index_id, query, deferred in group:
+            if index_id in socket.index_map:
+                socket.purge_index(index_id)
+            deferred._resolve(error)
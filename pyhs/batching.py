@@ -0,0 +1,117 @@
+"""Automatic batching of concurrent single row look ups."""
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from .exceptions import DeadlineExceeded
+
+
+class _Batch(object):
+    """Look ups of a single index collected within one batching window.
+    Private class.
+    """
+
+    def __init__(self):
+        self.futures = {}
+        self.full = threading.Event()
+
+
+class GetBatcher(object):
+    """Collects concurrent :meth:`~.manager.Manager.get` calls for the same
+    index and performs them as a single multi-key (IN clause) request.
+
+    The first thread that looks up a key opens a batch and waits for up to
+    :attr:`~.window` seconds or until :attr:`~.max_keys` keys are collected,
+    then sends the request on behalf of all threads in the batch and hands
+    them their rows. Identical keys within a batch are looked up only once.
+
+    .. note:: Rows are matched to keys by the value of the first field, so it
+       must be the look up field and HS must return it exactly as requested
+       (mind case-insensitive collations and numeric formatting).
+    """
+
+    WINDOW = 0.002
+    MAX_KEYS = 100
+
+    def __init__(self, manager, window=None, max_keys=None):
+        """
+        :param manager: manager used to perform the requests.
+        :type manager: :class:`~.manager.Manager`
+        :param window: number of seconds to wait for other keys, default is
+            defined in :const:`~.WINDOW`.
+        :type window: number or None
+        :param max_keys: number of keys that causes a batch to be sent before
+            the window is over, default is defined in :const:`~.MAX_KEYS`.
+        :type max_keys: integer or None
+        """
+        self.manager = manager
+        self.window = window or self.WINDOW
+        self.max_keys = max_keys or self.MAX_KEYS
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def get(self, db, table, fields, value, deadline=None):
+        """Looks up a single row, same as :meth:`~.manager.Manager.get` does.
+
+        :param string db: database name.
+        :param string table: table name.
+        :param list fields: list of table's fields to get, ordered by inclusion
+            into the index. First item must always be the look up field.
+        :param string value: a look up value.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the row must be returned by. A batch is sent with the deadline of
+            the thread that opened it.
+        :type deadline: number or None
+        :rtype: list of tuples
+        """
+        group = (db, table, tuple(fields))
+        value = str(value)
+
+        with self.lock:
+            batch = self.batches.get(group)
+            leader = batch is None
+            if leader:
+                batch = self.batches[group] = _Batch()
+
+            future = batch.futures.get(value)
+            if future is None:
+                future = batch.futures[value] = Future()
+                if len(batch.futures) >= self.max_keys:
+                    del self.batches[group]
+                    batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.batches.get(group) is batch:
+                    del self.batches[group]
+            self._execute(group, batch.futures, deadline)
+
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        try:
+            return list(future.result(timeout))
+        except TimeoutError:
+            raise DeadlineExceeded('Deadline exceeded while waiting for a batch')
+
+    def _execute(self, group, futures, deadline=None):
+        """Performs a look up of all keys of a batch and resolves their futures.
+        Private method.
+        """
+        db, table, fields = group
+        keys = list(futures)
+        try:
+            data = self.manager.find(db, table, '=', fields, keys[:1],
+                                     limit=len(keys), in_values=keys, deadline=deadline)
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        rows = {}
+        for row in data or []:
+            rows.setdefault(row[0][1], row)
+
+        for key, future in futures.items():
+            future.set_result(rows.get(key, []))
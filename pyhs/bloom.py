@@ -0,0 +1,327 @@
+"""Client-side Bloom filters that rule out look ups of missing keys."""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .exceptions import OperationalError
+from .utils import MIN_KEY
+
+
+class BloomFilter(object):
+    """Set of keys that answers "definitely missing" or "maybe present".
+
+    Bits are stored in a memory-mapped file, so the filter survives restarts
+    and is shared by all processes that map the same file. It's sized for
+    :attr:`~.capacity` keys at :attr:`~.error_rate` false positive rate,
+    the rate grows once more keys are added.
+
+    Keys can't be removed from a Bloom filter, so deleted keys keep looking
+    present until the filter is rebuilt with :meth:`~.build`. That only costs
+    a useless look up, never a wrong answer. A filter that hasn't been built
+    yet (or was cleared) rules nothing out.
+
+    Concurrent additions are serialized with a lock between threads and, where
+    :mod:`fcntl` is available, with a POSIX record lock between processes.
+    :meth:`~.build` fills a new file and atomically replaces the old one with it.
+    """
+
+    MAGIC = b'PYHSBLM1'
+    HEADER = struct.Struct('8sQI')
+    # Flags following the header: the filter holds all keys of its table,
+    # the file was replaced by a rebuilt one
+    BUILT_OFFSET = HEADER.size
+    REPLACED_OFFSET = HEADER.size + 1
+    # Process id of a running rebuild, keys added meanwhile go to its file too
+    BUILDER = struct.Struct('I')
+    BUILDER_OFFSET = 24
+    HEADER_SIZE = 64
+    CAPACITY = 1000000
+    ERROR_RATE = 0.01
+    PAGE_SIZE = 10000
+
+    def __init__(self, path, capacity=None, error_rate=None):
+        """
+        :param string path: path of the file to map, it is created if missing.
+        :param capacity: expected number of keys, default is defined in
+            :const:`~.CAPACITY`.
+        :type capacity: integer or None
+        :param error_rate: false positive rate at full capacity, default is
+            defined in :const:`~.ERROR_RATE`.
+        :type error_rate: number or None
+        """
+        self.path = path
+        self.capacity = capacity or self.CAPACITY
+        self.error_rate = error_rate or self.ERROR_RATE
+        if not 0 < self.error_rate < 1:
+            raise ValueError('Error rate must be between 0 and 1.')
+
+        self.bits = int(math.ceil(-self.capacity * math.log(self.error_rate)
+                                  / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / self.capacity * math.log(2))))
+        self.size = self.HEADER_SIZE + (self.bits + 7) // 8
+
+        self.fd = None
+        self.lock = threading.Lock()
+        # Filter filled by build() of this instance and the one of another
+        # instance or process, additions go to them too
+        self.rebuilding = None
+        self.building = (0, None)
+        self._open()
+
+    def _open(self):
+        """Maps the file at :attr:`~.path`, initializing it if it isn't
+        a filter yet. The caller must hold :attr:`~.lock` unless it's the
+        constructor.
+        Private method.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with _FileLock(fd):
+            header = os.pread(fd, self.HEADER.size, 0)
+            valid = len(header) == self.HEADER.size and header.startswith(self.MAGIC)
+            if not valid:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, self.HEADER.pack(self.MAGIC, self.bits, self.hashes), 0)
+
+        if valid and self.HEADER.unpack(header)[1:] != (self.bits, self.hashes):
+            os.close(fd)
+            raise ValueError('Bloom filter file "%s" has a different layout.' % self.path)
+
+        if self.fd is not None:
+            # Previous map is left to be unmapped once no thread uses it
+            os.close(self.fd)
+        self.fd = fd
+        self.map = mmap.mmap(fd, self.size)
+
+    def _current(self):
+        """Returns the map of the current filter file, mapping the file again
+        if it has been replaced by a rebuilt one.
+        Private method.
+
+        :rtype: :class:`mmap.mmap`
+        """
+        current = self.map
+        if current[self.REPLACED_OFFSET]:
+            with self.lock:
+                if self.map[self.REPLACED_OFFSET]:
+                    self._open()
+                current = self.map
+        return current
+
+    @contextmanager
+    def _locked(self):
+        """Context manager that locks the current filter file for writing and
+        yields its map.
+        Private method.
+        """
+        with self.lock:
+            while True:
+                fd = self.fd
+                with _FileLock(fd):
+                    if not self.map[self.REPLACED_OFFSET]:
+                        yield self.map
+                        return
+                self._open()
+
+    def _positions(self, key):
+        """Returns bit positions of ``key`` (double hashing).
+        Private method.
+        """
+        digest = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    @property
+    def built(self):
+        """``True`` if the filter has been built with :meth:`~.build`, so it
+        rules out missing keys.
+        """
+        return bool(self._current()[self.BUILT_OFFSET])
+
+    def add(self, key):
+        """Adds ``key`` to the filter.
+
+        :param key: key, compared by its string value.
+        """
+        self.add_many([key])
+
+    def add_many(self, keys):
+        """Adds all ``keys`` to the filter, locking it just once.
+
+        :param iterable keys: keys, compared by their string values.
+        """
+        keys = list(keys)
+        positions = [position for key in keys for position in self._positions(key)]
+        with self._locked() as current:
+            for position in positions:
+                offset = self.HEADER_SIZE + position // 8
+                current[offset] |= 1 << position % 8
+
+            building = self._building(current)
+            if building is not None:
+                building.add_many(keys)
+
+    def _building(self, current):
+        """Returns the filter being built to replace the current one, or
+        ``None`` if there's no rebuild. Must be called with the current filter
+        file locked, see :meth:`~._locked`.
+        Private method.
+
+        :rtype: :class:`~.BloomFilter` or None
+        """
+        pid = self.BUILDER.unpack_from(current, self.BUILDER_OFFSET)[0]
+        if self.rebuilding is not None and pid == os.getpid():
+            return self.rebuilding
+
+        if pid != self.building[0]:
+            if self.building[1] is not None:
+                self.building[1].close()
+            building = None
+            path = self._building_path(pid)
+            # Builder removes the file only after it's unregistered, unless it died
+            if pid and os.path.exists(path):
+                building = BloomFilter(path, self.capacity, self.error_rate)
+            self.building = (pid, building)
+        return self.building[1]
+
+    def _building_path(self, pid):
+        """Returns path of the file a rebuild of process ``pid`` fills.
+        Private method.
+        """
+        return '%s.%d.building' % (self.path, pid)
+
+    def __contains__(self, key):
+        """Checks if ``key`` may be present, ``False`` means it's definitely
+        missing.
+
+        :param key: key, compared by its string value.
+        :rtype: bool
+        """
+        current = self._current()
+        if not current[self.BUILT_OFFSET]:
+            return True
+        for position in self._positions(key):
+            if not current[self.HEADER_SIZE + position // 8] & 1 << position % 8:
+                return False
+        return True
+
+    def clear(self):
+        """Removes all keys from the filter, it rules nothing out until it's
+        built again.
+        """
+        with self._locked() as current:
+            current[self.BUILT_OFFSET] = 0
+            current[self.HEADER_SIZE:] = bytes(len(current) - self.HEADER_SIZE)
+
+    def build(self, read_socket, db, table, key_field, index_name=None,
+              start=MIN_KEY, page_size=None):
+        """Adds all keys of a table to a new filter file, scanning its index
+        with :meth:`~.sockets.ReadSocket.find` page by page, and replaces the
+        filter file with it. The current filter keeps answering during the
+        scan, processes that map it switch to the new file on their next use.
+
+        Keys added to the filter while the scan is running are added to the
+        new file too, so they aren't lost by the replacement. Only one rebuild
+        runs at a time, if another process starts one meanwhile, this one is
+        abandoned with :exc:`~.exceptions.OperationalError`.
+
+        :param read_socket: socket to scan with.
+        :type read_socket: :class:`~.sockets.ReadSocket`
+        :param string db: database name.
+        :param string table: table name.
+        :param string key_field: name of the key field.
+        :param index_name: name of the index on ``key_field``, default is
+            ``PRIMARY``.
+        :type index_name: string or None
+        :param string start: lowest key to scan from, default suits integer keys.
+            Pass an empty string for string keys.
+        :param page_size: number of keys requested at once, default is defined
+            in :const:`~.PAGE_SIZE`.
+        :type page_size: integer or None
+        :rtype: integer
+        """
+        page_size = page_size or self.PAGE_SIZE
+        index_id = read_socket.get_index_id(db, table, [key_field], index_name)
+
+        pid = os.getpid()
+        building_path = self._building_path(pid)
+        if os.path.exists(building_path):
+            os.remove(building_path)
+        building = BloomFilter(building_path, self.capacity, self.error_rate)
+        with self._locked() as current:
+            self.BUILDER.pack_into(current, self.BUILDER_OFFSET, pid)
+            self.rebuilding = building
+
+        try:
+            added = 0
+            key, operation = start, '>='
+            while True:
+                page = read_socket.find(index_id, operation, [key], page_size) or []
+                building.add_many(row[0] for row in page)
+                added += len(page)
+                if len(page) < page_size:
+                    break
+                key, operation = page[-1][0], '>'
+
+            with self._locked() as current:
+                if self.BUILDER.unpack_from(current, self.BUILDER_OFFSET)[0] != pid:
+                    raise OperationalError('Bloom filter "%s" is being rebuilt by '
+                                           'another process.' % self.path)
+                building.map[self.BUILT_OFFSET] = 1
+                building.flush()
+                os.replace(building_path, self.path)
+                current[self.REPLACED_OFFSET] = 1
+                self.rebuilding = None
+        except BaseException:
+            with self._locked() as current:
+                if self.BUILDER.unpack_from(current, self.BUILDER_OFFSET)[0] == pid:
+                    self.BUILDER.pack_into(current, self.BUILDER_OFFSET, 0)
+                self.rebuilding = None
+            if os.path.exists(building_path):
+                os.remove(building_path)
+            raise
+        finally:
+            building.close()
+
+        self._current()
+        return added
+
+    def flush(self):
+        """Writes changes of the filter to disk."""
+        self.map.flush()
+
+    def close(self):
+        """Unmaps the filter file. The file itself is left in place."""
+        if self.building[1] is not None:
+            self.building[1].close()
+            self.building = (0, None)
+        self.map.close()
+        os.close(self.fd)
+
+
+class _FileLock(object):
+    """Exclusive record lock of the filter file header, see
+    :meth:`~.BloomFilter._locked`.
+    Private class.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, BloomFilter.HEADER_SIZE, 0)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, BloomFilter.HEADER_SIZE, 0)
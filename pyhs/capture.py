@@ -0,0 +1,112 @@
+"""Capture of HandlerSocket requests into compact binary files."""
+import atexit
+import os
+import random
+import struct
+import threading
+from collections import namedtuple
+
+from .utils import decode, encode
+
+
+MAGIC = b'PYHSCAP1'
+RECORD = struct.Struct('<ddIHI')
+
+CapturedRequest = namedtuple('CapturedRequest',
+                             'started elapsed response_size index tokens')
+CapturedRequest.__doc__ = """Single captured request.
+
+``index`` is a ``(db, table, fields, index_name)`` tuple of the index the
+request used and ``tokens`` is a list of encoded request tokens, the first
+one being the client-side index id.
+"""
+
+
+class CaptureRecorder(object):
+    """Appends requests performed by :class:`~.sockets.HandlerSocket` to
+    a capture file, see :func:`~.read_capture` for reading it back.
+
+    Every record holds the start time, the latency and the response size of
+    a request along with its index definition and encoded tokens. Only
+    a :attr:`~.sample_rate` share of requests is recorded. Each record is
+    written with a single append, so several threads and processes may share
+    a capture file.
+
+    Pass the recorder to the socket (or :class:`~.manager.Manager`)
+    constructor to enable capturing.
+    """
+
+    SAMPLE_RATE = 1.0
+
+    def __init__(self, path, sample_rate=None):
+        """
+        :param string path: path of the capture file, new records are appended
+            to existing ones.
+        :param sample_rate: share of requests to record between 0 and 1,
+            default is defined in :const:`~.SAMPLE_RATE`.
+        :type sample_rate: number or None
+        """
+        self.path = path
+        self.sample_rate = sample_rate if sample_rate is not None else self.SAMPLE_RATE
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size == 0:
+            os.write(self.fd, MAGIC)
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def sample(self):
+        """Decides whether the next request should be recorded.
+
+        :rtype: bool
+        """
+        return self.fd is not None and random.random() < self.sample_rate
+
+    def record(self, index, line, started, elapsed, response_size):
+        """Writes a record of a single request.
+
+        :param tuple index: ``(db, table, fields, index_name)`` tuple as kept
+            in :attr:`~.sockets.HandlerSocket.index_specs`.
+        :param string line: request line without the trailing LF.
+        :param number started: request start time as returned by :func:`time.time`.
+        :param number elapsed: request latency in seconds.
+        :param integer response_size: response length in bytes.
+        """
+        index = '\t'.join(map(encode, index)).encode('utf-8')
+        line = line.encode('utf-8')
+        data = RECORD.pack(started, elapsed, response_size, len(index), len(line)) \
+            + index + line
+        with self.lock:
+            if self.fd is not None:
+                os.write(self.fd, data)
+
+    def close(self):
+        """Stops recording and closes the capture file."""
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+def read_capture(path):
+    """Reads requests from a capture file written by :class:`~.CaptureRecorder`.
+
+    :param string path: path of the capture file.
+    :rtype: generator of :class:`~.CapturedRequest`
+    """
+    with open(path, 'rb') as stream:
+        if stream.read(len(MAGIC)) != MAGIC:
+            raise ValueError('File "%s" is not a capture file.' % path)
+
+        while True:
+            header = stream.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            started, elapsed, response_size, index_size, line_size = RECORD.unpack(header)
+            index = stream.read(index_size).decode('utf-8')
+            line = stream.read(line_size).decode('utf-8')
+            if len(line.encode('utf-8')) < line_size:
+                # Last record was cut short, e.g. the writer was killed
+                return
+            yield CapturedRequest(started, elapsed, response_size,
+                                  tuple(map(decode, index.split('\t'))),
+                                  line.split('\t'))
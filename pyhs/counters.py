@@ -0,0 +1,225 @@
+"""Write-behind buffering of counter increments."""
+import atexit
+import logging
+import threading
+
+from .exceptions import ConnectionError, OperationalError
+from .utils import check_columns
+
+
+log = logging.getLogger(__name__)
+
+
+class CounterBuffer(object):
+    """Buffered counter writer.
+
+    Aggregates increments and decrements per row key in memory and writes
+    the resulting deltas to HandlerSocket in the background, either every
+    :attr:`~.flush_interval` seconds or once :attr:`~.max_keys` different keys
+    are pending. Deltas are written with pipelined ``+``/``-`` modifications,
+    so a single round trip per index updates up to :const:`~.BATCH_SIZE` rows.
+
+    Deltas that couldn't be written because of connection (or any unexpected)
+    errors are merged back into the buffer and retried on the next flush.
+    Since it's not known whether the server applied a batch that failed while
+    reading responses, such a batch may be applied twice.
+
+    The buffer is flushed on :meth:`~.close` which is also called on
+    interpreter shutdown. It's usually created with
+    :meth:`~.manager.Manager.enable_counter_buffer`.
+
+    .. note:: Only ``=`` lookups are supported as deltas are aggregated per
+       exact key.
+    """
+
+    FLUSH_INTERVAL = 1
+    MAX_KEYS = 10000
+    BATCH_SIZE = 1000
+
+    def __init__(self, manager, flush_interval=None, max_keys=None):
+        """
+        :param manager: manager used to write the counters.
+        :type manager: :class:`~.manager.Manager`
+        :param flush_interval: max number of seconds deltas are kept in memory,
+            default is defined in :const:`~.FLUSH_INTERVAL`.
+        :type flush_interval: number or None
+        :param max_keys: number of pending keys that triggers a flush before
+            the interval passes, default is defined in :const:`~.MAX_KEYS`.
+        :type max_keys: integer or None
+        """
+        self.manager = manager
+        self.flush_interval = flush_interval or self.FLUSH_INTERVAL
+        self.max_keys = max_keys or self.MAX_KEYS
+
+        self.pending = {}
+        self.pending_keys = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+        self.thread = threading.Thread(target=self._run, name='pyhs-counter-buffer')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def incr(self, db, table, fields, values, step=['1'], index_name=None):
+        """Buffers an increment of a row that matches ``values``.
+        Arguments have the same meaning as in :meth:`~.manager.Manager.incr`.
+
+        :param string db: database name
+        :param string table: table name
+        :param list fields: list of table's fields to increment.
+        :param list values: key values of the row, ordered by inclusion into
+            the index.
+        :param list step: list of increment steps, ordered the same way as items
+            in ``fields``.
+        :param index_name: name of the index to use, default is ``PRIMARY``.
+        :type index_name: string or None
+        """
+        self._add(db, table, fields, values, [int(value) for value in step], index_name)
+
+    def decr(self, db, table, fields, values, step=['1'], index_name=None):
+        """Buffers a decrement of a row that matches ``values``.
+        See :meth:`~.incr` for arguments.
+        """
+        self._add(db, table, fields, values, [-int(value) for value in step], index_name)
+
+    def _add(self, db, table, fields, values, deltas, index_name):
+        """Merges ``deltas`` into the buffer.
+        Raises ``ValueError`` if given data doesn't validate.
+        Private method.
+        """
+        if self.closed:
+            raise OperationalError('Counter buffer is closed.')
+        if not check_columns(fields) or not check_columns(values):
+            raise ValueError('Fields and key values must be non-empty iterables.')
+        if len(deltas) != len(fields):
+            raise ValueError('Step must be given for every field.')
+
+        with self.lock:
+            self._merge((db, table, tuple(fields), index_name),
+                        tuple(str(value) for value in values), deltas)
+            full = self.pending_keys >= self.max_keys
+
+        if full:
+            self.wakeup.set()
+
+    def _merge(self, index_key, key, deltas):
+        """Adds ``deltas`` to the pending ones of a single key.
+        Must be called with :attr:`~.lock` held.
+        Private method.
+        """
+        counters = self.pending.setdefault(index_key, {})
+        current = counters.get(key)
+        if current is None:
+            counters[key] = list(deltas)
+            self.pending_keys += 1
+            return
+
+        current.extend([0] * (len(deltas) - len(current)))
+        for i, delta in enumerate(deltas):
+            current[i] += delta
+
+    def flush(self):
+        """Writes all pending deltas.
+
+        Raises :exc:`~.exceptions.ConnectionError` (or an unexpected error)
+        if some of them couldn't be written, those are kept in the buffer for
+        the next flush. Deltas rejected by the server are logged and dropped.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending = self.pending
+                self.pending = {}
+                self.pending_keys = 0
+
+            error = None
+            for index_key, counters in pending.items():
+                try:
+                    self._flush_index(index_key, counters)
+                except OperationalError as e:
+                    log.error('Dropping %d counters of %s.%s: %s',
+                              len(counters), index_key[0], index_key[1], e)
+                except Exception as e:
+                    error = e
+                    with self.lock:
+                        for key, deltas in counters.items():
+                            self._merge(index_key, key, deltas)
+
+            if error is not None:
+                raise error
+
+    def _flush_index(self, index_key, counters):
+        """Writes deltas of a single index. Written keys are removed from
+        ``counters`` so only the failed ones are left there on exception.
+        Private method.
+        """
+        db, table, fields, index_name = index_key
+        write_socket = self.manager.write_socket
+
+        keys = [key for key, deltas in counters.items() if any(deltas)]
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            chunk = keys[start:start + self.BATCH_SIZE]
+            requests = []
+            for key in chunk:
+                deltas = counters[key]
+                increments = [str(max(delta, 0)) for delta in deltas]
+                decrements = [str(max(-delta, 0)) for delta in deltas]
+                # Mixed sign deltas of different fields need both operations
+                if any(delta > 0 for delta in deltas):
+                    requests.append(('=', key, '+', increments))
+                if any(delta < 0 for delta in deltas):
+                    requests.append(('=', key, '-', decrements))
+
+            index_id = write_socket.get_index_id(db, table, fields, index_name)
+            results = write_socket.find_modify_many(index_id, requests)
+            for request, result in zip(requests, results):
+                if isinstance(result, OperationalError):
+                    log.error('Dropping counter delta %r for key %r of %s.%s: %s',
+                              request[3], request[1], db, table, result)
+
+            for key in chunk:
+                del counters[key]
+
+    def _run(self):
+        """Background flushing loop.
+        Private method.
+        """
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.closed:
+                break
+            try:
+                self.flush()
+            except ConnectionError as e:
+                log.warning('Counter flush failed, will retry: %s', e)
+            except Exception:
+                # Thread must survive anything, otherwise nothing is flushed
+                log.exception('Counter flush failed, will retry')
+
+    def close(self):
+        """Stops background flushing and writes all pending deltas.
+        Deltas that can't be written at that point are logged and lost.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        atexit.unregister(self.close)
+
+        try:
+            self.flush()
+        except ConnectionError as e:
+            log.error('Lost %d pending counters on close: %s', self.pending_keys, e)
+        except Exception:
+            log.exception('Lost %d pending counters on close', self.pending_keys)
@@ -11,3 +11,12 @@ class OperationalError(Exception):
 class RecoverableConnectionError(ConnectionError):
     """Raised on socket connection errors that can be attempted to recover instantly."""
     pass
+
+class DeadlineExceeded(ConnectionError):
+    """Raised when an operation couldn't complete before its deadline."""
+    pass
+
+class ServerOverloadedError(ConnectionError):
+    """Raised when a request is rejected because the server's concurrency
+    limit is reached."""
+    pass
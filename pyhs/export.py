@@ -0,0 +1,272 @@
+"""Parallel export of tables to TSV, CSV or JSON lines files."""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from .exceptions import ConnectionError
+from .manager import Manager
+from .utils import MAX_KEY, MIN_KEY, parse_address
+
+
+FORMATS = ('tsv', 'csv', 'jsonl')
+RETRIES = 3
+RETRY_DELAY = 0.5
+
+TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+class _TSVWriter(object):
+    """Writes rows in MySQL ``LOAD DATA INFILE`` format, ``NULL`` is ``\\N``.
+    Private class.
+    """
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write('\t'.join('\\N' if value is None else value.translate(TSV_ESCAPES)
+                                    for value in row) + '\n')
+
+
+class _CSVWriter(object):
+    """Writes rows as CSV with a header line, ``NULL`` is an empty value.
+    Private class.
+    """
+
+    def __init__(self, stream, fields):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(fields)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+
+class _JSONLinesWriter(object):
+    """Writes rows as JSON objects, one per line.
+    Private class.
+    """
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.fields = fields
+
+    def write(self, row):
+        self.stream.write(json.dumps(dict(zip(self.fields, row))) + '\n')
+
+
+WRITERS = {
+    'tsv': _TSVWriter,
+    'csv': _CSVWriter,
+    'jsonl': _JSONLinesWriter,
+}
+
+
+def key_bounds(manager, db, table, key_field, index_name=None):
+    """Returns the lowest and the highest integer key of a table, or ``None``
+    if the table is empty.
+
+    :param manager: manager to query.
+    :type manager: :class:`~.manager.Manager`
+    :param string db: database name.
+    :param string table: table name.
+    :param string key_field: name of the integer key field.
+    :param index_name: name of the index on ``key_field``, default is ``PRIMARY``.
+    :type index_name: string or None
+    :rtype: tuple of integers or None
+    """
+    first = manager.find(db, table, '>=', [key_field], [MIN_KEY], index_name, limit=1)
+    last = manager.find(db, table, '<=', [key_field], [MAX_KEY], index_name, limit=1)
+    if not first or not last:
+        return None
+    return int(first[0][0][1]), int(last[0][0][1])
+
+
+def split_range(low, high, partitions):
+    """Splits inclusive ``[low, high]`` integer range into at most
+    ``partitions`` consecutive inclusive ranges of about the same size.
+
+    :param integer low: lowest key.
+    :param integer high: highest key.
+    :param integer partitions: number of ranges.
+    :rtype: list of tuples
+    """
+    total = high - low + 1
+    partitions = max(1, min(partitions, total))
+    bounds = [low + total * i // partitions for i in range(partitions + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(partitions)]
+
+
+def _export_partition(manager, db, table, fields, index_name, low, high,
+                      page_size, writer, counts, number, stop):
+    """Scans a key range with keyset pagination and writes found rows.
+    Every page starts right after the last key written, so a page that failed
+    on a connection error is retried without duplicating rows, up to
+    :const:`~.RETRIES` times in a row.
+    Private function.
+    """
+    key, operation = str(low), '>='
+    failures = 0
+    while not stop.is_set():
+        fetched = 0
+        done = False
+        try:
+            for row in manager.find_iter(db, table, operation, fields, [key],
+                                         index_name, limit=page_size):
+                fetched += 1
+                if done or int(row[0][1]) > high:
+                    # Rest of the page is read to keep the connection usable
+                    done = True
+                    continue
+                writer.write([value for field, value in row])
+                key, operation = row[0][1], '>'
+                counts[number] += 1
+        except ConnectionError:
+            failures += 1
+            if failures > RETRIES:
+                raise
+            # Partition has a single server, so it's retried right after
+            # a pause rather than after the connection retry interval
+            for conn in manager.read_socket.connections:
+                conn.retry_time = 0
+            time.sleep(RETRY_DELAY * failures)
+            continue
+
+        failures = 0
+        if done or fetched < page_size:
+            return
+
+
+def export_table(servers, db, table, fields, output, format='tsv', partitions=None,
+                 workers=4, page_size=1000, index_name=None, low=None, high=None,
+                 progress=None, progress_interval=5):
+    """Exports rows of a table with an integer key into files.
+
+    The key range is split into ``partitions`` parts that are scanned in
+    parallel by ``workers`` threads, each with its own connection. Parts are
+    spread across ``servers`` round-robin, so all of them should hold the same
+    data (replicas). Every part is written to its own file named
+    ``<db>.<table>.<part>.<format>`` in ``output`` directory. Rows are streamed
+    page by page, so memory use doesn't depend on the table size.
+
+    Returns a dict with ``rows`` and ``seconds`` spent and a list of ``files``.
+
+    :param list servers: list of read server definitions, see
+        :class:`~.sockets.HandlerSocket`.
+    :param string db: database name.
+    :param string table: table name.
+    :param list fields: list of fields to export. First one must be the
+        integer key the index is built on.
+    :param string output: path of the directory to write files to.
+    :param string format: file format, one of :const:`~.FORMATS`.
+    :param partitions: number of key ranges, default is ``workers``.
+    :type partitions: integer or None
+    :param integer workers: number of concurrent scans.
+    :param integer page_size: number of rows requested at once.
+    :param index_name: name of the index on the key field, default is ``PRIMARY``.
+    :type index_name: string or None
+    :param low: lowest key to export, looked up if not given.
+    :type low: integer or None
+    :param high: highest key to export, looked up if not given.
+    :type high: integer or None
+    :param progress: optional function called every ``progress_interval``
+        seconds with number of rows exported so far and seconds elapsed.
+    :type progress: callable or None
+    :param number progress_interval: number of seconds between progress calls.
+    :rtype: dict
+    """
+    if format not in WRITERS:
+        raise ValueError('Format is not supported.')
+
+    managers = [Manager(read_servers=[server]) for server in servers]
+    started = time.monotonic()
+
+    if low is None or high is None:
+        bounds = key_bounds(managers[0], db, table, fields[0], index_name)
+        if bounds is None:
+            return {'rows': 0, 'seconds': time.monotonic() - started, 'files': []}
+        low = bounds[0] if low is None else low
+        high = bounds[1] if high is None else high
+
+    ranges = split_range(low, high, partitions or workers)
+    tasks = queue.Queue()
+    for number in range(len(ranges)):
+        tasks.put(number)
+
+    counts = [0] * len(ranges)
+    files = [os.path.join(output, '%s.%s.%04d.%s' % (db, table, number, format))
+             for number in range(len(ranges))]
+    errors = []
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            try:
+                number = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                with open(files[number], 'w', newline='') as stream:
+                    _export_partition(managers[number % len(managers)], db, table,
+                                      fields, index_name, ranges[number][0],
+                                      ranges[number][1], page_size,
+                                      WRITERS[format](stream, fields), counts,
+                                      number, stop)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+    threads = [threading.Thread(target=work, daemon=True)
+               for i in range(min(workers, len(ranges)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(progress_interval)
+            if progress is not None and thread.is_alive():
+                progress(sum(counts), time.monotonic() - started)
+
+    if errors:
+        raise errors[0]
+
+    return {'rows': sum(counts), 'seconds': time.monotonic() - started, 'files': files}
+
+
+def main(argv=None):
+    """Entry point of ``pyhs-export`` console script."""
+    parser = argparse.ArgumentParser(
+        description='Export a table from HandlerSocket in parallel.')
+    parser.add_argument('db', help='database name')
+    parser.add_argument('table', help='table name')
+    parser.add_argument('fields', help='comma separated fields, integer key first')
+    parser.add_argument('-s', '--server', action='append', dest='servers',
+                        help='read server as host:port or unix:path, may be repeated')
+    parser.add_argument('-o', '--output', default='.', help='output directory')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='tsv')
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('-p', '--partitions', type=int)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--index', dest='index_name')
+    parser.add_argument('--low', type=int, help='lowest key to export')
+    parser.add_argument('--high', type=int, help='highest key to export')
+    args = parser.parse_args(argv)
+
+    def report(rows, elapsed):
+        sys.stderr.write('%d rows, %.0f rows/s\n' % (rows, rows / elapsed))
+
+    servers = [parse_address(server) for server in args.servers or ['localhost:9998']]
+    result = export_table(servers, args.db, args.table, args.fields.split(','),
+                          args.output, args.format, args.partitions, args.workers,
+                          args.page_size, args.index_name, args.low, args.high,
+                          progress=report)
+    sys.stderr.write('Exported %d rows in %.1f s (%.0f rows/s) into %d files\n' % (
+        result['rows'], result['seconds'],
+        result['rows'] / max(result['seconds'], 1e-9), len(result['files'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Hedged read requests policy."""
+import threading
+from collections import deque
+
+
+class HedgePolicy(object):
+    """Defines when a read request should be hedged, i.e. sent to another
+    replica while the first one is still being waited for.
+
+    Keeps a sliding window of observed read latencies and hedges requests
+    that take longer than the given percentile of them. Delay is kept within
+    :attr:`~.min_delay` and :attr:`~.max_delay` bounds, the latter is used until
+    enough latencies are observed.
+
+    A single policy may be shared between threads and sockets.
+    """
+
+    PERCENTILE = 95
+    MIN_DELAY = 0.002
+    MAX_DELAY = 0.5
+    SAMPLES = 1000
+    MIN_SAMPLES = 50
+
+    def __init__(self, percentile=None, min_delay=None, max_delay=None, samples=None):
+        """
+        :param percentile: latency percentile after which a request is hedged,
+            default is defined in :const:`~.PERCENTILE`.
+        :type percentile: number or None
+        :param min_delay: lower bound of hedging delay in seconds, default is
+            defined in :const:`~.MIN_DELAY`.
+        :type min_delay: number or None
+        :param max_delay: upper bound of hedging delay in seconds, default is
+            defined in :const:`~.MAX_DELAY`.
+        :type max_delay: number or None
+        :param samples: number of latest latencies to compute the percentile of,
+            default is defined in :const:`~.SAMPLES`.
+        :type samples: integer or None
+        """
+        self.percentile = percentile or self.PERCENTILE
+        self.min_delay = min_delay or self.MIN_DELAY
+        self.max_delay = max_delay or self.MAX_DELAY
+        self.latencies = deque(maxlen=samples or self.SAMPLES)
+        self.current_delay = self.max_delay
+        self.updates = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency):
+        """Adds an observed read latency. Delay is recomputed every tenth of
+        the window to keep recording cheap.
+
+        :param number latency: request latency in seconds.
+        """
+        with self.lock:
+            self.latencies.append(latency)
+            self.updates += 1
+            if self.updates < self.latencies.maxlen // 10 \
+                    or len(self.latencies) < self.MIN_SAMPLES:
+                return
+            self.updates = 0
+            latencies = sorted(self.latencies)
+
+        position = min(int(len(latencies) * self.percentile / 100.0), len(latencies) - 1)
+        self.current_delay = min(max(latencies[position], self.min_delay), self.max_delay)
+
+    def delay(self):
+        """Returns number of seconds after which a request should be hedged.
+
+        :rtype: number
+        """
+        return self.current_delay
@@ -0,0 +1,204 @@
+"""Profiling hooks around phases of HandlerSocket requests."""
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+
+PHASES = ('call', 'call_many', 'open_index', 'connect', 'send', 'receive', 'parse')
+
+
+class Hook(object):
+    """Base class of profiling hooks. Any object with the same methods may be
+    used as a hook.
+
+    Phases of a request are nested: the outermost one (``call``,
+    ``call_many`` or ``open_index``) is the operation, ``connect``, ``send``,
+    ``receive`` and ``parse`` happen within it. All phases of an operation
+    share a ``context`` dict that holds what is known about it: ``operation``
+    (name of the outermost phase), ``index`` (``(db, table, fields,
+    index_name)`` tuple), ``op`` (request operation), ``address`` (server
+    address), ``rows`` (number of rows in responses) and ``timings`` (seconds
+    spent in each finished inner phase).
+
+    Hooks are called synchronously in the thread that performs the request,
+    so they must be fast and must not raise.
+    """
+
+    def before(self, phase, context):
+        """Called when a phase starts.
+
+        :param string phase: phase name, one of :const:`~.PHASES`.
+        :param dict context: operation context.
+        """
+        pass
+
+    def after(self, phase, context, elapsed, error):
+        """Called when a phase ends.
+
+        :param string phase: phase name, one of :const:`~.PHASES`.
+        :param dict context: operation context.
+        :param number elapsed: seconds spent in the phase.
+        :param error: exception the phase failed with, if any.
+        :type error: :exc:`Exception` or None
+        """
+        pass
+
+
+class Hooks(object):
+    """Set of hooks shared by all threads of a socket, see
+    :class:`~.sockets.HandlerSocket`. Hooks may be added and removed at any
+    time. An empty set evaluates to ``False``, requests only check that and
+    skip all the profiling then.
+    """
+
+    def __init__(self, *hooks):
+        """
+        :param hooks: initial hooks, see :class:`~.Hook`.
+        """
+        self.hooks = list(hooks)
+        self.local = threading.local()
+
+    def __bool__(self):
+        return bool(self.hooks)
+
+    def add(self, hook):
+        """Registers a hook.
+
+        :param hook: hook to call, see :class:`~.Hook`.
+        """
+        self.hooks = self.hooks + [hook]
+
+    def remove(self, hook):
+        """Unregisters a hook.
+
+        :param hook: previously added hook.
+        """
+        self.hooks = [registered for registered in self.hooks if registered is not hook]
+
+    def current(self):
+        """Returns context of the operation performed by the calling thread or
+        ``None`` if there's none.
+
+        :rtype: dict or None
+        """
+        return getattr(self.local, 'context', None)
+
+    def annotate(self, **info):
+        """Adds ``info`` to the context of the current operation. Values that
+        are set already are kept.
+        """
+        context = self.current()
+        if context is not None:
+            for name, value in info.items():
+                context.setdefault(name, value)
+
+    def count(self, name, value):
+        """Adds ``value`` to a counter in the context of the current operation.
+
+        :param string name: counter name.
+        :param number value: number to add.
+        """
+        context = self.current()
+        if context is not None:
+            context[name] = context.get(name, 0) + value
+
+    def phase(self, name):
+        """Returns a context manager that runs hooks around a phase. A phase
+        entered outside of any operation starts a new one.
+
+        :param string name: phase name, one of :const:`~.PHASES`.
+        """
+        return _Phase(self, name)
+
+
+class _Phase(object):
+    """Phase context manager, see :meth:`~.Hooks.phase`.
+    Private class.
+    """
+
+    def __init__(self, hooks, name):
+        self.hooks = hooks
+        self.name = name
+
+    def __enter__(self):
+        self.context = self.hooks.current()
+        self.outermost = self.context is None
+        if self.outermost:
+            self.context = {'operation': self.name, 'timings': {}}
+            self.hooks.local.context = self.context
+
+        self.registered = self.hooks.hooks
+        for hook in self.registered:
+            hook.before(self.name, self.context)
+        self.started = time.monotonic()
+
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.monotonic() - self.started
+        if self.outermost:
+            self.hooks.local.context = None
+        else:
+            timings = self.context['timings']
+            timings[self.name] = timings.get(self.name, 0) + elapsed
+
+        for hook in self.registered:
+            hook.after(self.name, self.context, elapsed, exc_value)
+
+
+def hooked(phase):
+    """This decorator runs :attr:`hooks` of the instance around the method
+    as ``phase``. Without registered hooks the method is called directly.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not self.hooks:
+                return func(self, *args, **kwargs)
+            with self.hooks.phase(phase):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SlowLog(Hook):
+    """Hook that logs operations that took :attr:`~.threshold` seconds or
+    longer, along with their index, operation, row count and time spent in
+    every phase. Only a :attr:`~.sample_rate` share of slow operations is
+    logged to keep the log volume down during incidents.
+    """
+
+    THRESHOLD = 0.1
+    SAMPLE_RATE = 1.0
+
+    def __init__(self, threshold=None, sample_rate=None, logger=None):
+        """
+        :param threshold: number of seconds that makes an operation slow,
+            default is defined in :const:`~.THRESHOLD`.
+        :type threshold: number or None
+        :param sample_rate: share of slow operations to log between 0 and 1,
+            default is defined in :const:`~.SAMPLE_RATE`.
+        :type sample_rate: number or None
+        :param logger: logger to write to, default is the logger of this module.
+        :type logger: :class:`logging.Logger` or None
+        """
+        self.threshold = threshold if threshold is not None else self.THRESHOLD
+        self.sample_rate = sample_rate if sample_rate is not None else self.SAMPLE_RATE
+        self.logger = logger or logging.getLogger(__name__)
+
+    def after(self, phase, context, elapsed, error):
+        if context['operation'] != phase or elapsed < self.threshold:
+            return
+        if random.random() >= self.sample_rate:
+            return
+
+        db, table, fields, index_name = context.get('index') or (None, None, None, None)
+        timings = ' '.join('%s=%.1fms' % (name, seconds * 1000)
+                           for name, seconds in sorted(context['timings'].items()))
+        self.logger.warning(
+            'Slow %s: %.1fms db=%s table=%s index=%s fields=%s op=%s rows=%s '
+            'address=%s phases: %s%s', phase, elapsed * 1000, db, table, index_name,
+            fields, context.get('op'), context.get('rows'), context.get('address'),
+            timings, error and ' error: %s' % error or '')
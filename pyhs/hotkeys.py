@@ -0,0 +1,144 @@
+"""Detection of frequently looked up keys with a bounded memory sketch."""
+import random
+import threading
+import time
+
+
+class HotKeyTracker(object):
+    """Heavy hitters sketch of look up keys.
+
+    Key frequencies are estimated with a count-min sketch of :attr:`~.depth`
+    rows of :attr:`~.width` counters, estimates may only be too high and by
+    no more than a small fraction of the total count. The :attr:`~.top` keys
+    with highest estimates are kept aside to be listed with :meth:`~.top_keys`.
+    All counters are halved every :attr:`~.decay_interval` seconds, so keys
+    that cooled down drop off the list.
+
+    If :attr:`~.threshold` is set, values of keys whose estimate reaches it are
+    cached locally for :attr:`~.ttl` seconds, see :meth:`~.get` and
+    :meth:`~.set`. Cached values aren't invalidated by writes, so they may be
+    that much stale.
+    """
+
+    WIDTH = 2048
+    DEPTH = 4
+    TOP = 100
+    TTL = 1
+    DECAY_INTERVAL = 60
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, width=None, depth=None, top=None, threshold=None, ttl=None,
+                 decay_interval=None):
+        """
+        :param width: number of counters per row, default is defined in
+            :const:`~.WIDTH`.
+        :type width: integer or None
+        :param depth: number of rows, default is defined in :const:`~.DEPTH`.
+        :type depth: integer or None
+        :param top: number of hottest keys to keep, default is defined in
+            :const:`~.TOP`.
+        :type top: integer or None
+        :param threshold: optional estimated count since the last decay that
+            makes values of a key cached locally.
+        :type threshold: integer or None
+        :param ttl: number of seconds values of hot keys are cached for,
+            default is defined in :const:`~.TTL`.
+        :type ttl: number or None
+        :param decay_interval: number of seconds between halving all counters,
+            default is defined in :const:`~.DECAY_INTERVAL`.
+        :type decay_interval: number or None
+        """
+        self.width = width or self.WIDTH
+        self.depth = depth or self.DEPTH
+        self.top = top or self.TOP
+        self.threshold = threshold
+        self.ttl = ttl or self.TTL
+        self.decay_interval = decay_interval or self.DECAY_INTERVAL
+
+        # Row hash functions of a universal family, (a * h + b) mod p
+        self.seeds = [(random.randrange(1, self.PRIME), random.randrange(self.PRIME))
+                      for i in range(self.depth)]
+        self.counters = [[0] * self.width for i in range(self.depth)]
+        self.heavy = {}
+        self.cache = {}
+        self.next_decay = time.monotonic() + self.decay_interval
+        self.lock = threading.Lock()
+
+    def record(self, key):
+        """Counts a look up of ``key`` and returns its estimated count.
+
+        :param key: hashable key.
+        :rtype: integer
+        """
+        with self.lock:
+            if time.monotonic() >= self.next_decay:
+                self._decay()
+
+            estimate = None
+            digest = hash(key)
+            for (factor, offset), row in zip(self.seeds, self.counters):
+                column = (factor * digest + offset) % self.PRIME % self.width
+                row[column] += 1
+                if estimate is None or row[column] < estimate:
+                    estimate = row[column]
+
+            if key in self.heavy or len(self.heavy) < self.top:
+                self.heavy[key] = estimate
+            else:
+                coldest = min(self.heavy, key=self.heavy.get)
+                if self.heavy[coldest] < estimate:
+                    del self.heavy[coldest]
+                    self.heavy[key] = estimate
+
+        return estimate
+
+    def _decay(self):
+        """Halves all counters and drops expired cached values.
+        Private method.
+        """
+        for row in self.counters:
+            row[:] = [count >> 1 for count in row]
+        self.heavy = dict((key, count >> 1) for key, count in self.heavy.items() if count > 1)
+
+        now = time.monotonic()
+        self.cache = dict((key, item) for key, item in self.cache.items() if item[0] > now)
+        self.next_decay = now + self.decay_interval
+
+    def top_keys(self, count=None):
+        """Returns the hottest keys with their estimated counts since the last
+        decay, hottest first.
+
+        :param count: max number of keys to return, all tracked ones by default.
+        :type count: integer or None
+        :rtype: list of tuples
+        """
+        with self.lock:
+            items = sorted(self.heavy.items(), key=lambda item: item[1], reverse=True)
+        return items[:count]
+
+    def get(self, key, variant=None):
+        """Returns a locally cached value of a hot ``key`` or ``None``.
+
+        :param key: hashable key.
+        :param variant: optional hashable that tells apart several values
+            cached for the same key, e.g. sets of fields looked up.
+        """
+        item = self.cache.get((key, variant))
+        if item is None or item[0] < time.monotonic():
+            return None
+        return item[1]
+
+    def set(self, key, value, estimate, variant=None):
+        """Caches ``value`` of ``key`` if its ``estimate`` reaches
+        :attr:`~.threshold`.
+
+        :param key: hashable key, same as given to :meth:`~.record`.
+        :param value: value to cache.
+        :param integer estimate: estimated count returned by :meth:`~.record`.
+        :param variant: see :meth:`~.get`.
+        """
+        if self.threshold is not None and estimate >= self.threshold:
+            with self.lock:
+                # Only keys on the top list are cached to keep memory bounded
+                if key in self.heavy:
+                    self.cache[(key, variant)] = (time.monotonic() + self.ttl, value)
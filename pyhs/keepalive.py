@@ -0,0 +1,92 @@
+"""Background pinging of idle connections."""
+import threading
+import weakref
+
+from .utils import AfterFork
+
+
+class IdlePinger(object):
+    """Keeps idle connections alive from a background thread.
+
+    Servers close connections that stay idle for too long, which makes the
+    next request on them fail and retry. Every :attr:`~.interval` seconds the
+    pinger pings connections that haven't been used for that long, see
+    :meth:`~.sockets.Connection.ping`, so they don't reach the server idle
+    timeout, and replaces the ones that were closed anyway off the request
+    path. The interval should be well below the server idle timeout.
+
+    Connections are added by sockets the pinger is given to, see
+    :class:`~.sockets.HandlerSocket`. They are tracked with weak references,
+    so connections of finished threads are dropped. The pinging thread is
+    started again in forked child processes.
+    """
+
+    INTERVAL = 30
+
+    def __init__(self, interval=None):
+        """
+        :param interval: number of seconds between pings of an idle
+            connection, default is defined in :const:`~.INTERVAL`.
+        :type interval: number or None
+        """
+        self.interval = interval or self.INTERVAL
+        self.connections = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        _pingers.add(self)
+
+    def add(self, conn):
+        """Starts keeping a connection alive, the pinging thread is started
+        with the first one.
+
+        :param conn: connection to ping.
+        :type conn: :class:`~.sockets.Connection`
+        """
+        with self.lock:
+            self.connections.add(conn)
+            self._start()
+
+    def _start(self):
+        """Starts the pinging thread unless it's running or stopped.
+        Private method.
+        """
+        if self.thread is None and not self.stopped.is_set():
+            self.thread = threading.Thread(target=self._run, name='pyhs-pinger')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _restart_in_child(self):
+        """Replaces the lock and the thread that a forked child inherits
+        but doesn't run.
+        Private method.
+        """
+        self.lock = threading.Lock()
+        stopped, self.stopped = self.stopped.is_set(), threading.Event()
+        if stopped:
+            self.stopped.set()
+        self.thread = None
+        if len(self.connections):
+            self._start()
+
+    def _run(self):
+        """Pings idle connections until stopped.
+        Private method.
+        """
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                connections = list(self.connections)
+            for conn in connections:
+                conn.ping(self.interval)
+
+    def stop(self):
+        """Stops pinging, connections are left as they are."""
+        self.stopped.set()
+        with self.lock:
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+# Pingers to restart in child processes
+_pingers = AfterFork('_restart_in_child')
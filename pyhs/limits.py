@@ -0,0 +1,180 @@
+"""Adaptive per-server concurrency limiting."""
+import threading
+import time
+
+from .exceptions import ConnectionError, ServerOverloadedError
+
+
+class AdaptiveLimiter(object):
+    """Concurrency limit of a single server that adapts to its latency.
+
+    The limit grows additively while request latency stays within
+    :attr:`~.tolerance` times the long-term average one and is cut
+    multiplicatively by :attr:`~.backoff` once latency grows beyond that or
+    requests fail with connection errors (AIMD). Requests over the limit wait
+    up to :attr:`~.queue_timeout` seconds for a free slot and are rejected
+    with :exc:`~.exceptions.ServerOverloadedError` after that.
+
+    Limiter is thread-safe and is meant to be shared by all threads talking
+    to the server.
+    """
+
+    INITIAL_LIMIT = 20
+    MIN_LIMIT = 1
+    MAX_LIMIT = 1000
+    BACKOFF = 0.9
+    TOLERANCE = 2.0
+    QUEUE_TIMEOUT = 0
+    SMOOTHING = 0.01
+
+    def __init__(self, initial_limit=None, min_limit=None, max_limit=None,
+                 backoff=None, tolerance=None, queue_timeout=None):
+        """
+        :param initial_limit: starting concurrency limit, default is defined in
+            :const:`~.INITIAL_LIMIT`.
+        :type initial_limit: integer or None
+        :param min_limit: lowest allowed limit, default is defined in
+            :const:`~.MIN_LIMIT`.
+        :type min_limit: integer or None
+        :param max_limit: highest allowed limit, default is defined in
+            :const:`~.MAX_LIMIT`.
+        :type max_limit: integer or None
+        :param backoff: factor the limit is multiplied by on overload, default
+            is defined in :const:`~.BACKOFF`.
+        :type backoff: number or None
+        :param tolerance: ratio of latency to the long-term average one that is
+            considered an overload, default is defined in :const:`~.TOLERANCE`.
+        :type tolerance: number or None
+        :param queue_timeout: number of seconds a request may wait for a free
+            slot, default is defined in :const:`~.QUEUE_TIMEOUT`.
+        :type queue_timeout: number or None
+        """
+        self.min_limit = min_limit or self.MIN_LIMIT
+        self.max_limit = max_limit or self.MAX_LIMIT
+        self.limit = float(initial_limit or self.INITIAL_LIMIT)
+        self.backoff = backoff or self.BACKOFF
+        self.tolerance = tolerance or self.TOLERANCE
+        self.queue_timeout = queue_timeout if queue_timeout is not None else self.QUEUE_TIMEOUT
+
+        self.inflight = 0
+        self.average_latency = None
+        self.last_backoff = 0
+        self.condition = threading.Condition()
+
+    def saturated(self):
+        """Checks if no more requests can be sent to the server right now.
+
+        :rtype: bool
+        """
+        return self.inflight >= int(self.limit)
+
+    def acquire(self, deadline=None):
+        """Takes a request slot, waiting for one if needed.
+        Raises :exc:`~.exceptions.ServerOverloadedError` if no slot is freed
+        within :attr:`~.queue_timeout` or until ``deadline``.
+
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            to stop waiting at.
+        :type deadline: number or None
+        :rtype: number
+        """
+        timeout_at = time.monotonic() + self.queue_timeout
+        if deadline is not None:
+            timeout_at = min(timeout_at, deadline)
+
+        with self.condition:
+            while self.inflight >= int(self.limit):
+                remaining = timeout_at - time.monotonic()
+                if remaining <= 0:
+                    raise ServerOverloadedError('Server concurrency limit of %d reached'
+                                                % int(self.limit))
+                self.condition.wait(remaining)
+            self.inflight += 1
+
+        return time.monotonic()
+
+    def release(self, started, dropped=False):
+        """Frees a request slot and adjusts the limit.
+
+        :param number started: value returned by :meth:`~.acquire`.
+        :param bool dropped: ``True`` if the request failed because of
+            a connection problem.
+        """
+        now = time.monotonic()
+        latency = now - started
+        with self.condition:
+            self.inflight -= 1
+            if self.average_latency is None:
+                self.average_latency = latency
+
+            overloaded = dropped or latency > self.average_latency * self.tolerance
+            if not dropped:
+                # Slowly moving average lets the baseline follow lasting
+                # changes of the workload while short spikes stand out
+                self.average_latency += (latency - self.average_latency) * self.SMOOTHING
+
+            if overloaded:
+                # Back off at most once per request round trip, requests that
+                # were in flight at that moment saw the same overload
+                if started >= self.last_backoff:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.last_backoff = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self.condition.notify()
+
+    def track(self, deadline=None):
+        """Returns a context manager that holds a request slot while the
+        request is performed.
+
+        :param deadline: see :meth:`~.acquire`.
+        :type deadline: number or None
+        """
+        return _Slot(self, deadline)
+
+
+class _Slot(object):
+    """Request slot context manager, see :meth:`~.AdaptiveLimiter.track`.
+    Private class.
+    """
+
+    def __init__(self, limiter, deadline):
+        self.limiter = limiter
+        self.deadline = deadline
+
+    def __enter__(self):
+        self.started = self.limiter.acquire(self.deadline)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        dropped = exc_type is not None and issubclass(exc_type, ConnectionError)
+        self.limiter.release(self.started, dropped)
+
+
+class ConcurrencyLimits(object):
+    """Set of :class:`~.AdaptiveLimiter` instances, one per server address.
+    Limiters are created on first use with options given to the constructor.
+
+    Pass the same instance to all sockets that talk to the same servers.
+    """
+
+    def __init__(self, **options):
+        """
+        :param options: keyword arguments of :class:`~.AdaptiveLimiter`.
+        """
+        self.options = options
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, address):
+        """Returns limiter of the server with given ``address``.
+
+        :param address: server address, see :attr:`~.sockets.Connection.address`.
+        :rtype: :class:`~.AdaptiveLimiter`
+        """
+        limiter = self.limiters.get(address)
+        if limiter is None:
+            with self.lock:
+                limiter = self.limiters.setdefault(address, AdaptiveLimiter(**self.options))
+        return limiter
@@ -0,0 +1,348 @@
+"""Parallel bulk loading of TSV or CSV files into tables."""
+import argparse
+import csv
+import logging
+import queue
+import re
+import sys
+import threading
+import time
+
+from .exceptions import ConnectionError, OperationalError
+from .export import TSV_ESCAPES
+from .sockets import WriteSocket
+from .utils import parse_address
+
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('tsv', 'csv')
+TSV_UNESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+TSV_ESCAPE = re.compile(r'\\(.)')
+
+
+def _unescape(value):
+    """Reverses escaping of :mod:`~.export` TSV files, ``\\N`` is ``NULL``.
+    Private function.
+    """
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    return TSV_ESCAPE.sub(lambda match: TSV_UNESCAPES.get(match.group(1), match.group(1)),
+                          value)
+
+
+def read_rows(stream, format='tsv', header=None):
+    """Parses rows of an input file.
+
+    Returns a tuple of header column names (``None`` if the file has no
+    header) and a generator of rows as lists of strings.
+
+    :param stream: file object opened in text mode.
+    :param string format: file format, one of :const:`~.FORMATS`. TSV files
+        use MySQL ``LOAD DATA INFILE`` escaping, see :mod:`~.export`.
+    :param header: ``True`` if the first line holds column names, default is
+        ``True`` for CSV and ``False`` for TSV.
+    :type header: bool or None
+    :rtype: tuple
+    """
+    if format == 'csv':
+        rows = csv.reader(stream)
+    elif format == 'tsv':
+        rows = ([_unescape(value) for value in line.rstrip('\r\n').split('\t')]
+                for line in stream)
+    else:
+        raise ValueError('Format is not supported.')
+
+    if header is None:
+        header = format == 'csv'
+    names = next(rows, None) if header else None
+
+    return names, rows
+
+
+def column_positions(fields, mapping=None, names=None):
+    """Returns positions of input columns to take for each of ``fields``.
+
+    :param list fields: table fields to load.
+    :param mapping: input column for every field, either a position or
+        a header name. By default the first ``len(fields)`` columns are used.
+    :type mapping: list or None
+    :param names: header column names of the input.
+    :type names: list or None
+    :rtype: list of integers
+    """
+    if mapping is None:
+        return list(range(len(fields)))
+
+    if len(mapping) != len(fields):
+        raise ValueError('Mapping must define a column for every field.')
+
+    positions = []
+    for column in mapping:
+        if isinstance(column, int) or column.isdigit():
+            positions.append(int(column))
+        elif names is not None and column in names:
+            positions.append(names.index(column))
+        else:
+            raise ValueError('Unknown input column "%s"' % column)
+    return positions
+
+
+class Loader(object):
+    """Loads rows into a table with pipelined inserts over several connections.
+
+    Rows are grouped in batches of :attr:`~.batch_size` that are inserted by
+    :attr:`~.workers` threads, each with its own connection, one round trip
+    per batch. Only a few batches are queued at a time, so memory use doesn't
+    depend on the input size.
+
+    Rows rejected by the server (e.g. duplicate keys) and rows of batches that
+    failed on connection errors are written to the reject file as TSV with
+    an error message in the last column. As it's unknown which rows of a batch
+    the server applied before the connection failed, some of those may be
+    inserted anyway.
+    """
+
+    WORKERS = 4
+    BATCH_SIZE = 500
+    PROGRESS_INTERVAL = 5
+
+    def __init__(self, servers, db, table, fields, index_name=None, workers=None,
+                 batch_size=None, rate=None, reject_file=None, progress=None,
+                 progress_interval=None):
+        """
+        :param list servers: list of write server definitions, see
+            :class:`~.sockets.HandlerSocket`.
+        :param string db: database name.
+        :param string table: table name.
+        :param list fields: table fields to insert values into.
+        :param index_name: name of the index to open, default is ``PRIMARY``.
+        :type index_name: string or None
+        :param workers: number of concurrent connections, default is defined
+            in :const:`~.WORKERS`.
+        :type workers: integer or None
+        :param batch_size: number of rows pipelined in a single round trip,
+            default is defined in :const:`~.BATCH_SIZE`.
+        :type batch_size: integer or None
+        :param rate: optional max number of rows per second to load.
+        :type rate: number or None
+        :param reject_file: optional file object to write rejected rows to.
+        :param progress: optional function called every ``progress_interval``
+            seconds with numbers of loaded and rejected rows and seconds elapsed.
+        :type progress: callable or None
+        :param progress_interval: number of seconds between progress calls,
+            default is defined in :const:`~.PROGRESS_INTERVAL`.
+        :type progress_interval: number or None
+        """
+        self.socket = WriteSocket(servers)
+        self.db = db
+        self.table = table
+        self.fields = fields
+        self.index_name = index_name
+        self.workers = workers or self.WORKERS
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.rate = rate
+        self.reject_file = reject_file
+        self.progress = progress
+        self.progress_interval = progress_interval or self.PROGRESS_INTERVAL
+
+        self.loaded = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """Inserts all ``rows``.
+
+        Returns a dict with numbers of ``loaded`` and ``rejected`` rows and
+        ``seconds`` spent.
+
+        :param iterable rows: lists of values ordered as :attr:`~.fields`.
+        :rtype: dict
+        """
+        batches = queue.Queue(self.workers * 2)
+        threads = [threading.Thread(target=self._work, args=(batches,), daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        started = last_report = time.monotonic()
+        queued = 0
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) < self.batch_size:
+                    continue
+
+                queued += len(batch)
+                batches.put(batch)
+                batch = []
+
+                now = time.monotonic()
+                if self.rate:
+                    time.sleep(max(0, started + queued / self.rate - now))
+                if self.progress is not None and now - last_report >= self.progress_interval:
+                    self.progress(self.loaded, self.rejected, now - started)
+                    last_report = now
+
+            if batch:
+                batches.put(batch)
+        finally:
+            for thread in threads:
+                batches.put(None)
+            for thread in threads:
+                thread.join()
+
+        return {'loaded': self.loaded, 'rejected': self.rejected,
+                'seconds': time.monotonic() - started}
+
+    def _work(self, batches):
+        """Worker thread loop that inserts queued batches.
+        Private method.
+        """
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            self._insert(batch)
+
+    def _insert(self, batch):
+        """Inserts a batch, accounting and rejecting failed rows.
+        Private method.
+        """
+        try:
+            index_id = self.socket.get_index_id(self.db, self.table, self.fields,
+                                                self.index_name)
+            results = self.socket.insert_many(index_id, batch)
+        except (ConnectionError, OperationalError, ValueError) as e:
+            results = [e] * len(batch)
+        except Exception as e:
+            # Worker must survive anything, otherwise the input would block
+            log.exception('Batch of %d rows not inserted into %s.%s', len(batch),
+                          self.db, self.table)
+            results = ['%s: %s' % (type(e).__name__, e)] * len(batch)
+
+        rejects = [(row, result) for row, result in zip(batch, results)
+                   if result is not True]
+        with self.lock:
+            self.loaded += len(batch) - len(rejects)
+        for row, error in rejects:
+            self.reject(row, error)
+
+    def reject(self, row, error):
+        """Accounts a row as rejected and writes it to the reject file
+        (or logs it, if there's no reject file).
+
+        :param list row: row values.
+        :param error: reason of the rejection.
+        """
+        with self.lock:
+            self.rejected += 1
+            self._write_reject(row, error)
+
+    def _write_reject(self, row, error):
+        """Writes a rejected row to the reject file.
+        Private method.
+        """
+        if self.reject_file is None:
+            log.warning('Row %r rejected: %s', row, error)
+            return
+
+        values = ['\\N' if value is None else value.translate(TSV_ESCAPES)
+                  for value in row]
+        values.append(str(error).translate(TSV_ESCAPES))
+        self.reject_file.write('\t'.join(values) + '\n')
+
+
+def load_file(servers, db, table, fields, path, format='tsv', header=None,
+              mapping=None, reject_path=None, **options):
+    """Loads a TSV or CSV file into a table, see :class:`~.Loader`.
+
+    Returns a dict with numbers of ``loaded`` and ``rejected`` rows and
+    ``seconds`` spent.
+
+    :param list servers: list of write server definitions.
+    :param string db: database name.
+    :param string table: table name.
+    :param list fields: table fields to insert values into.
+    :param string path: path of the input file.
+    :param string format: input format, see :func:`~.read_rows`.
+    :param header: see :func:`~.read_rows`.
+    :type header: bool or None
+    :param mapping: input column of every field, see :func:`~.column_positions`.
+    :type mapping: list or None
+    :param reject_path: optional path of the file to write rejected rows to.
+    :type reject_path: string or None
+    :param options: other keyword arguments of :class:`~.Loader`.
+    :rtype: dict
+    """
+    reject_file = open(reject_path, 'w') if reject_path else None
+    try:
+        with open(path, newline='') as stream:
+            names, rows = read_rows(stream, format, header)
+            positions = column_positions(fields, mapping, names)
+            loader = Loader(servers, db, table, fields, reject_file=reject_file, **options)
+            return loader.load(_map_rows(loader, rows, positions))
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+
+def _map_rows(loader, rows, positions):
+    """Picks values of table fields out of input rows, rows that lack some
+    of the columns are rejected.
+    Private function.
+    """
+    width = max(positions) + 1
+    for row in rows:
+        if len(row) < width:
+            loader.reject(row, 'Row has %d columns, %d expected' % (len(row), width))
+            continue
+        yield [row[position] for position in positions]
+
+
+def main(argv=None):
+    """Entry point of ``pyhs-load`` console script."""
+    parser = argparse.ArgumentParser(
+        description='Load a TSV or CSV file into a table through HandlerSocket.')
+    parser.add_argument('db', help='database name')
+    parser.add_argument('table', help='table name')
+    parser.add_argument('fields', help='comma separated fields to insert')
+    parser.add_argument('path', help='input file')
+    parser.add_argument('-s', '--server', action='append', dest='servers',
+                        help='write server as host:port or unix:path, may be repeated')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='tsv')
+    parser.add_argument('--header', action='store_true', default=None,
+                        help='first line holds column names (default for CSV)')
+    parser.add_argument('--no-header', action='store_false', dest='header')
+    parser.add_argument('-m', '--mapping',
+                        help='comma separated input column (position or name) of every field')
+    parser.add_argument('-w', '--workers', type=int)
+    parser.add_argument('-b', '--batch-size', type=int)
+    parser.add_argument('-r', '--rate', type=float, help='max rows per second')
+    parser.add_argument('--index', dest='index_name')
+    parser.add_argument('--reject', dest='reject_path', help='file for rejected rows')
+    args = parser.parse_args(argv)
+
+    def report(loaded, rejected, elapsed):
+        sys.stderr.write('%d rows loaded, %d rejected, %.0f rows/s\n'
+                         % (loaded, rejected, loaded / elapsed))
+
+    servers = [parse_address(server) for server in args.servers or ['localhost:9999']]
+    result = load_file(servers, args.db, args.table, args.fields.split(','), args.path,
+                       args.format, args.header,
+                       args.mapping.split(',') if args.mapping else None,
+                       args.reject_path, index_name=args.index_name,
+                       workers=args.workers, batch_size=args.batch_size,
+                       rate=args.rate, progress=report)
+    sys.stderr.write('Loaded %d rows in %.1f s (%.0f rows/s), %d rejected\n' % (
+        result['loaded'], result['seconds'],
+        result['loaded'] / max(result['seconds'], 1e-9), result['rejected']))
+    if result['rejected']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
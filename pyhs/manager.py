@@ -1,5 +1,15 @@
 from .sockets import *
-from .utils import retry_on_failure
+from .batch import Batch
+from .batching import GetBatcher
+from .bloom import BloomFilter
+from .counters import CounterBuffer
+from .hooks import Hooks, SlowLog
+from .hotkeys import HotKeyTracker
+from .keepalive import IdlePinger
+from .multiplex import MultiplexedPool, MultiplexedReadSocket, MultiplexedWriteSocket
+from .shmcache import SharedCache
+from .utils import MIN_KEY, retry_on_failure
+from .writequeue import WriteQueue
 
 
 class Manager(object):
@@ -11,7 +21,12 @@ class Manager(object):
     can be used.
     """
 
-    def __init__(self, read_servers=None, write_servers=None, debug=False):
+    CHUNK_SIZE = 1000
+
+    def __init__(self, read_servers=None, write_servers=None, debug=False,
+                 hedge_policy=None, connect_stagger=None, concurrency_limits=None,
+                 multiplex=False, recorder=None, hooks=None, keepalive=None,
+                 ping_interval=None):
         """Constructor initializes both read and write sockets.
 
         :param read_servers: list of tuples that define HandlerSocket read
@@ -21,13 +36,257 @@ class Manager(object):
             instances. Format is the same as in ``read_servers``.
         :type write_servers: list of tuples or None
         :param bool debug: enable debug mode by passing ``True``.
+        :param hedge_policy: optional policy of hedging reads across read
+            servers, see :class:`~.sockets.ReadSocket`.
+        :type hedge_policy: :class:`~.hedging.HedgePolicy` or None
+        :param connect_stagger: if set, connections to several servers are
+            raced on failover, see :class:`~.sockets.HandlerSocket`.
+        :type connect_stagger: number or None
+        :param concurrency_limits: optional adaptive per-server limits of
+            concurrent requests, see :class:`~.sockets.HandlerSocket`.
+        :type concurrency_limits: :class:`~.limits.ConcurrencyLimits` or None
+        :param bool multiplex: if ``True``, all threads share one connection
+            per server and their requests are pipelined, see
+            :mod:`~.multiplex`. Options above except ``debug`` don't apply
+            in this mode.
+        :param recorder: optional recorder that captures a sample of requests
+            to replay them later, see :mod:`~.capture`. Not supported in
+            multiplexed mode.
+        :type recorder: :class:`~.capture.CaptureRecorder` or None
+        :param hooks: profiling hooks of both sockets, a new empty set is
+            created by default, see :mod:`~.hooks`. Not supported in
+            multiplexed mode.
+        :type hooks: :class:`~.hooks.Hooks` or None
+        :param keepalive: optional TCP keepalive settings of connections, see
+            :class:`~.sockets.HandlerSocket`. Not supported in multiplexed mode.
+        :type keepalive: tuple or None
+        :param ping_interval: if set, connections idle for that many seconds
+            are pinged from a background thread to keep them alive, see
+            :class:`~.keepalive.IdlePinger`. Should be well below the server
+            idle timeout. Not supported in multiplexed mode.
+        :type ping_interval: number or None
         """
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.pinger = ping_interval and IdlePinger(ping_interval) or None
         read_servers = read_servers or [('inet', 'localhost', 9998)]
         write_servers = write_servers or [('inet', 'localhost', 9999)]
-        self.read_socket = ReadSocket(read_servers, debug)
-        self.write_socket = WriteSocket(write_servers, debug)
+        if multiplex:
+            self.read_socket = MultiplexedReadSocket(MultiplexedPool(read_servers, debug))
+            self.write_socket = MultiplexedWriteSocket(MultiplexedPool(write_servers, debug))
+        else:
+            self.read_socket = ReadSocket(read_servers, debug, connect_stagger,
+                                          concurrency_limits, recorder, self.hooks,
+                                          keepalive, self.pinger, hedge_policy)
+            self.write_socket = WriteSocket(write_servers, debug, connect_stagger,
+                                            concurrency_limits, recorder, self.hooks,
+                                            keepalive, self.pinger)
+        self.batcher = None
+        self.shared_cache = None
+        self.bloom_filters = {}
+        self.hot_key_tracker = None
+        self.write_queue = None
+        self.counter_buffer = None
+
+    def warm(self, read_indexes=(), write_indexes=(), after_fork=True):
+        """Opens connections and indexes in advance, both in current process
+        and (unless ``after_fork`` is disabled) in every forked child.
+        See :meth:`~.sockets.HandlerSocket.warm` for details.
+
+        :param iterable read_indexes: list of ``(db, table, fields[, index_name])``
+            tuples to open on read servers.
+        :param iterable write_indexes: list of ``(db, table, fields[, index_name])``
+            tuples to open on write servers.
+        :param bool after_fork: if ``True`` warm up child processes after fork.
+        """
+        self.read_socket.warm(read_indexes, after_fork)
+        self.write_socket.warm(write_indexes, after_fork)
+
+    def batch(self, deadline=None):
+        """Returns a context manager that collects operations and performs them
+        in a single round trip per server when the ``with`` block ends, see
+        :class:`~.batch.Batch` for details::
+
+            with manager.batch() as batch:
+                user = batch.get('db', 'users', ['id', 'name'], '1')
+                batch.incr('db', 'stats', '=', ['id', 'views'], ['1'], ['0', '1'])
+            print(user.result())
+
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the batch must complete by.
+        :type deadline: number or None
+        :rtype: :class:`~.batch.Batch`
+        """
+        return Batch(self, deadline)
+
+    def enable_batching(self, window=None, max_keys=None):
+        """Enables batching of concurrent :meth:`~.get` calls, see
+        :class:`~.batching.GetBatcher` for details.
+
+        :param window: number of seconds to wait for other keys.
+        :type window: number or None
+        :param max_keys: max number of keys per batch.
+        :type max_keys: integer or None
+        """
+        self.batcher = GetBatcher(self, window, max_keys)
+
+    def enable_shared_cache(self, path, slots=None, slot_size=None, ttl=None):
+        """Enables caching of :meth:`~.get` results in memory shared between
+        processes, see :class:`~.shmcache.SharedCache` for details.
+
+        :param string path: path of the cache file.
+        :param slots: number of cache slots.
+        :type slots: integer or None
+        :param slot_size: size of a slot in bytes.
+        :type slot_size: integer or None
+        :param ttl: number of seconds results are cached for.
+        :type ttl: number or None
+        """
+        self.shared_cache = SharedCache(path, slots, slot_size, ttl)
+
+    def enable_bloom_filter(self, db, table, key_field, path, capacity=None,
+                            error_rate=None, index_name=None, build=False,
+                            start=MIN_KEY):
+        """Enables a Bloom filter of keys of a table, see
+        :class:`~.bloom.BloomFilter` for details. :meth:`~.get` calls with
+        ``key_field`` as the look up field return an empty result without
+        a request for keys the filter rules out. Keys are added by
+        :meth:`~.insert` and :meth:`~.update` of this manager.
+
+        .. note:: Keys written by other clients are unknown to the filter
+           until it's rebuilt, so enable it only if all writes go through
+           managers that share the filter file.
+
+        :param string db: database name.
+        :param string table: table name.
+        :param string key_field: name of the key field.
+        :param string path: path of the filter file.
+        :param capacity: expected number of keys.
+        :type capacity: integer or None
+        :param error_rate: false positive rate at full capacity.
+        :type error_rate: number or None
+        :param index_name: name of the index on ``key_field`` used to build
+            the filter, default is ``PRIMARY``.
+        :type index_name: string or None
+        :param bool build: if ``True``, the filter is (re)built from a scan of
+            the table. Otherwise the filter file must have been built before,
+            :exc:`~.exceptions.OperationalError` is raised if it wasn't.
+        :param string start: lowest key to build the filter from, default
+            suits integer keys. Pass an empty string for string keys.
+        :rtype: :class:`~.bloom.BloomFilter`
+        """
+        bloom_filter = BloomFilter(path, capacity, error_rate)
+        if build:
+            bloom_filter.build(self.read_socket, db, table, key_field, index_name,
+                               start)
+        elif not bloom_filter.built:
+            bloom_filter.close()
+            raise OperationalError('Bloom filter file "%s" has not been built.' % path)
+        self.bloom_filters[(db, table)] = (key_field, bloom_filter)
+
+        return bloom_filter
+
+    def enable_slow_log(self, threshold=None, sample_rate=None, logger=None):
+        """Enables logging of slow operations, see :class:`~.hooks.SlowLog`
+        for details.
+
+        :param threshold: number of seconds that makes an operation slow.
+        :type threshold: number or None
+        :param sample_rate: share of slow operations to log.
+        :type sample_rate: number or None
+        :param logger: logger to write to.
+        :type logger: :class:`logging.Logger` or None
+        :rtype: :class:`~.hooks.SlowLog`
+        """
+        slow_log = SlowLog(threshold, sample_rate, logger)
+        self.hooks.add(slow_log)
+
+        return slow_log
+
+    def enable_hot_keys(self, width=None, depth=None, top=None, threshold=None,
+                        ttl=None, decay_interval=None):
+        """Enables tracking of keys looked up with :meth:`~.get`, see
+        :class:`~.hotkeys.HotKeyTracker` for details. If ``threshold`` is set,
+        results of keys looked up that often are cached locally for ``ttl``
+        seconds.
 
-    def get(self, db, table, fields, value):
+        :param width: number of counters per sketch row.
+        :type width: integer or None
+        :param depth: number of sketch rows.
+        :type depth: integer or None
+        :param top: number of hottest keys to keep.
+        :type top: integer or None
+        :param threshold: look up count that makes a key cached.
+        :type threshold: integer or None
+        :param ttl: number of seconds results of hot keys are cached for.
+        :type ttl: number or None
+        :param decay_interval: number of seconds after which counts are halved.
+        :type decay_interval: number or None
+        """
+        self.hot_key_tracker = HotKeyTracker(width, depth, top, threshold, ttl,
+                                             decay_interval)
+
+    def enable_write_queue(self, max_size=None, workers=None, batch_size=None,
+                           policy='block', spill_path=None):
+        """Enables asynchronous inserts with :meth:`~.insert_async`, see
+        :class:`~.writequeue.WriteQueue` for details.
+
+        :param max_size: max number of queued rows.
+        :type max_size: integer or None
+        :param workers: number of worker threads.
+        :type workers: integer or None
+        :param batch_size: max number of rows inserted in a single round trip.
+        :type batch_size: integer or None
+        :param string policy: what to do with rows when the queue is full,
+            one of :const:`~.writequeue.POLICIES`.
+        :param spill_path: path of the file to spill rows to.
+        :type spill_path: string or None
+        :rtype: :class:`~.writequeue.WriteQueue`
+        """
+        self.write_queue = WriteQueue(self, max_size, workers, batch_size, policy, spill_path)
+
+        return self.write_queue
+
+    def enable_counter_buffer(self, flush_interval=None, max_keys=None):
+        """Enables write-behind buffering of counter increments. Increments
+        and decrements made through the returned buffer are aggregated per
+        key and written in the background, see
+        :class:`~.counters.CounterBuffer` for details.
+
+        :param flush_interval: max number of seconds deltas are kept in memory.
+        :type flush_interval: number or None
+        :param max_keys: number of pending keys that triggers a flush.
+        :type max_keys: integer or None
+        :rtype: :class:`~.counters.CounterBuffer`
+        """
+        self.counter_buffer = CounterBuffer(self, flush_interval, max_keys)
+
+        return self.counter_buffer
+
+    def hot_keys(self, db, table, count=None):
+        """Returns the hottest look up keys of a table with their estimated
+        look up counts, hottest first. Hot key tracking must be enabled with
+        :meth:`~.enable_hot_keys`.
+
+        :param string db: database name.
+        :param string table: table name.
+        :param count: max number of keys to return.
+        :type count: integer or None
+        :rtype: list of tuples
+        """
+        keys = [(key[2], estimate) for key, estimate in self.hot_key_tracker.top_keys()
+                if key[:2] == (db, table)]
+        return keys[:count]
+
+    def _bloom_add(self, db, table, fields, values):
+        """Adds the key among ``values`` to the Bloom filter of the table, if
+        there's one.
+        Private method.
+        """
+        key_field, bloom_filter = self.bloom_filters.get((db, table), (None, None))
+        if bloom_filter is not None and key_field in fields:
+            bloom_filter.add(values[list(fields).index(key_field)])
+
+    def get(self, db, table, fields, value, deadline=None):
         """A wrapper over :meth:`~.find` that gets a single row with
         a single field look up.
 
@@ -42,16 +301,71 @@ class Manager(object):
         :param list fields: list of table's fields to get, ordered by inclusion
             into the index. First item must always be the look up field.
         :param string value: a look up value.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: list of tuples
         """
-        data = self.find(db, table, '=', fields, [str(value)])
+        if self.bloom_filters:
+            key_field, bloom_filter = self.bloom_filters.get((db, table), (None, None))
+            if key_field == fields[0] and str(value) not in bloom_filter:
+                return []
+
+        if self.hot_key_tracker is not None:
+            return self._get_tracked(db, table, fields, value, deadline)
+
+        return self._get_shared(db, table, fields, value, deadline)
+
+    def _get_tracked(self, db, table, fields, value, deadline=None):
+        """Counts the look up key of :meth:`~.get` and serves hot keys from
+        the local cache.
+        Private method.
+        """
+        key = (db, table, str(value))
+        estimate = self.hot_key_tracker.record(key)
+        data = self.hot_key_tracker.get(key, tuple(fields))
+        if data is not None:
+            return list(data)
+
+        data = self._get_shared(db, table, fields, value, deadline)
+        self.hot_key_tracker.set(key, data, estimate, tuple(fields))
+
+        return data
+
+    def _get_shared(self, db, table, fields, value, deadline=None):
+        """Looks up a row of :meth:`~.get` through the shared cache, if enabled.
+        Private method.
+        """
+        if self.shared_cache is None:
+            return self._get(db, table, fields, value, deadline)
+
+        key = [db, table, list(fields), str(value)]
+        data = self.shared_cache.get(key)
+        if data is not None:
+            return [tuple(pair) for pair in data]
+
+        data = self._get(db, table, fields, value, deadline)
+        self.shared_cache.set(key, data)
+
+        return data
+
+    def _get(self, db, table, fields, value, deadline=None):
+        """Performs actual look up of :meth:`~.get`.
+        Private method.
+        """
+        if self.batcher is not None:
+            return self.batcher.get(db, table, fields, value, deadline)
+
+        data = self.find(db, table, '=', fields, [str(value)], deadline=deadline)
         if data:
             data = data[0]
 
         return data
 
     @retry_on_failure
-    def find(self, db, table, operation, fields, values, index_name=None, limit=0, offset=0):
+    def find(self, db, table, operation, fields, values, index_name=None, limit=0, offset=0,
+             in_values=None, deadline=None):
         """Finds rows that meet ``values`` with comparison ``operation``
         in given ``db`` and ``table``.
 
@@ -78,18 +392,47 @@ class Manager(object):
             In case multiple rows are expected to be returned, ``limit`` must be
             set explicitly, HS wont get all found rows by default.
         :param integer offset: optional offset of rows to search for.
+        :param in_values: optional list of values to look up instead of the
+            first item of ``values`` (IN clause). ``limit`` applies to all
+            found rows.
+        :type in_values: list or None
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: list of lists of tuples
         """
-        index_id = self.read_socket.get_index_id(db, table, fields, index_name)
-        data = self.read_socket.find(index_id, operation, values, limit, offset)
+        index_id = self.read_socket.get_index_id(db, table, fields, index_name, deadline)
+        data = self.read_socket.find(index_id, operation, values, limit, offset,
+                                     in_values, deadline=deadline)
 
         if data:
             data = [list(zip(fields, row)) for row in data]
 
         return data
 
+    def find_iter(self, db, table, operation, fields, values, index_name=None, limit=0,
+                  offset=0, in_values=None, deadline=None):
+        """Same as :meth:`~.find` but yields found rows one by one as soon as
+        they are received from the server, so result sets of any size can be
+        processed without holding them in memory.
+
+        Failed requests aren't retried, as part of the rows may have been
+        consumed already. Stop iteration early by closing the generator.
+
+        :rtype: generator of lists of tuples
+        """
+        index_id = self.read_socket.get_index_id(db, table, fields, index_name, deadline)
+        rows = self.read_socket.find_iter(index_id, operation, values, limit, offset,
+                                          in_values, deadline=deadline)
+        try:
+            for row in rows:
+                yield list(zip(fields, row))
+        finally:
+            rows.close()
+
     @retry_on_failure
-    def insert(self, db, table, fields, index_name=None):
+    def insert(self, db, table, fields, index_name=None, deadline=None):
         """Inserts a single row into given ``table``.
 
         :param string db: database name.
@@ -98,17 +441,44 @@ class Manager(object):
         :type fields: list of lists
         :param index_name: name of the index to open, default is ``PRIMARY``.
         :type index_name: string or None
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: bool
         """
         keys, values = list(zip(*fields))
-        index_id = self.write_socket.get_index_id(db, table, keys, index_name)
-        data = self.write_socket.insert(index_id, values)
+        if self.bloom_filters:
+            self._bloom_add(db, table, keys, values)
+        index_id = self.write_socket.get_index_id(db, table, keys, index_name, deadline)
+        data = self.write_socket.insert(index_id, values, deadline)
 
         return data
 
+    def insert_async(self, db, table, fields, index_name=None):
+        """Queues a row to be inserted in the background and returns without
+        waiting for the server, see :meth:`~.insert`. Returns ``False`` if the
+        row was dropped as the queue is full. Write queue must be enabled with
+        :meth:`~.enable_write_queue`.
+
+        :param string db: database name.
+        :param string table: table name.
+        :param fields: list of (column, value) pairs to insert into the ``table``.
+        :type fields: list of lists
+        :param index_name: name of the index to open, default is ``PRIMARY``.
+        :type index_name: string or None
+        :rtype: bool
+        """
+        if self.bloom_filters:
+            keys, values = list(zip(*fields))
+            self._bloom_add(db, table, keys, values)
+
+        return self.write_queue.insert(db, table, fields, index_name)
+
     @retry_on_failure
     def update(self, db, table, operation, fields, values, update_values,
-               index_name=None, limit=0, offset=0, return_original=False):
+               index_name=None, limit=0, offset=0, return_original=False,
+               deadline=None):
         """Update row(s) that meet conditions defined by ``operation``, ``fields``
         ``values`` in a given ``table``.
 
@@ -133,12 +503,19 @@ class Manager(object):
         :param bool return_original: if set to ``True``, method will return a
             list of original values in affected rows. Otherwise - number of
             affected rows (this is default behaviour).
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: int or list
         """
-        index_id = self.write_socket.get_index_id(db, table, fields, index_name)
+        if self.bloom_filters:
+            self._bloom_add(db, table, fields, update_values)
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
         op = 'U' + (return_original and '?' or '')
         data = self.write_socket.find_modify(index_id, operation, values, op,
-                                             update_values, limit, offset)
+                                             update_values, limit, offset,
+                                             deadline=deadline)
 
         if data:
             data = return_original and [list(zip(fields, row)) for row in data] \
@@ -147,7 +524,7 @@ class Manager(object):
     
     @retry_on_failure
     def incr(self, db, table, operation, fields, values, step=['1'], index_name=None,
-               limit=0, offset=0, return_original=False):
+               limit=0, offset=0, return_original=False, deadline=None):
         """Increments row(s) that meet conditions defined by ``operation``, ``fields``
         ``values`` in a given ``table``.
 
@@ -172,12 +549,16 @@ class Manager(object):
         :param bool return_original: if set to ``True``, method will return a
             list of original values in affected rows. Otherwise - number of
             affected rows (this is default behaviour).
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: int or list
         """
-        index_id = self.write_socket.get_index_id(db, table, fields, index_name)
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
         op = '+' + (return_original and '?' or '')
         data = self.write_socket.find_modify(index_id, operation, values, op,
-                                             step, limit, offset)
+                                             step, limit, offset, deadline=deadline)
 
         if data:
             data = return_original and [list(zip(fields, row)) for row in data] \
@@ -186,7 +567,7 @@ class Manager(object):
 
     @retry_on_failure
     def decr(self, db, table, operation, fields, values, step=['1'], index_name=None,
-               limit=0, offset=0, return_original=False):
+               limit=0, offset=0, return_original=False, deadline=None):
         """Decrements row(s) that meet conditions defined by ``operation``, ``fields``
         ``values`` in a given ``table``.
 
@@ -211,12 +592,16 @@ class Manager(object):
         :param bool return_original: if set to ``True``, method will return a
             list of original values in affected rows. Otherwise - number of
             affected rows (this is default behaviour).
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: int or list
         """
-        index_id = self.write_socket.get_index_id(db, table, fields, index_name)
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
         op = '-' + (return_original and '?' or '')
         data = self.write_socket.find_modify(index_id, operation, values, op,
-                                             step, limit, offset)
+                                             step, limit, offset, deadline=deadline)
 
         if data:
             data = return_original and [list(zip(fields, row)) for row in data] \
@@ -225,7 +610,7 @@ class Manager(object):
 
     @retry_on_failure
     def delete(self, db, table, operation, fields, values, index_name=None,
-               limit=0, offset=0, return_original=False):
+               limit=0, offset=0, return_original=False, deadline=None):
         """Delete row(s) that meet conditions defined by ``operation``, ``fields``
         ``values`` in a given ``table``.
 
@@ -248,18 +633,174 @@ class Manager(object):
         :param bool return_original: if set to ``True``, method will return a
             list of original values in affected rows. Otherwise - number of
             affected rows (this is default behaviour).
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the operation must complete by, including retries.
+            :exc:`~.exceptions.DeadlineExceeded` is raised otherwise.
+        :type deadline: number or None
         :rtype: int or list
         """
-        index_id = self.write_socket.get_index_id(db, table, fields, index_name)
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
         op = 'D' + (return_original and '?' or '')
         data = self.write_socket.find_modify(index_id, operation, values, op,
-                                             limit=limit, offset=offset)
+                                             limit=limit, offset=offset,
+                                             deadline=deadline)
 
         if data:
             data = return_original and [list(zip(fields, row)) for row in data] \
                 or int(data[0][0])
         return data
 
+    def update_many(self, db, table, fields, keys, update_values, index_name=None,
+                    limit=1, return_original=False, per_key=False, chunk_size=None,
+                    deadline=None):
+        """Updates rows of many keys at once.
+
+        By default keys are sent in chunks of ``chunk_size`` with an IN clause,
+        so a chunk costs a single request, and all rows get the same
+        ``update_values``. The result is the total number of updated rows or
+        a list of original values of all of them. The limit of an IN clause
+        applies to all found rows rather than to each key, so that's only done
+        for the ``PRIMARY`` index, where a key matches one row at most. Keys of
+        other indexes are pipelined one request per key and their results are
+        added up, the first failed request raises its error.
+
+        If ``per_key`` is ``True`` or ``update_values`` differ per key, one
+        request per key is pipelined instead, still a single round trip per
+        chunk. The result is a dict that maps every key to its number of updated
+        rows or a list of original values, or to an
+        :exc:`~.exceptions.OperationalError` instance if its request failed.
+
+        Chunks that fail on connection errors are retried once. As modifications
+        are idempotent, chunks applied before the failure are not repeated.
+
+        :param string db: database name
+        :param string table: table name
+        :param list fields: list of table's fields to update.
+        :param iterable keys: values of the first index field to look up.
+        :param update_values: values to update, ordered the same way as items
+            in ``fields``, or a dict that maps each key to its own values.
+        :type update_values: list or dict
+        :param index_name: name of the index to open, default is ``PRIMARY``.
+        :type index_name: string or None
+        :param integer limit: max number of rows to update per key.
+        :param bool return_original: if set to ``True``, original values of
+            updated rows are returned instead of their number.
+        :param bool per_key: if set to ``True``, results are returned per key.
+        :param chunk_size: max number of keys per round trip, default is defined
+            in :const:`~.CHUNK_SIZE`.
+        :type chunk_size: integer or None
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole operation must complete by.
+        :type deadline: number or None
+        :rtype: int, list or dict
+        """
+        op = 'U' + (return_original and '?' or '')
+        if isinstance(update_values, dict):
+            per_key = True
+            if self.bloom_filters:
+                for values in update_values.values():
+                    self._bloom_add(db, table, fields, values)
+        elif self.bloom_filters:
+            self._bloom_add(db, table, fields, update_values)
+        return self._modify_many(db, table, fields, keys, op, update_values, index_name,
+                                 limit, per_key, chunk_size, deadline)
+
+    def delete_many(self, db, table, fields, keys, index_name=None, limit=1,
+                    return_original=False, per_key=False, chunk_size=None,
+                    deadline=None):
+        """Deletes rows of many keys at once, see :meth:`~.update_many` for
+        details on chunking and results.
+
+        :param string db: database name
+        :param string table: table name
+        :param list fields: list of table's fields to return original values of.
+        :param iterable keys: values of the first index field to look up.
+        :param index_name: name of the index to open, default is ``PRIMARY``.
+        :type index_name: string or None
+        :param integer limit: max number of rows to delete per key.
+        :param bool return_original: if set to ``True``, original values of
+            deleted rows are returned instead of their number.
+        :param bool per_key: if set to ``True``, results are returned per key.
+        :param chunk_size: max number of keys per round trip, default is defined
+            in :const:`~.CHUNK_SIZE`.
+        :type chunk_size: integer or None
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole operation must complete by.
+        :type deadline: number or None
+        :rtype: int, list or dict
+        """
+        op = 'D' + (return_original and '?' or '')
+        return self._modify_many(db, table, fields, keys, op, [], index_name,
+                                 limit, per_key, chunk_size, deadline)
+
+    def _modify_many(self, db, table, fields, keys, op, update_values, index_name,
+                     limit, per_key, chunk_size, deadline):
+        """Splits keys of :meth:`~.update_many` and :meth:`~.delete_many` into
+        chunks and merges their results.
+        Private method.
+        """
+        keys = list(keys)
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+
+        total = [] if op.endswith('?') else 0
+        if not per_key and (index_name or 'PRIMARY') == 'PRIMARY':
+            for chunk in chunks:
+                total += self._modify_result(fields, op, self._modify_in(
+                    db, table, fields, chunk, op, update_values, index_name, limit,
+                    deadline))
+            return total
+
+        results = {}
+        for chunk in chunks:
+            responses = self._modify_keys(db, table, fields, chunk, op, update_values,
+                                          index_name, limit, deadline)
+            for key, data in zip(chunk, responses):
+                result = self._modify_result(fields, op, data)
+                if per_key:
+                    results[key] = result
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    total += result
+        return results if per_key else total
+
+    @retry_on_failure
+    def _modify_keys(self, db, table, fields, keys, op, update_values, index_name,
+                     limit, deadline):
+        """Modifies rows of ``keys`` with one pipelined request per key.
+        Private method.
+        """
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
+        requests = [('=', [str(key)], op,
+                     update_values[key] if isinstance(update_values, dict) else update_values,
+                     limit)
+                    for key in keys]
+        return self.write_socket.find_modify_many(index_id, requests, deadline)
+
+    @retry_on_failure
+    def _modify_in(self, db, table, fields, keys, op, update_values, index_name,
+                   limit, deadline):
+        """Modifies rows of ``keys`` with a single IN clause request.
+        Private method.
+        """
+        index_id = self.write_socket.get_index_id(db, table, fields, index_name, deadline)
+        values = [str(key) for key in keys]
+        return self.write_socket.find_modify(index_id, '=', values[:1], op, update_values,
+                                             limit * len(keys), in_values=values,
+                                             deadline=deadline)
+
+    def _modify_result(self, fields, op, data):
+        """Converts a raw modification response into a number of affected rows
+        or a list of original values.
+        Private method.
+        """
+        if isinstance(data, Exception):
+            return data
+        if op.endswith('?'):
+            return [list(zip(fields, row)) for row in data or []]
+        return int(data[0][0]) if data else 0
+
     def purge(self):
         """Purges all read and write connections.
         All requests after that operation will open new connections, index
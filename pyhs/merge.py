@@ -0,0 +1,126 @@
+"""Ordered range scans over tables partitioned across several servers."""
+import heapq
+from itertools import islice
+
+
+ASCENDING_OPERATIONS = ('>', '>=')
+DESCENDING_OPERATIONS = ('<', '<=')
+
+
+def _scan_pages(manager, db, table, operation, fields, values, index_name,
+                page_size, max_rows):
+    """Lazily yields rows found on a single partition page by page.
+    No more than ``max_rows`` rows are fetched in total (``0`` means no limit).
+    Private function.
+
+    Pages are requested with keyset pagination: every next page starts at the
+    key of the last row, skipping only the rows with that key already seen,
+    so the server doesn't walk through all the previous rows again.
+    """
+    inclusive = operation in ASCENDING_OPERATIONS and '>=' or '<='
+    key_length = len(values)
+    skip = 0
+    fetched = 0
+    while not max_rows or fetched < max_rows:
+        size = page_size
+        if max_rows:
+            size = min(size, max_rows - fetched)
+        page = manager.find(db, table, operation, fields, values,
+                            index_name=index_name, limit=size, offset=skip)
+        if not page:
+            return
+        for row in page:
+            yield row
+        fetched += len(page)
+        if len(page) < size:
+            return
+
+        last = [value for field, value in page[-1][:key_length]]
+        tail = 0
+        for row in reversed(page):
+            if [value for field, value in row[:key_length]] != last:
+                break
+            tail += 1
+        # Keys of the whole page may equal the one the page started at
+        skip = tail + (skip if operation == inclusive and last == list(values) else 0)
+        operation, values = inclusive, last
+
+
+def _default_key(values):
+    """Returns sort key function for rows of a scan starting at ``values``.
+    Index columns whose start values are integers are compared as numbers,
+    the rest as strings. ``NULL`` goes first as in MySQL indexes.
+    Private function.
+    """
+    numeric = []
+    for value in values:
+        try:
+            int(value)
+            numeric.append(True)
+        except (TypeError, ValueError):
+            numeric.append(False)
+
+    def key(row):
+        return tuple((value is not None, int(value) if is_numeric and value is not None
+                      else value)
+                     for (field, value), is_numeric in zip(row, numeric))
+
+    return key
+
+
+def merge_find(managers, db, table, operation, fields, values, index_name=None,
+               limit=0, offset=0, page_size=100, key=None):
+    """Finds rows in a table that is partitioned by key across several servers
+    and returns them in index order as if it was a single table.
+
+    Every partition is scanned lazily page by page and rows are merged through
+    a heap, so only as many rows are fetched from each partition as needed to
+    produce ``offset + limit`` rows of a global result.
+
+    Returns a generator of lists of pairs, same as :meth:`~.manager.Manager.find`
+    rows.
+
+    :param iterable managers: :class:`~.manager.Manager` instances, one per
+        partition.
+    :param string db: database name.
+    :param string table: table name.
+    :param string operation: range comparison operation. ``>`` and ``>=`` give
+        ascending order, ``<`` and ``<=`` give descending order as HS does.
+    :param list fields: list of table's fields to get, ordered by inclusion
+        into the index. Index fields must go first.
+    :param list values: values to compare to, ordered the same way as items
+        in ``fields``.
+    :param index_name: name of the index to open, default is ``PRIMARY``.
+    :type index_name: string or None
+    :param integer limit: optional global limit of results, ``0`` means all
+        matching rows.
+    :param integer offset: optional global offset of results.
+    :param integer page_size: number of rows fetched from a partition per request.
+    :param key: optional function that takes a row and returns its sort key.
+        Default key is a tuple of the first ``len(values)`` column values,
+        compared as integers if the corresponding ``values`` are integers and
+        as strings otherwise. Pass a key if that doesn't match the collation
+        of the index, e.g. for numeric strings in a text column.
+    :type key: callable or None
+    :rtype: generator
+    """
+    if operation in ASCENDING_OPERATIONS:
+        reverse = False
+    elif operation in DESCENDING_OPERATIONS:
+        reverse = True
+    else:
+        raise ValueError('Operation is not supported for merged range scans.')
+
+    if page_size < 1:
+        raise ValueError('Page size must be a positive integer.')
+
+    if key is None:
+        key = _default_key(values)
+
+    max_rows = limit and limit + offset
+    scans = [_scan_pages(manager, db, table, operation, fields, values,
+                         index_name, page_size, max_rows)
+             for manager in managers]
+    merged = heapq.merge(*scans, key=key, reverse=reverse)
+
+    return islice(merged, offset, max_rows or None)
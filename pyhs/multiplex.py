@@ -0,0 +1,497 @@
+"""Connections shared by many threads with pipelined requests."""
+import os
+import random
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from itertools import chain, count
+
+try:
+    from _speedups import encode
+except ImportError:
+    from .utils import encode
+from .exceptions import *
+from .sockets import Connection, ReadSocket, WriteSocket
+from .utils import AfterFork, wait_for_sockets
+
+
+class MultiplexedConnection(object):
+    """Single HandlerSocket connection shared by many threads.
+
+    Threads submit request lines and get futures of response lines back.
+    A background I/O thread coalesces all queued requests into one send and
+    resolves futures in order as responses arrive, so requests of different
+    threads are pipelined over the same socket.
+
+    On connection failure all pending requests fail and :attr:`~.generation`
+    is increased, indexes opened within previous generations are lost.
+    """
+
+    MAX_SEND_SIZE = 65536
+
+    def __init__(self, connection):
+        """
+        :param connection: connection to use for data exchange.
+        :type connection: :class:`~.sockets.Connection`
+        """
+        self.connection = connection
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reset_requested = False
+        self.pid = None
+        _locks.add(self)
+
+    def _reset_locks(self):
+        """Replaces the lock a forked child inherits, it may have been held by
+        a thread that doesn't exist in the child. The I/O thread is started
+        again on first use, see :meth:`~._start`.
+        Private method.
+        """
+        self.lock = threading.Lock()
+
+    def _start(self):
+        """Resets the state and starts the I/O thread. Called on first use
+        and after fork as threads don't survive it.
+        Private method.
+        """
+        self.pid = os.getpid()
+        self.queue = deque()
+        self.inflight = deque()
+        self.generation += 1
+        self.connection.disconnect()
+        self.waker, self.wakee = socket.socketpair()
+        self.wakee.setblocking(False)
+        self.thread = threading.Thread(target=self._run, name='pyhs-multiplex')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, data, generation=None):
+        """Queues request ``data`` for sending.
+
+        :param string data: request line, LF-terminated.
+        :param generation: if given, the request is only sent within this
+            connection generation and fails with
+            :exc:`~.exceptions.RecoverableConnectionError` otherwise. Needed
+            for requests that use opened indexes.
+        :type generation: integer or None
+        :rtype: :class:`concurrent.futures.Future` of a response line.
+        """
+        future = Future()
+        future.generation = generation
+        with self.lock:
+            if self.closed:
+                raise ConnectionError('Connection is closed')
+            if self.pid != os.getpid():
+                self._start()
+            if generation is not None and generation != self.generation:
+                raise RecoverableConnectionError('Connection was lost since index was opened')
+            wake = not self.queue
+            self.queue.append((data, future))
+
+        if wake:
+            self.waker.send(b'\0')
+        return future
+
+    def _run(self):
+        """I/O thread loop.
+        Private method.
+        """
+        while True:
+            with self.lock:
+                if self.closed:
+                    break
+                if self.reset_requested:
+                    self.reset_requested = False
+                    self.connection.disconnect()
+                batch = []
+                size = 0
+                while self.queue and size < self.MAX_SEND_SIZE:
+                    data, future = self.queue.popleft()
+                    batch.append((data, future))
+                    size += len(data)
+                waiting = bool(self.inflight)
+                generation = self.generation
+
+            if batch:
+                self._send(batch)
+                continue
+
+            conn = self.connection
+            readable = [self.wakee]
+            if waiting and conn.is_connected():
+                if b'\n' in conn.buffer:
+                    self._receive(generation, read=False)
+                    continue
+                readable.append(conn.socket)
+            try:
+                readable = wait_for_sockets(readable,
+                                            timeout=waiting and conn.timeout or None)[0]
+            except (socket.error, ValueError) as e:
+                self._fail(ConnectionError('Read error: %s' % e), generation)
+                continue
+
+            if self.wakee in readable:
+                try:
+                    while self.wakee.recv(4096):
+                        pass
+                except socket.error:
+                    pass
+            if waiting and not readable:
+                self._fail(ConnectionError('Read error: timed out'), generation)
+            elif conn.socket in readable:
+                self._receive(generation)
+
+        self.connection.disconnect()
+
+    def _send(self, batch):
+        """Sends a batch of requests, connecting first if needed.
+        Private method.
+        """
+        conn = self.connection
+        batch = [(data, future) for data, future in batch
+                 if future.set_running_or_notify_cancel()]
+        try:
+            if not conn.is_connected():
+                conn.connect()
+        except ConnectionError as e:
+            for data, future in batch:
+                future.set_exception(e)
+            return
+
+        stale = []
+        with self.lock:
+            generation = self.generation
+            current = []
+            for data, future in batch:
+                if future.generation not in (None, generation):
+                    stale.append(future)
+                    continue
+                future.generation = generation
+                self.inflight.append(future)
+                current.append(data)
+
+        for future in stale:
+            future.set_exception(RecoverableConnectionError(
+                'Connection was lost since index was opened'))
+
+        try:
+            conn.send(''.join(current))
+        except ConnectionError as e:
+            self._fail(e, generation)
+
+    def _receive(self, generation, read=True):
+        """Reads available response lines and resolves their futures.
+        Private method.
+        """
+        conn = self.connection
+        try:
+            if read:
+                data = conn.socket.recv(self.MAX_SEND_SIZE)
+                if not data:
+                    raise RecoverableConnectionError('Connection closed on the remote end.')
+                conn.buffer += data
+        except socket.error as e:
+            self._fail(ConnectionError('Read error: %s' % e), generation)
+            return
+        except ConnectionError as e:
+            self._fail(e, generation)
+            return
+
+        lines = conn.buffer.split(b'\n')
+        conn.buffer = lines.pop()
+        resolved = []
+        with self.lock:
+            for line in lines:
+                if not self.inflight:
+                    break
+                resolved.append((self.inflight.popleft(), bytes.decode(line)))
+
+        # Responses are read here rather than by Connection.readline()
+        conn.outstanding -= len(resolved)
+        for future, line in resolved:
+            future.set_result(line)
+
+    def _fail(self, error, generation):
+        """Fails all pending requests, drops the socket and starts a new
+        generation. Must be called from the I/O thread.
+        Private method.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.generation += 1
+            futures = list(self.inflight)
+            self.inflight.clear()
+            if not isinstance(error, RecoverableConnectionError):
+                # Closing the connection, e.g. on idle timeout, isn't a failure
+                # of the server, same as with per-thread connections
+                self.connection.retry_time = time.time() + self.connection.RETRY_INTERVAL
+            self.connection.disconnect()
+
+        for future in futures:
+            future.set_exception(error)
+
+    def reset(self):
+        """Fails requests that are waiting for responses and makes the I/O
+        thread reconnect before sending anything else.
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            self.generation += 1
+            futures = list(self.inflight)
+            self.inflight.clear()
+            self.reset_requested = True
+
+        self.waker.send(b'\0')
+        for future in futures:
+            future.set_exception(ConnectionError('Connection was reset'))
+
+    def close(self):
+        """Stops the I/O thread and closes the connection. Pending requests
+        are failed.
+        """
+        with self.lock:
+            self.closed = True
+            started = self.pid == os.getpid()
+            futures = list(self.inflight) + [future for data, future in self.queue] \
+                if started else []
+        if not started:
+            return
+
+        self.waker.send(b'\0')
+        self.thread.join()
+        for future in futures:
+            if not future.done():
+                future.set_exception(ConnectionError('Connection is closed'))
+
+
+class MultiplexedPool(object):
+    """Thread-safe pool of :class:`~.MultiplexedConnection` instances, one per
+    server, with a shared index cache.
+
+    Index ids are unique within the pool, every index is opened on a single
+    randomly chosen server and all threads use it there.
+    """
+
+    def __init__(self, servers, debug=False):
+        """
+        :param iterable servers: a list of lists that define server data, see
+            :class:`~.sockets.HandlerSocket`.
+        :param bool debug: enable or disable debug mode, default is ``False``.
+        """
+        self.connections = []
+        for server in servers:
+            conn = Connection(*server)
+            conn.set_debug_mode(debug)
+            self.connections.append(MultiplexedConnection(conn))
+
+        self.lock = threading.Lock()
+        self.index_ids = count()
+        self._clear_caches()
+        _locks.add(self)
+
+    def _reset_locks(self):
+        """Replaces the lock a forked child inherits.
+        Private method.
+        """
+        self.lock = threading.Lock()
+
+    def _clear_caches(self):
+        """Clears index cache and connection map.
+        Private method.
+        """
+        self.index_cache = {}
+        self.index_map = {}
+
+    def get_index_id(self, db, table, fields, index_name=None, deadline=None):
+        """Returns id of the index opened on one of the servers, see
+        :meth:`~.sockets.HandlerSocket.get_index_id`. Raises
+        :exc:`~.exceptions.OperationalError` if the server fails to open it.
+
+        :rtype: integer
+        """
+        index_name = index_name or 'PRIMARY'
+        fields = ','.join(fields)
+        cache_key = ':'.join((db, table, index_name, fields))
+        index_id = self.index_cache.get(cache_key)
+        if index_id is not None:
+            mconn, generation = self.index_map.get(index_id, (None, None))
+            if mconn is not None and mconn.generation == generation:
+                return index_id
+
+        candidates = [mconn for mconn in self.connections if mconn.connection.is_ready()]
+        if not candidates:
+            raise ConnectionError('Could not connect to any of given servers')
+        mconn = random.choice(candidates)
+
+        index_id = next(self.index_ids)
+        query = chain(('P', str(index_id)), map(encode, (db, table, index_name, fields)))
+        future = mconn.submit('\t'.join(query) + '\n')
+        tokens = self._wait(future, deadline).split('\t')
+        if tokens[0] != '0':
+            # Same error as HandlerSocket._parse_response() raises
+            error = len(tokens) > 2 and tokens[2] or 'Unknown remote error'
+            raise OperationalError('HandlerSocket returned an error code: %s' % error)
+        with self.lock:
+            self.index_cache[cache_key] = index_id
+            self.index_map[index_id] = (mconn, future.generation)
+
+        return index_id
+
+    def submit(self, index_id, lines):
+        """Queues request ``lines`` on the connection of ``index_id``.
+        Raises :exc:`~.exceptions.RecoverableConnectionError` if that
+        connection was lost since the index was opened.
+
+        :param integer index_id: id of opened index.
+        :param list lines: LF-terminated request lines.
+        :rtype: list of :class:`concurrent.futures.Future`
+        """
+        try:
+            mconn, generation = self.index_map[index_id]
+        except KeyError:
+            raise OperationalError('There is no connection with given index id "%d"' % index_id)
+        try:
+            return [mconn.submit(line, generation) for line in lines]
+        except RecoverableConnectionError:
+            self.purge_index(index_id)
+            raise
+
+    def _wait(self, future, deadline=None):
+        """Waits for a response line.
+        Private method.
+
+        :rtype: string
+        """
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            raise DeadlineExceeded('Deadline exceeded')
+
+    def purge_index(self, index_id):
+        """Clears single index from the caches.
+
+        :param integer index_id: id of the index to purge.
+        """
+        with self.lock:
+            self.index_map.pop(index_id, None)
+            for key, value in list(self.index_cache.items()):
+                if value == index_id:
+                    del self.index_cache[key]
+
+    def purge(self):
+        """Resets all connections and cleans caches."""
+        with self.lock:
+            self._clear_caches()
+        for mconn in self.connections:
+            mconn.reset()
+
+    def close(self):
+        """Closes all connections and stops their I/O threads. The pool can't
+        be used after that.
+        """
+        with self.lock:
+            self._clear_caches()
+        for mconn in self.connections:
+            mconn.close()
+
+
+class MultiplexMixin(object):
+    """Replaces per-thread connections of :class:`~.sockets.HandlerSocket`
+    subclasses with a :class:`~.MultiplexedPool` shared by all threads.
+    """
+
+    def __init__(self, pool):
+        """
+        :param pool: pool shared by all threads.
+        :type pool: :class:`~.MultiplexedPool`
+        """
+        self.pool = pool
+        self.hedge_policy = None
+        self.hooks = None
+
+    def get_index_id(self, db, table, fields, index_name=None, deadline=None):
+        """See :meth:`~.sockets.HandlerSocket.get_index_id`."""
+        return self.pool.get_index_id(db, table, fields, index_name, deadline)
+
+    def _call(self, index_id, query, force_index=False, deadline=None):
+        """Sends the request through the shared connection and waits for
+        its response. See :meth:`~.sockets.HandlerSocket._call`.
+        Private method.
+        """
+        return self._call_many(index_id, [query], deadline=deadline, partial=False)[0]
+
+    def _call_many(self, index_id, queries, force_index=False, deadline=None, partial=True):
+        """Pipelined version of :meth:`~._call`, see
+        :meth:`~.sockets.HandlerSocket._call_many`.
+        Private method.
+        """
+        lines = ['\t'.join(query) + '\n' for query in queries]
+        futures = self.pool.submit(index_id, lines)
+        try:
+            raw_responses = [self.pool._wait(future, deadline) for future in futures]
+        except DeadlineExceeded:
+            raise
+        except ConnectionError as e:
+            self.pool.purge_index(index_id)
+            raise RecoverableConnectionError(*e.args)
+
+        responses = []
+        for raw_data in raw_responses:
+            try:
+                responses.append(self._parse_response(raw_data))
+            except OperationalError as e:
+                if not partial:
+                    raise
+                responses.append(e)
+
+        return responses
+
+    def _call_stream(self, index_id, query, force_index=False, deadline=None):
+        """Shared connection can't be held by a single reader, so the response
+        is received as a whole and its rows are yielded afterwards.
+        See :meth:`~.sockets.HandlerSocket._call_stream`.
+        Private method.
+        """
+        for row in self._call(index_id, query, force_index, deadline) or []:
+            yield row
+
+    def warm(self, indexes, after_fork=True):
+        """Opens given indexes in advance, see :meth:`~.sockets.HandlerSocket.warm`.
+        Connections are re-established after fork on first use.
+        """
+        for index in indexes:
+            self.get_index_id(*index)
+
+    def purge_index(self, index_id):
+        """See :meth:`~.sockets.HandlerSocket.purge_index`."""
+        self.pool.purge_index(index_id)
+
+    def purge_indexes(self):
+        """See :meth:`~.sockets.HandlerSocket.purge_indexes`."""
+        self.pool.purge()
+
+    def purge(self):
+        """See :meth:`~.sockets.HandlerSocket.purge`."""
+        self.pool.purge()
+
+
+class MultiplexedReadSocket(MultiplexMixin, ReadSocket):
+    """:class:`~.sockets.ReadSocket` that uses a :class:`~.MultiplexedPool`."""
+    pass
+
+
+class MultiplexedWriteSocket(MultiplexMixin, WriteSocket):
+    """:class:`~.sockets.WriteSocket` that uses a :class:`~.MultiplexedPool`."""
+    pass
+
+
+# Multiplexed connections and pools, their locks are reset in child processes
+_locks = AfterFork('_reset_locks')
@@ -0,0 +1,156 @@
+"""Replay of captured requests as a load generator, see :mod:`~.capture`."""
+import argparse
+import queue
+import sys
+import threading
+import time
+
+from .capture import read_capture
+from .exceptions import ConnectionError, OperationalError
+from .sockets import HandlerSocket
+from .utils import parse_address
+
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def is_write(tokens):
+    """Checks if captured request ``tokens`` modify data.
+
+    :param list tokens: encoded request tokens.
+    :rtype: bool
+    """
+    if tokens[1] == '+':
+        return True
+
+    position = 3 + int(tokens[2]) + 2
+    if position < len(tokens) and tokens[position] == '@':
+        position += 3 + int(tokens[position + 2])
+    return position < len(tokens)
+
+
+def percentile(values, percent):
+    """Returns ``percent`` percentile of sorted ``values``.
+
+    :param list values: sorted numbers.
+    :param number percent: percentile between 0 and 100.
+    :rtype: number or None
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def replay(path, servers, workers=4, speed=1.0, writes=False):
+    """Sends captured requests to ``servers`` with the original timing.
+
+    Requests are dispatched at their captured start times scaled by ``speed``
+    (``2`` sends twice as fast, ``0`` sends as fast as ``workers`` can go)
+    and performed by ``workers`` threads, each with its own connection.
+    Indexes are opened on first use. Latency of timed replays is measured
+    from the moment a request was due, so the delays of a saturated server
+    are not hidden by requests waiting in the queue.
+
+    Returns a dict with numbers of ``requests``, ``errors`` and ``skipped``
+    writes, ``seconds`` spent, ``throughput`` in requests per second and
+    ``latency`` percentiles in seconds, see :const:`~.PERCENTILES`.
+
+    :param string path: path of the capture file.
+    :param list servers: list of server definitions, see
+        :class:`~.sockets.HandlerSocket`.
+    :param integer workers: number of concurrent connections.
+    :param number speed: replay rate relative to the captured one.
+    :param bool writes: if ``True``, modifying requests are replayed too,
+        otherwise they are skipped.
+    :rtype: dict
+    """
+    socket = HandlerSocket(servers)
+    requests = queue.Queue(workers * 100)
+    latencies = []
+    errors = []
+
+    def work():
+        while True:
+            item = requests.get()
+            if item is None:
+                return
+            due, request = item
+            tokens = list(request.tokens)
+            db, table, fields, index_name = request.index
+            try:
+                index_id = socket.get_index_id(db, table, fields.split(','), index_name)
+                tokens[0] = str(index_id)
+                started = time.monotonic()
+                socket._call(index_id, tokens, force_index=True)
+            except (ConnectionError, OperationalError) as e:
+                errors.append(e)
+                continue
+            latencies.append(time.monotonic() - (due if speed else started))
+
+    threads = [threading.Thread(target=work, daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    started = time.monotonic()
+    first = None
+    skipped = 0
+    try:
+        for request in read_capture(path):
+            if not writes and is_write(request.tokens):
+                skipped += 1
+                continue
+
+            if first is None:
+                first = request.started
+            due = time.monotonic()
+            if speed:
+                due = started + (request.started - first) / speed
+                time.sleep(max(0, due - time.monotonic()))
+            requests.put((due, request))
+    finally:
+        for thread in threads:
+            requests.put(None)
+        for thread in threads:
+            thread.join()
+
+    seconds = time.monotonic() - started
+    latencies.sort()
+    total = len(latencies) + len(errors)
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'skipped': skipped,
+        'seconds': seconds,
+        'throughput': total / seconds if seconds else 0,
+        'latency': dict([(percent, percentile(latencies, percent)) for percent in PERCENTILES]
+                        + [('max', latencies[-1] if latencies else None)]),
+    }
+
+
+def main(argv=None):
+    """Entry point of ``pyhs-replay`` console script."""
+    parser = argparse.ArgumentParser(
+        description='Replay captured HandlerSocket requests against a server.')
+    parser.add_argument('path', help='capture file')
+    parser.add_argument('-s', '--server', action='append', dest='servers',
+                        help='server as host:port or unix:path, may be repeated')
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='rate relative to the captured one, 0 is unthrottled')
+    parser.add_argument('--writes', action='store_true', help='replay modifying requests too')
+    args = parser.parse_args(argv)
+
+    servers = [parse_address(server) for server in args.servers or ['localhost:9998']]
+    result = replay(args.path, servers, args.workers, args.speed, args.writes)
+
+    sys.stdout.write('%d requests (%d errors, %d writes skipped) in %.1f s, %.0f req/s\n' % (
+        result['requests'], result['errors'], result['skipped'], result['seconds'],
+        result['throughput']))
+    for name, value in sorted(result['latency'].items(), key=lambda item: str(item[0])):
+        if value is not None:
+            label = name if name == 'max' else 'p%s' % name
+            sys.stdout.write('%6s %.3f ms\n' % (label, value * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Cross-process cache of look up results backed by a memory-mapped file."""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .exceptions import OperationalError
+
+
+class SharedCache(object):
+    """Fixed-size hash table of cached values shared by all processes that map
+    the same file, e.g. pre-fork workers of a web server.
+
+    The file is split into :attr:`~.slots` slots of :attr:`~.slot_size` bytes.
+    Every key is hashed into a single slot, a newer value evicts an older one
+    on collision. Values are JSON-encoded, ones that don't fit into a slot are
+    not cached. Each value expires after :attr:`~.ttl` seconds, there is no
+    other invalidation, so cached rows may be that much stale.
+
+    Concurrent access is serialized per slot with POSIX record locks between
+    processes and with a striped set of locks between threads of a process.
+
+    .. note:: Create the cache before forking so all workers share it, or
+       point every worker at the same ``path``. Only available on platforms
+       that provide :mod:`fcntl`.
+    """
+
+    MAGIC = b'PYHSSHM1'
+    HEADER = struct.Struct('8sII')
+    HEADER_SIZE = 64
+    SLOT_HEADER = struct.Struct('16sdI')
+    SLOTS = 65536
+    SLOT_SIZE = 512
+    TTL = 1
+    THREAD_LOCKS = 64
+
+    def __init__(self, path, slots=None, slot_size=None, ttl=None):
+        """
+        :param string path: path of the file to map, it is created if missing.
+        :param slots: number of slots, default is defined in :const:`~.SLOTS`.
+        :type slots: integer or None
+        :param slot_size: size of a slot in bytes, default is defined in
+            :const:`~.SLOT_SIZE`.
+        :type slot_size: integer or None
+        :param ttl: number of seconds values are valid for, default is defined
+            in :const:`~.TTL`.
+        :type ttl: number or None
+        """
+        if fcntl is None:
+            raise OperationalError('Shared cache is not supported on this platform.')
+
+        self.path = path
+        self.slots = slots or self.SLOTS
+        self.slot_size = slot_size or self.SLOT_SIZE
+        self.ttl = ttl or self.TTL
+        if self.slot_size <= self.SLOT_HEADER.size:
+            raise ValueError('Slot size is too small.')
+
+        size = self.HEADER_SIZE + self.slots * self.slot_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+        try:
+            header = os.pread(self.fd, self.HEADER.size, 0)
+            valid = len(header) == self.HEADER.size and header.startswith(self.MAGIC)
+            if not valid:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, self.HEADER.pack(self.MAGIC, self.slots, self.slot_size), 0)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+
+        if valid and self.HEADER.unpack(header)[1:] != (self.slots, self.slot_size):
+            os.close(self.fd)
+            raise ValueError('Cache file "%s" has a different layout.' % path)
+
+        self.map = mmap.mmap(self.fd, size)
+        self.thread_locks = [threading.Lock() for i in range(self.THREAD_LOCKS)]
+
+    def _digest(self, key):
+        """Returns a process-independent digest of ``key``.
+        Private method.
+        """
+        data = json.dumps(key, separators=(',', ':')).encode('utf-8')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _locked(self, digest, operation):
+        """Runs ``operation(offset)`` with the slot of ``digest`` locked.
+        Private method.
+        """
+        slot = int.from_bytes(digest[:8], 'little') % self.slots
+        offset = self.HEADER_SIZE + slot * self.slot_size
+        with self.thread_locks[slot % self.THREAD_LOCKS]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slot_size, offset)
+            try:
+                return operation(offset)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+    def get(self, key):
+        """Returns a cached value of ``key`` or ``None`` if it is missing or
+        expired.
+
+        :param key: JSON-serializable key.
+        :rtype: JSON-decoded value or None
+        """
+        digest = self._digest(key)
+
+        def read(offset):
+            slot_digest, expires, length = self.SLOT_HEADER.unpack_from(self.map, offset)
+            if slot_digest != digest or expires < time.time():
+                return None
+            start = offset + self.SLOT_HEADER.size
+            return self.map[start:start + length]
+
+        data = self._locked(digest, read)
+        if data is None:
+            return None
+        return json.loads(data.decode('utf-8'))
+
+    def set(self, key, value, ttl=None):
+        """Caches ``value`` of ``key``. Values that don't fit into a slot are
+        silently ignored.
+
+        :param key: JSON-serializable key.
+        :param value: JSON-serializable value.
+        :param ttl: number of seconds the value is valid for, default is
+            :attr:`~.ttl`.
+        :type ttl: number or None
+        """
+        digest = self._digest(key)
+        data = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        if len(data) > self.slot_size - self.SLOT_HEADER.size:
+            return
+
+        expires = time.time() + (ttl or self.ttl)
+
+        def write(offset):
+            self.SLOT_HEADER.pack_into(self.map, offset, digest, expires, len(data))
+            start = offset + self.SLOT_HEADER.size
+            self.map[start:start + len(data)] = data
+
+        self._locked(digest, write)
+
+    def delete(self, key):
+        """Removes ``key`` from the cache if it is there.
+
+        :param key: JSON-serializable key.
+        """
+        digest = self._digest(key)
+
+        def clear(offset):
+            slot_digest = self.SLOT_HEADER.unpack_from(self.map, offset)[0]
+            if slot_digest == digest:
+                self.SLOT_HEADER.pack_into(self.map, offset, b'', 0, 0)
+
+        self._locked(digest, clear)
+
+    def close(self):
+        """Unmaps the cache file. The file itself is left in place."""
+        self.map.close()
+        os.close(self.fd)
@@ -1,15 +1,20 @@
+import errno
+import os
 import socket
 import threading
 import time
 import random
+import re
+from contextlib import contextmanager
 from itertools import chain
 
 try:
     from _speedups import encode, decode
 except ImportError:
     from .utils import encode, decode
-from .utils import check_columns
+from .utils import AfterFork, check_columns, in_clause, wait_for_sockets
 from .exceptions import *
+from .hooks import hooked
 
 
 
@@ -20,12 +25,23 @@ class Connection(object):
     read data from it.
     In case of failure :attr:`~.retry_time` will be set to the exact time after
     which the connection may be retried to deal with temporary connection issues.
+
+    Servers close connections that stay idle for too long. Before a socket
+    that was idle for :const:`~.STALE_CHECK_IDLE` seconds or longer is reused,
+    it's checked for readability: nothing is expected from the server between
+    requests, so a readable socket was closed by the server (or its stream is
+    out of sync) and is replaced with a new one right away instead of failing
+    the next request.
     """
 
     UNIX_PROTO = 'unix'
     INET_PROTO = 'inet'
     DEFAULT_TIMEOUT = 3
     RETRY_INTERVAL = 30
+    RECV_SIZE = 65536
+    TOKEN_SEPARATOR = re.compile(b'[\t\n]')
+    STALE_CHECK_IDLE = 1
+    KEEPALIVE_OPTIONS = ('TCP_KEEPIDLE', 'TCP_KEEPINTVL', 'TCP_KEEPCNT')
 
     def __init__(self, protocol, host, port=None, timeout=None):
         """
@@ -52,8 +68,31 @@ class Connection(object):
             raise ValueError('Unsupported protocol')
 
         self.socket = None
+        self.pid = None
+        self.buffer = b''
+        self.streaming = False
+        self.outstanding = 0
+        self.last_used = 0
+        self._reset_locks()
+        _connections.add(self)
+        # Ids of indexes opened on the socket mapped to their open requests
+        self.indexes = {}
+        self.socket_timeout = None
+        self.deadline_bound = False
         self.retry_time = 0
         self.debug = False
+        self.hooks = None
+        self.keepalive = None
+
+    def _reset_locks(self):
+        """Creates the lock that guards socket state against a concurrent
+        :meth:`~.ping`. Called again in a forked child, where the lock may have
+        been held by a thread that doesn't exist there.
+        Private method.
+        """
+        self.lock = threading.Lock()
+        self.ping_finished = threading.Condition(self.lock)
+        self.pinging = False
 
     def set_debug_mode(self, mode):
         """Changes debugging mode of the connection.
@@ -63,24 +102,275 @@ class Connection(object):
         """
         self.debug = mode
 
-    def connect(self):
+    def connect(self, deadline=None):
         """Establishes connection with a new socket. If some socket is
-        associated with the instance - no new socket will be created.
+        associated with the instance - no new socket will be created, unless
+        it was inherited from a parent process or the server has closed it.
+
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the connection must be established by, otherwise
+            :exc:`~.exceptions.DeadlineExceeded` is raised.
+        :type deadline: number or None
         """
         if self.socket:
-            return
+            if self.pid == os.getpid() and not self._is_stale():
+                return
+            # Socket is either shared with the parent process after fork, so
+            # using it would mix up both streams, or already closed by the server
+            self.disconnect()
 
+        self._connect(deadline)
+
+    @hooked('connect')
+    def _connect(self, deadline=None):
+        """Creates and connects a new socket, see :meth:`~.connect`.
+        Private method.
+        """
+        timeout = self._timeout(deadline)
         try:
-            sock = socket.socket(self.protocol, socket.SOCK_STREAM)
-            # Disable Nagle algorithm to improve latency:
-            # http://developers.slashdot.org/comments.pl?sid=174457&threshold=1&commentsort=0&mode=thread&cid=14515105
-            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            sock.settimeout(self.timeout)
+            sock = self._create_socket()
+            sock.settimeout(timeout)
             sock.connect(self.address)
         except socket.error as e:
             self._die(e, 'Connection error')
 
+        self._attach(sock, timeout)
+
+    def _create_socket(self):
+        """Creates a new socket for the connection.
+        Private method.
+
+        :rtype: :class:`socket.socket`
+        """
+        sock = socket.socket(self.protocol, socket.SOCK_STREAM)
+        # Disable Nagle algorithm to improve latency:
+        # http://developers.slashdot.org/comments.pl?sid=174457&threshold=1&commentsort=0&mode=thread&cid=14515105
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive and self.protocol == socket.AF_INET:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for name, value in zip(self.KEEPALIVE_OPTIONS, self.keepalive):
+                # Options that the platform lacks keep system defaults
+                if value is not None and hasattr(socket, name):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+        return sock
+
+    def _attach(self, sock, timeout):
+        """Associates established connection socket with the instance.
+        Private method.
+        """
+        self.last_used = time.monotonic()
         self.socket = sock
+        self.socket_timeout = timeout
+        self.pid = os.getpid()
+
+    def _is_stale(self):
+        """Checks if the socket became readable while idle, which means the
+        server has closed it as no response is pending.
+        Private method.
+
+        :rtype: bool
+        """
+        with self.lock:
+            if self.pinging or self.outstanding or self.buffer or self.streaming:
+                return False
+            if time.monotonic() - self.last_used < self.STALE_CHECK_IDLE:
+                return False
+            try:
+                return bool(wait_for_sockets([self.socket], timeout=0)[0])
+            except (socket.error, ValueError):
+                return True
+
+    def ping(self, idle):
+        """Keeps the connection alive if it hasn't been used for ``idle``
+        seconds. Meant to be called from a background thread, see
+        :class:`~.keepalive.IdlePinger`. Requests of the owning thread wait
+        for the ping to finish, the lock isn't held during network I/O though.
+
+        One of the opened indexes is opened again to make the server respond.
+        If the socket was closed or the server doesn't respond properly, a new
+        socket with all the indexes opened replaces it, so the owning thread
+        doesn't have to reconnect. Failures are ignored, they are handled by
+        the owning thread on its next request.
+
+        :param number idle: min number of seconds since the last use.
+        """
+        with self.lock:
+            if self.pinging or not self.is_connected() or self.outstanding \
+                    or self.buffer or self.streaming:
+                return
+            if time.monotonic() - self.last_used < idle:
+                return
+            self.pinging = True
+            sock = self.socket
+            lines = list(self.indexes.values())
+
+        replacement = None
+        try:
+            try:
+                sock.settimeout(self.timeout)
+                readable = wait_for_sockets([sock], timeout=0)[0]
+            except (socket.error, ValueError):
+                readable = True
+            if readable or not self._exchange(sock, lines[:1]):
+                replacement = self._open_replacement(lines)
+        finally:
+            with self.lock:
+                self.pinging = False
+                # Socket may have been dropped by the owning thread meanwhile
+                if self.socket is sock:
+                    self.socket_timeout = self.timeout
+                    self.last_used = time.monotonic()
+                    if replacement is not None:
+                        self.socket, replacement = replacement, sock
+                self.ping_finished.notify_all()
+
+            if replacement is not None:
+                try:
+                    replacement.close()
+                except socket.error:
+                    pass
+
+    def _open_replacement(self, lines):
+        """Connects a new socket and opens indexes on it, see :meth:`~.ping`.
+        Returns ``None`` if that fails.
+        Private method.
+
+        :param list lines: open index request lines without trailing LF.
+        :rtype: :class:`socket.socket` or None
+        """
+        sock = self._create_socket()
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+            if self._exchange(sock, lines):
+                return sock
+        except socket.error:
+            pass
+        sock.close()
+        return None
+
+    def _exchange(self, sock, lines):
+        """Sends index open requests through ``sock`` and checks that all of
+        them succeed. Used by :meth:`~.ping` only.
+        Private method.
+
+        :param sock: connected socket.
+        :type sock: :class:`socket.socket`
+        :param list lines: request lines without trailing LF.
+        :rtype: bool
+        """
+        if not lines:
+            return True
+        try:
+            sock.sendall(str.encode('\n'.join(lines) + '\n'))
+            data = b''
+            while data.count(b'\n') < len(lines):
+                chunk = sock.recv(self.RECV_SIZE)
+                if not chunk:
+                    return False
+                data += chunk
+        except socket.error:
+            return False
+
+        responses = data.split(b'\n')
+        # Anything after the expected responses means the stream is out of sync
+        return len(responses) == len(lines) + 1 and not responses[-1] and \
+            all(response.split(b'\t', 1)[0] == b'0' for response in responses[:-1])
+
+    def is_connected(self):
+        """Checks if connection instance has a usable socket.
+
+        :rtype: bool
+        """
+        return self.socket is not None and self.pid == os.getpid()
+
+    def start_connect(self):
+        """Starts establishing a connection without waiting for it. Returns
+        a non-blocking socket that becomes writable once the connection
+        attempt is over, :meth:`~.finish_connect` or :meth:`~.cancel_connect`
+        must be called with it then.
+        Throws :exc:`~.exceptions.ConnectionError` in case of failure.
+
+        :rtype: :class:`socket.socket`
+        """
+        self.deadline_bound = False
+        sock = None
+        try:
+            sock = self._create_socket()
+            sock.setblocking(False)
+            error = sock.connect_ex(self.address)
+            if error not in (0, errno.EINPROGRESS, errno.EAGAIN, errno.EWOULDBLOCK):
+                raise socket.error(error, os.strerror(error))
+        except socket.error as e:
+            if sock is not None:
+                sock.close()
+            self._die(e, 'Connection error')
+
+        return sock
+
+    def finish_connect(self, sock):
+        """Completes connection attempt started with :meth:`~.start_connect`
+        and associates the socket with the instance if it succeeded.
+        Throws :exc:`~.exceptions.ConnectionError` in case of failure.
+
+        :param sock: socket returned by :meth:`~.start_connect`.
+        :type sock: :class:`socket.socket`
+        """
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            sock.close()
+            self._die(socket.error(error, os.strerror(error)), 'Connection error')
+
+        self.disconnect()
+        sock.settimeout(self.timeout)
+        self._attach(sock, self.timeout)
+
+    def cancel_connect(self, sock):
+        """Abandons connection attempt started with :meth:`~.start_connect`
+        that took too long. Throws :exc:`~.exceptions.ConnectionError` as
+        the connection is considered failed.
+
+        :param sock: socket returned by :meth:`~.start_connect`.
+        :type sock: :class:`socket.socket`
+        """
+        sock.close()
+        self._die(socket.timeout('timed out'), 'Connection error')
+
+    def _timeout(self, deadline):
+        """Returns socket timeout to use for an operation that must complete
+        by ``deadline``. Raises :exc:`~.exceptions.DeadlineExceeded` if it
+        has already passed.
+        Private method.
+
+        :param deadline: time as returned by :func:`time.monotonic` or ``None``.
+        :type deadline: number or None
+        :rtype: number
+        """
+        self.deadline_bound = False
+        if deadline is None:
+            return self.timeout
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded('Deadline exceeded')
+        if remaining < self.timeout:
+            self.deadline_bound = True
+            return remaining
+        return self.timeout
+
+    def _set_deadline(self, deadline):
+        """Adjusts socket timeout so the next socket operation doesn't exceed
+        ``deadline``. Raises :exc:`~.exceptions.DeadlineExceeded` if it has
+        already passed.
+        Private method.
+
+        :param deadline: time as returned by :func:`time.monotonic` or ``None``.
+        :type deadline: number or None
+        """
+        timeout = self._timeout(deadline)
+        if timeout != self.socket_timeout:
+            self.socket.settimeout(timeout)
+            self.socket_timeout = timeout
 
     def _die(self, e, msg='Socket error'):
         """Disconnects from the host and assigns failure retry time. Throws a
@@ -94,6 +384,11 @@ class Connection(object):
             being in process (e.g. 'Read error').
         :type msg: string or None
         """
+        if self.deadline_bound and isinstance(e, socket.timeout):
+            # Server isn't at fault, the caller just ran out of time
+            self.disconnect()
+            raise DeadlineExceeded('%s: deadline exceeded' % msg)
+
         self.retry_time = time.time() + self.RETRY_INTERVAL
         self.disconnect()
 
@@ -115,49 +410,160 @@ class Connection(object):
 
         .. note:: It ignores any socket exceptions that might happen in process.
         """
-        if self.socket:
+        with self.lock:
+            if self.socket:
+                try:
+                    self.socket.close()
+                except socket.error:
+                    pass
+                self.socket = None
+            self.buffer = b''
+            self.outstanding = 0
+            self.indexes.clear()
+
+    def wait_readable(self, timeout, deadline=None):
+        """Waits up to ``timeout`` seconds for a complete response to arrive.
+        Throws :exc:`~.exceptions.ConnectionError` in case of failure.
+
+        :param number timeout: max number of seconds to wait.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            to stop waiting at if it comes earlier.
+        :type deadline: number or None
+        :rtype: bool
+        """
+        if deadline is not None:
+            timeout = min(timeout, max(deadline - time.monotonic(), 0))
+        expires = time.monotonic() + timeout
+
+        while b'\n' not in self.buffer:
             try:
-                self.socket.close()
-            except socket.error:
-                pass
-            self.socket = None
+                readable = wait_for_sockets([self.socket],
+                                            timeout=max(expires - time.monotonic(), 0))[0]
+            except (socket.error, ValueError) as e:
+                self._die(e, 'Read error')
+            if not readable:
+                return False
+            self.buffer += self._receive(deadline)
+
+        return True
 
-    def readline(self):
+    @hooked('receive')
+    def readline(self, deadline=None):
         """Reads one line from the socket stream and returns it.
         Lines are expected to be delimited with LF.
         Throws :exc:`~.exceptions.ConnectionError` in case of failure.
 
-        :rtype: string
+        Data received after the first LF is kept in :attr:`~.buffer` and
+        returned by subsequent calls, so several pipelined responses can be
+        read one by one.
 
-        .. note:: Currently Connection class supports only one line per
-           request/response. All data in the stream after first LF will be ignored.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the line must be read by. Connection is closed if it passes as
+            the rest of the response can't be told apart from the next one.
+        :type deadline: number or None
+        :rtype: string
         """
-        buffer = ''
+        buffer = self.buffer
         index = -1
         while True:
-            index = buffer.find('\n')
+            index = buffer.find(b'\n')
             if index >= 0:
                 break
 
-            try:
-                data = self.socket.recv(4096)
-                if self.debug:
-                    print("DEBUG: read data bucket: %s" % data)
-                if not data:
-                    raise RecoverableConnectionError('Connection closed on the remote end.')
-            except socket.error as e:
-                self._die(e, 'Read error')
+            buffer += self._receive(deadline)
+
+        self.buffer = buffer[index + 1:]
+        self.last_used = time.monotonic()
+        self.outstanding -= 1
+        return bytes.decode(buffer[:index])
+
+    def read_tokens(self, deadline=None):
+        """Reads one line from the socket stream and yields its TAB-delimited
+        tokens as soon as each of them is received, so memory use doesn't
+        depend on the line length.
+        Throws :exc:`~.exceptions.ConnectionError` in case of failure.
+
+        The connection can't be used for anything else until the generator is
+        exhausted. If it is closed earlier, the connection is closed too as
+        the rest of the line can't be skipped reliably.
+
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole line must be read by.
+        :type deadline: number or None
+        :rtype: generator of strings
+        """
+        self.streaming = True
+        complete = False
+        buffer = self.buffer
+        start = 0
+        try:
+            while True:
+                match = self.TOKEN_SEPARATOR.search(buffer, start)
+                if match is None:
+                    buffer = buffer[start:] + self._receive(deadline)
+                    start = 0
+                    continue
+
+                yield bytes.decode(buffer[start:match.start()])
+                start = match.end()
+                if match.group() == b'\n':
+                    self.buffer = buffer[start:]
+                    self.last_used = time.monotonic()
+                    self.outstanding -= 1
+                    complete = True
+                    return
+        finally:
+            self.streaming = False
+            if not complete:
+                self.disconnect()
+
+    def _receive(self, deadline=None):
+        """Receives next chunk of data from the socket stream.
+        Throws :exc:`~.exceptions.ConnectionError` in case of failure.
+        Private method.
+
+        :rtype: bytes
+        """
+        try:
+            self._set_deadline(deadline)
+        except DeadlineExceeded:
+            self.disconnect()
+            raise
 
-            buffer += bytes.decode(data)
+        try:
+            data = self.socket.recv(self.RECV_SIZE)
+            if self.debug:
+                print("DEBUG: read data bucket: %s" % data)
+            if not data:
+                raise RecoverableConnectionError('Connection closed on the remote end.')
+        except socket.error as e:
+            self._die(e, 'Read error')
 
-        return buffer[:index]
+        return data
 
-    def send(self, data):
+    @hooked('send')
+    def send(self, data, deadline=None):
         """Sends all given data into the socket stream.
         Throws :exc:`~.exceptions.ConnectionError` in case of failure.
 
         :param string data: data to send
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the data must be sent by.
+        :type deadline: number or None
         """
+        if self.streaming:
+            raise OperationalError('Connection is busy reading a streamed response')
+
+        if self.hooks:
+            self.hooks.annotate(address=self.address)
+
+        with self.lock:
+            # Waits for a ping in progress, none starts once responses are pending
+            while self.pinging:
+                self.ping_finished.wait(self._timeout(deadline))
+            self._set_deadline(deadline)
+            self.outstanding += data.count('\n')
+            self.last_used = time.monotonic()
         try:
             self.socket.sendall(str.encode(data))
             if self.debug:
@@ -183,19 +589,53 @@ class HandlerSocket(threading.local):
     RETRY_LIMIT = 5
     FIND_OPERATIONS = ('=', '>', '>=', '<', '<=')
 
-    def __init__(self, servers, debug=False):
+    def __init__(self, servers, debug=False, connect_stagger=None, concurrency_limits=None,
+                 recorder=None, hooks=None, keepalive=None, pinger=None):
         """Pool constructor initializes connections for all given HandlerSocket servers.
 
         :param iterable servers: a list of lists that define server data,
             *format*: ``(protocol, host, port, timeout)``.
             See :class:`~.Connection` for details.
         :param bool debug: enable or disable debug mode, default is ``False``.
+        :param connect_stagger: if set, new connections are raced: attempts
+            to other servers are started every ``connect_stagger`` seconds
+            while the previous ones are in progress, the first established
+            one is used. By default servers are tried one by one.
+        :type connect_stagger: number or None
+        :param concurrency_limits: optional adaptive limits of concurrent
+            requests per server. Requests over the limit are rejected with
+            :exc:`~.exceptions.ServerOverloadedError` and new connections
+            prefer servers that aren't saturated.
+        :type concurrency_limits: :class:`~.limits.ConcurrencyLimits` or None
+        :param recorder: optional recorder that captures a sample of requests
+            made with :meth:`~._call` and :meth:`~._call_many`.
+        :type recorder: :class:`~.capture.CaptureRecorder` or None
+        :param hooks: optional profiling hooks run around phases of requests
+            in all threads.
+        :type hooks: :class:`~.hooks.Hooks` or None
+        :param keepalive: if set, TCP keepalive is enabled on connections to
+            *'inet'* servers. Tuple of ``(idle, interval, count)``: seconds of
+            idleness before the first probe, seconds between probes and number
+            of failed probes that drop the connection, ``None`` items keep
+            system defaults.
+        :type keepalive: tuple or None
+        :param pinger: optional background pinger that keeps idle connections
+            of all threads alive.
+        :type pinger: :class:`~.keepalive.IdlePinger` or None
         """
+        self.connect_stagger = connect_stagger
+        self.concurrency_limits = concurrency_limits
+        self.recorder = recorder
+        self.hooks = hooks
         self.connections = []
         for server in servers:
             conn = Connection(*server)
             conn.set_debug_mode(debug)
+            conn.hooks = hooks
+            conn.keepalive = keepalive
             self.connections.append(conn)
+            if pinger is not None:
+                pinger.add(conn)
 
         self._clear_caches()
 
@@ -207,9 +647,54 @@ class HandlerSocket(threading.local):
         self.index_map = {}
         self.current_index_id = 0
         self.index_cache = {}
+        self.index_specs = {}
         self.last_connection_exception = None
+        self.pid = os.getpid()
+        for conn in self.connections:
+            conn.indexes.clear()
+
+    def _check_fork(self):
+        """Drops connections and indexes inherited from a parent process as
+        they can't be shared with it.
+        Private method.
+        """
+        if self.pid != os.getpid():
+            self.purge()
+
+    def warm(self, indexes, after_fork=True):
+        """Opens given indexes in advance, so first requests that use them
+        don't have to wait for connection and index opening.
+
+        Unless ``after_fork`` is disabled, the same is done in every child
+        process right after it is forked, which lets pre-fork servers start
+        serving requests at full speed.
+
+        :param iterable indexes: list of ``(db, table, fields[, index_name])``
+            tuples, see :meth:`~.get_index_id` for details.
+        :param bool after_fork: if ``True`` warm up a child process after fork.
+        """
+        indexes = list(indexes)
+        for index in indexes:
+            self.get_index_id(*index)
+
+        if after_fork:
+            # Kept by the registry, the child may be forked by another thread
+            # that doesn't see attributes of this thread
+            _warm_after_fork.add(self, indexes)
+
+    def _warm_child(self, indexes):
+        """Drops inherited connections and warms up indexes in a child process.
+        Private method.
+        """
+        self.purge()
+        try:
+            for index in indexes:
+                self.get_index_id(*index)
+        except ConnectionError:
+            # Indexes will be opened on demand
+            pass
 
-    def _get_connection(self, index_id=None, force_index=False):
+    def _get_connection(self, index_id=None, force_index=False, deadline=None):
         """Returns active connection from the pool.
 
         It will retry available connections in case of connection failure. Max
@@ -218,7 +703,9 @@ class HandlerSocket(threading.local):
         In case of connection failure on all available servers will raise
         :exc:`~.exceptions.ConnectionError`. If ``force_index`` is set, it will
         try only one connection that was used to open given ``index_id``. If that
-        fails will throw :exc:`~.exceptions.RecoverableConnectionError`.
+        fails will throw :exc:`~.exceptions.RecoverableConnectionError`. If the
+        connection had to be re-established, e.g. after the server closed it
+        while idle, the index is opened on it again first.
 
         :param index_id: index id to look up connection for, if ``None`` (default)
             or not found a new connection will be returned.
@@ -226,10 +713,18 @@ class HandlerSocket(threading.local):
         :param bool force_index: if ``True`` will ensure that only a connection
             that was used to open ``index id`` would be returned, will raise
             :exc:`~.exceptions.OperationalError` otherwise.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            to give up connecting at, no more servers are tried after it.
+        :type deadline: number or None
         :rtype: :class:`~.Connection` instance
         """
+        self._check_fork()
         connections = self.connections[:]
         random.shuffle(connections)
+        if self.concurrency_limits is not None:
+            # Connections are popped from the end, put saturated servers first
+            connections.sort(key=lambda conn: not self.concurrency_limits.limiter(
+                conn.address).saturated())
         # Try looking up for index_id in index_map - we should use same connections
         # for opened indexes and operations using them
         if index_id is not None and index_id in self.index_map:
@@ -238,6 +733,8 @@ class HandlerSocket(threading.local):
             if force_index:
                 raise OperationalError('There is no connection with given index id "%d"' % index_id)
             conn = connections.pop()
+            if self.connect_stagger is not None and not conn.is_connected():
+                conn = self._race_connect([conn] + connections, deadline)
 
         exception = lambda exc: ConnectionError('Could not connect to any of given servers: %s'\
                                   % exc.args[0])
@@ -245,8 +742,10 @@ class HandlerSocket(threading.local):
         for i in range(max(self.RETRY_LIMIT, len(connections))):
             try:
                 if conn.is_ready():
-                    conn.connect()
+                    conn.connect(deadline)
                     break
+            except DeadlineExceeded:
+                raise
             except ConnectionError as e:
                 self.last_connection_exception = e
                 # In case indexed connection is forced remove it from the caches
@@ -266,8 +765,108 @@ class HandlerSocket(threading.local):
         # If we have an index id, save a relation between it and a connection
         if index_id is not None:
             self.index_map[index_id] = conn
+            if force_index and index_id not in conn.indexes and index_id in self.index_specs:
+                self._reopen_index(conn, index_id, deadline)
         return conn
 
+    def _reopen_index(self, conn, index_id, deadline=None):
+        """Opens a known index on a connection that has been re-established
+        since the index was opened, so requests using it don't fail.
+        Throws :exc:`~.exceptions.RecoverableConnectionError` if that fails.
+        Private method.
+
+        :param conn: connection to open the index on.
+        :type conn: :class:`~.Connection`
+        :param integer index_id: id of the index.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the index must be opened by.
+        :type deadline: number or None
+        """
+        line = '\t'.join(self._open_query(index_id, *self.index_specs[index_id]))
+        try:
+            conn.send(line + '\n', deadline)
+            self._parse_response(conn.readline(deadline))
+        except (ConnectionError, OperationalError) as e:
+            self.purge_index(index_id)
+            if isinstance(e, DeadlineExceeded):
+                raise
+            raise RecoverableConnectionError('Could not reopen index "%d": %s'
+                                             % (index_id, e.args[0]))
+        conn.indexes[index_id] = line
+
+    def _race_connect(self, connections, deadline=None):
+        """Connects to any of given servers and returns the connection.
+
+        An already established connection is returned right away. Otherwise
+        attempts are started in the order of ``connections``, each next one
+        :attr:`~.connect_stagger` seconds after the previous one or right after
+        it fails. The first established connection is kept, the rest of the
+        attempts are abandoned.
+        Raises :exc:`~.exceptions.ConnectionError` if all attempts fail.
+        Private method.
+
+        :param list connections: candidate connections.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            to give up connecting at.
+        :type deadline: number or None
+        :rtype: :class:`~.Connection` instance
+        """
+        for conn in connections:
+            # Racing an established connection would drop it with its indexes
+            if conn.is_connected() and conn.is_ready():
+                return conn
+
+        candidates = [conn for conn in reversed(connections) if conn.is_ready()]
+        attempts = {}
+        next_attempt = 0
+        try:
+            while candidates or attempts:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise DeadlineExceeded('Connection error: deadline exceeded')
+
+                if candidates and (not attempts or now >= next_attempt):
+                    conn = candidates.pop()
+                    try:
+                        attempts[conn.start_connect()] = (conn, now + conn.timeout)
+                        next_attempt = now + self.connect_stagger
+                    except ConnectionError as e:
+                        self.last_connection_exception = e
+                    continue
+
+                wakeup = min(expires for conn, expires in attempts.values())
+                if candidates:
+                    wakeup = min(wakeup, next_attempt)
+                if deadline is not None:
+                    wakeup = min(wakeup, deadline)
+                writable = wait_for_sockets(writable=list(attempts),
+                                            timeout=max(wakeup - now, 0))[1]
+
+                for sock in writable:
+                    conn = attempts.pop(sock)[0]
+                    try:
+                        conn.finish_connect(sock)
+                        return conn
+                    except ConnectionError as e:
+                        self.last_connection_exception = e
+
+                now = time.monotonic()
+                for sock, (conn, expires) in list(attempts.items()):
+                    if expires <= now:
+                        del attempts[sock]
+                        try:
+                            conn.cancel_connect(sock)
+                        except ConnectionError as e:
+                            self.last_connection_exception = e
+        finally:
+            for sock in attempts:
+                sock.close()
+
+        error = self.last_connection_exception
+        raise ConnectionError('Could not connect to any of given servers: %s'
+                              % (error and error.args[0]))
+
+    @hooked('parse')
     def _parse_response(self, raw_data):
         """Parses HandlerSocket response data.
         Returns a list of result rows which are lists of result columns.
@@ -290,9 +889,73 @@ class HandlerSocket(threading.local):
         # Divide response tokens list by number of columns
         data = list(zip(*[decoded_tokens]*columns))
 
+        if self.hooks:
+            self.hooks.count('rows', len(data))
+
         return data
 
-    def _open_index(self, index_id, db, table, fields, index_name):
+    def _parse_stream(self, tokens):
+        """Streaming version of :meth:`~._parse_response`, yields result rows
+        as tuples of columns as soon as each row is complete.
+        Private method.
+
+        :param iterable tokens: response tokens, see :meth:`~.Connection.read_tokens`.
+        :rtype: generator
+        """
+        code = next(tokens)
+        if int(code) != 0:
+            remaining = list(tokens)
+            error = 'Unknown remote error'
+            if len(remaining) > 1:
+                error = remaining[1]
+            raise OperationalError('HandlerSocket returned an error code: %s' % error)
+
+        columns = int(next(tokens))
+        row = []
+        for token in tokens:
+            row.append(decode(token))
+            if len(row) == columns:
+                yield tuple(row)
+                row = []
+
+    def _call_stream(self, index_id, query, force_index=False, deadline=None):
+        """Streaming version of :meth:`~._call`, yields result rows as they
+        are received. The request is sent on the first iteration.
+        Private method.
+
+        :rtype: generator
+        """
+        line = '\t'.join(query)
+        recording = self.recorder is not None and self.recorder.sample()
+        started = time.time()
+        sizes = []
+
+        conn = self._get_connection(index_id, force_index, deadline)
+        with self._limit(conn, deadline):
+            try:
+                conn.send(line + '\n', deadline)
+                tokens = conn.read_tokens(deadline)
+                try:
+                    measured = (sizes.append(len(token)) or token for token in tokens)
+                    for row in self._parse_stream(measured if recording else tokens):
+                        yield row
+                finally:
+                    tokens.close()
+            except GeneratorExit:
+                # Closing the stream early drops the connection
+                self.purge_index(index_id)
+                raise
+            except ConnectionError as e:
+                self.purge_index(index_id)
+                raise e
+
+        if recording and index_id in self.index_specs:
+            # Size of the response line as if it was read at once
+            self.recorder.record(self.index_specs[index_id], line, started,
+                                 time.time() - started, sum(sizes) + len(sizes) - 1)
+
+    @hooked('open_index')
+    def _open_index(self, index_id, db, table, fields, index_name, deadline=None):
         """Calls open index query on HandlerSocket.
         This is a required first operation for any read or write usages.
         Private method.
@@ -304,16 +967,29 @@ class HandlerSocket(threading.local):
             be used in further operations. Fields that are part of opened index
             must be present in the same order they are declared in the index.
         :param string index_name: name of the index.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the index must be opened by.
+        :type deadline: number or None
         :rtype: list
         """
-        encoded = map(encode, (db, table, index_name, fields))
-        query = chain(('P', str(index_id)), encoded)
+        if self.hooks:
+            self.hooks.annotate(index=(db, table, fields, index_name), op='P')
+
+        query = self._open_query(index_id, db, table, fields, index_name)
 
-        response = self._call(index_id, query)
+        response = self._call(index_id, query, deadline=deadline)
 
         return response
 
-    def get_index_id(self, db, table, fields, index_name=None):
+    def _open_query(self, index_id, db, table, fields, index_name):
+        """Returns tokens of open index query, see :meth:`~._open_index`.
+        Private method.
+
+        :rtype: list
+        """
+        return ['P', str(index_id)] + list(map(encode, (db, table, index_name, fields)))
+
+    def get_index_id(self, db, table, fields, index_name=None, deadline=None):
         """Returns index id for given index data. This id must be used in all
         operations that use given data.
 
@@ -330,8 +1006,12 @@ class HandlerSocket(threading.local):
             operations. See :meth:`._open_index` for more info on fields order.
         :param index_name: name of the index, default is ``PRIMARY``.
         :type index_name: string or None
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the index must be opened by if it isn't cached yet.
+        :type deadline: number or None
         :rtype: integer or None
         """
+        self._check_fork()
         index_name = index_name or 'PRIMARY'
         fields = ','.join(fields)
         cache_key = ':'.join((db, table, index_name, fields))
@@ -339,10 +1019,14 @@ class HandlerSocket(threading.local):
         if index_id is not None:
             return index_id
 
-        response = self._open_index(self.current_index_id, db, table, fields, index_name)
+        response = self._open_index(self.current_index_id, db, table, fields, index_name,
+                                    deadline)
         if response is not None:
             index_id = self.current_index_id
             self.index_cache[cache_key] = index_id
+            self.index_specs[index_id] = (db, table, fields, index_name)
+            self.index_map[index_id].indexes[index_id] = '\t'.join(
+                self._open_query(index_id, db, table, fields, index_name))
             self.current_index_id += 1
             return index_id
 
@@ -369,11 +1053,13 @@ class HandlerSocket(threading.local):
         :param integer index_id: id of the index to purge.
         """
         del self.index_map[index_id]
-        for key, value in self.index_cache.items():
+        self.index_specs.pop(index_id, None)
+        for key, value in list(self.index_cache.items()):
             if value == index_id:
                 del self.index_cache[key]
 
-    def _call(self, index_id, query, force_index=False):
+    @hooked('call')
+    def _call(self, index_id, query, force_index=False, deadline=None):
         """Helper that performs actual data exchange with HandlerSocket server.
         Returns parsed response data.
 
@@ -382,25 +1068,151 @@ class HandlerSocket(threading.local):
         :param bool force_index: pass ``True`` when operation requires connection
             with given ``index_id`` to work. This is usually everything except
             index opening. See :meth:`~._get_connection`.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole exchange must complete by, including connection.
+        :type deadline: number or None
         :rtype: list
         """
-        conn = self._get_connection(index_id, force_index)
-        try:
-            conn.send('\t'.join(query)+'\n')
-            response = self._parse_response(conn.readline())
-        except ConnectionError as e:
-            self.purge_index(index_id)
-            raise e
+        line = '\t'.join(query)
+        if self.hooks:
+            self.hooks.annotate(index=self.index_specs.get(index_id),
+                                op=line.split('\t', 2)[1])
+        recording = self.recorder is not None and self.recorder.sample()
+        started = time.time()
+
+        conn = self._get_connection(index_id, force_index, deadline)
+        with self._limit(conn, deadline):
+            try:
+                conn.send(line + '\n', deadline)
+                raw_data = conn.readline(deadline)
+            except ConnectionError as e:
+                self.purge_index(index_id)
+                raise e
 
-        return response
+        if recording and index_id in self.index_specs:
+            self.recorder.record(self.index_specs[index_id], line, started,
+                                 time.time() - started, len(raw_data))
+
+        return self._parse_response(raw_data)
+
+    @contextmanager
+    def _limit(self, conn, deadline=None):
+        """Context manager that holds a concurrency limit slot of the server
+        of ``conn`` if :attr:`~.concurrency_limits` are enabled.
+        Private method.
+        """
+        if self.concurrency_limits is None:
+            yield
+            return
+
+        with self.concurrency_limits.limiter(conn.address).track(deadline):
+            yield
+
+    @hooked('call_many')
+    def _call_many(self, index_id, queries, force_index=False, deadline=None):
+        """Pipelined version of :meth:`~._call`. Sends all ``queries`` in one
+        go and reads their responses in order afterwards, so the whole batch
+        costs a single round trip.
+
+        Returns a list of parsed responses ordered as ``queries``. Requests that
+        failed on the server side don't affect the rest of the batch, the
+        :exc:`~.exceptions.OperationalError` instance is put in their place
+        instead of the response.
+
+        :param integer index_id: id of the index to operate on.
+        :param iterable queries: list/iterable of queries, every query is
+            a list/iterable of tokens ready for sending.
+        :param bool force_index: see :meth:`~._call`.
+        :param deadline: see :meth:`~._call`.
+        :type deadline: number or None
+        :rtype: list
+        """
+        lines = ['\t'.join(query) + '\n' for query in queries]
+        if not lines:
+            return []
+        if self.hooks:
+            self.hooks.annotate(index=self.index_specs.get(index_id),
+                                op=lines[0].split('\t', 2)[1], requests=len(lines))
+
+        recording = self.recorder is not None and self.recorder.sample()
+        started = time.time()
+
+        conn = self._get_connection(index_id, force_index, deadline)
+        with self._limit(conn, deadline):
+            try:
+                conn.send(''.join(lines), deadline)
+                raw_responses = [conn.readline(deadline) for line in lines]
+            except ConnectionError as e:
+                self.purge_index(index_id)
+                raise e
+
+        if recording and index_id in self.index_specs:
+            # Pipelined requests share the latency of the whole batch
+            elapsed = time.time() - started
+            for line, raw_data in zip(lines, raw_responses):
+                self.recorder.record(self.index_specs[index_id], line[:-1], started,
+                                     elapsed, len(raw_data))
+
+        responses = []
+        for raw_data in raw_responses:
+            try:
+                responses.append(self._parse_response(raw_data))
+            except OperationalError as e:
+                responses.append(e)
+
+        return responses
+
+
+# All connections, their locks are reset in child processes before the pools
+# are warmed up, as fork handlers run in the order of registration
+_connections = AfterFork('_reset_locks')
+# Pools to warm up in child processes, see HandlerSocket.warm()
+_warm_after_fork = AfterFork('_warm_child')
 
 
 class ReadSocket(HandlerSocket):
-    """HandlerSocket client for read operations."""
+    """HandlerSocket client for read operations.
 
-    def find(self, index_id, operation, columns, limit=0, offset=0):
+    Reads may be hedged: if a :class:`~.hedging.HedgePolicy` is given and the
+    server doesn't respond within the policy delay, the same request is sent to
+    another server and the first response is used. Connection of the other
+    server is closed, so its late response can't delay later requests.
+    """
+
+    def __init__(self, servers, debug=False, connect_stagger=None,
+                 concurrency_limits=None, recorder=None, hooks=None, keepalive=None,
+                 pinger=None, hedge_policy=None):
+        """
+        :param iterable servers: see :class:`~.HandlerSocket`.
+        :param bool debug: enable or disable debug mode, default is ``False``.
+        :param connect_stagger: see :class:`~.HandlerSocket`.
+        :type connect_stagger: number or None
+        :param concurrency_limits: see :class:`~.HandlerSocket`.
+        :type concurrency_limits: :class:`~.limits.ConcurrencyLimits` or None
+        :param recorder: see :class:`~.HandlerSocket`.
+        :type recorder: :class:`~.capture.CaptureRecorder` or None
+        :param hooks: see :class:`~.HandlerSocket`.
+        :type hooks: :class:`~.hooks.Hooks` or None
+        :param keepalive: see :class:`~.HandlerSocket`.
+        :type keepalive: tuple or None
+        :param pinger: see :class:`~.HandlerSocket`.
+        :type pinger: :class:`~.keepalive.IdlePinger` or None
+        :param hedge_policy: optional policy of hedging reads, hedging is
+            disabled by default.
+        :type hedge_policy: :class:`~.hedging.HedgePolicy` or None
+        """
+        super(ReadSocket, self).__init__(servers, debug, connect_stagger, concurrency_limits,
+                                         recorder, hooks, keepalive, pinger)
+        self.hedge_policy = hedge_policy
+
+    def find(self, index_id, operation, columns, limit=0, offset=0,
+             in_values=None, in_column=0, deadline=None):
         """Finds row(s) via opened index.
 
+        Several keys may be looked up at once with ``in_values``, in this case
+        the value of ``columns`` at ``in_column`` position is replaced by each
+        of them in turn (IN clause) and all found rows are returned together.
+
         Raises ``ValueError`` if given data doesn't validate.
 
         :param integer index_id: id of opened index.
@@ -414,23 +1226,161 @@ class ReadSocket(HandlerSocket):
             one row. In case multiple results are expected, ``limit`` must be
             set explicitly, HS wont return all found rows by default.
         :param integer offset: optional offset of rows to search for.
+        :param in_values: optional list of values for the IN clause. ``limit``
+            applies to all found rows, not to each of the values.
+        :type in_values: iterable or None
+        :param integer in_column: position of the column in ``columns`` which
+            ``in_values`` are compared to, first one by default.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the request must complete by, :exc:`~.exceptions.DeadlineExceeded`
+            is raised otherwise.
+        :type deadline: number or None
         :rtype: list
         """
+        query = self._find_query(index_id, operation, columns, limit, offset,
+                                 in_values, in_column)
+
+        if self.hedge_policy is not None and len(self.connections) > 1:
+            return self._hedged_call(index_id, query, deadline)
+
+        response = self._call(index_id, query, force_index=True, deadline=deadline)
+
+        return response
+
+    def find_iter(self, index_id, operation, columns, limit=0, offset=0,
+                  in_values=None, in_column=0, deadline=None):
+        """Same as :meth:`~.find` but returns a generator that yields found rows
+        as soon as they are received instead of building the whole result
+        in memory, so large result sets can be processed row by row.
+
+        The request is sent when iteration starts and the connection stays
+        busy until the generator is exhausted. Closing the generator earlier
+        closes the connection. Hedging isn't applied to streamed requests.
+
+        Raises ``ValueError`` if given data doesn't validate.
+
+        :rtype: generator of tuples
+        """
+        query = list(self._find_query(index_id, operation, columns, limit, offset,
+                                      in_values, in_column))
+
+        return self._call_stream(index_id, query, force_index=True, deadline=deadline)
+
+    def _find_query(self, index_id, operation, columns, limit=0, offset=0,
+                    in_values=None, in_column=0):
+        """Validates arguments of :meth:`~.find` and returns its query tokens.
+        Private method.
+        """
         if operation not in self.FIND_OPERATIONS:
             raise ValueError('Operation is not supported.')
 
         if not check_columns(columns):
             raise ValueError('Columns must be a non-empty iterable.')
 
-        query = chain(
+        return chain(
             (str(index_id), operation, str(len(columns))),
             map(encode, columns),
-            (str(limit), str(offset))
+            (str(limit), str(offset)),
+            in_clause(in_values, in_column)
         )
 
-        response = self._call(index_id, query, force_index=True)
+    @hooked('call')
+    def _hedged_call(self, index_id, query, deadline=None):
+        """Version of :meth:`~._call` that hedges the request according to
+        :attr:`~.hedge_policy`.
+        Private method.
 
-        return response
+        :param integer index_id: id of the index to operate on.
+        :param iterable query: list/iterable of tokens ready for sending.
+        :param deadline: see :meth:`~._call`.
+        :type deadline: number or None
+        :rtype: list
+        """
+        line = '\t'.join(query)
+        data = line + '\n'
+        if self.hooks:
+            self.hooks.annotate(index=self.index_specs.get(index_id),
+                                op=line.split('\t', 2)[1])
+        recording = self.recorder is not None and self.recorder.sample()
+        started = time.time()
+
+        conn = self._get_connection(index_id, True, deadline)
+        with self._limit(conn, deadline):
+            try:
+                conn.send(data, deadline)
+                if not conn.wait_readable(self.hedge_policy.delay(), deadline):
+                    conn = self._hedge(conn, index_id, data, deadline)
+                    # Keep using the faster server, the index is open there too
+                    self.index_map[index_id] = conn
+                raw_data = conn.readline(deadline)
+            except ConnectionError as e:
+                self.purge_index(index_id)
+                raise e
+
+        elapsed = time.time() - started
+        self.hedge_policy.record(elapsed)
+        # Recorded once, whether the request was hedged or not
+        if recording and index_id in self.index_specs:
+            self.recorder.record(self.index_specs[index_id], line, started, elapsed,
+                                 len(raw_data))
+
+        return self._parse_response(raw_data)
+
+    def _hedge(self, primary, index_id, data, deadline=None):
+        """Sends ``data`` to one more server and waits for any of the servers
+        to respond. Returns connection that responded first, the other one is
+        closed, so its late response can't delay next requests sent over it.
+        Private method.
+
+        :param primary: connection the request was sent to originally.
+        :type primary: :class:`~.Connection`
+        :param integer index_id: id of the index to operate on.
+        :param string data: request data.
+        :param deadline: see :meth:`~._call`.
+        :type deadline: number or None
+        :rtype: :class:`~.Connection`
+        """
+        candidates = [conn for conn in self.connections
+                      if conn is not primary and conn.is_ready()]
+        if not candidates:
+            return primary
+        # Prefer connections that don't need connecting or index opening
+        candidates.sort(key=lambda conn: (not conn.socket, index_id not in conn.indexes))
+        secondary = candidates[0]
+
+        opening = index_id not in secondary.indexes
+        try:
+            secondary.connect(deadline)
+            if opening:
+                line = '\t'.join(self._open_query(index_id, *self.index_specs[index_id]))
+                secondary.send(line + '\n', deadline)
+            secondary.send(data, deadline)
+            readable = wait_for_sockets([primary.socket, secondary.socket],
+                                        timeout=primary._timeout(deadline))[0]
+        except DeadlineExceeded:
+            # Responses of both servers are pending, neither can be reused
+            secondary.disconnect()
+            primary.disconnect()
+            raise
+        except (ConnectionError, socket.error, ValueError):
+            secondary.disconnect()
+            return primary
+
+        if primary.socket in readable or secondary.socket not in readable:
+            secondary.disconnect()
+            return primary
+
+        if opening:
+            try:
+                self._parse_response(secondary.readline(deadline))
+                secondary.indexes[index_id] = line
+            except (ConnectionError, OperationalError):
+                secondary.disconnect()
+                return primary
+
+        # Indexes open on the primary are reopened when it's used again
+        primary.disconnect()
+        return secondary
 
 
 class WriteSocket(HandlerSocket):
@@ -439,12 +1389,17 @@ class WriteSocket(HandlerSocket):
     MODIFY_OPERATIONS = ('U', 'D', '+', '-', 'U?', 'D?', '+?', '-?')
 
     def find_modify(self, index_id, operation, columns, modify_operation,
-                    modify_columns=[], limit=0, offset=0):
+                    modify_columns=[], limit=0, offset=0, in_values=None,
+                    in_column=0, deadline=None):
         """Updates/deletes row(s) using opened index.
 
         Returns number of modified rows or a list of original values in case
         ``modify_operation`` ends with ``?``.
 
+        Rows of several keys may be modified at once with ``in_values``, see
+        :meth:`~.ReadSocket.find`. Returned number or original values cover
+        all of them.
+
         Raises ``ValueError`` if given data doesn't validate.
 
         :param integer index_id: id of opened index.
@@ -463,8 +1418,57 @@ class WriteSocket(HandlerSocket):
             one row. In case multiple rows are expected to be changed, ``limit``
             must be set explicitly, HS wont change all found rows by default.
         :param integer offset: optional offset of rows to search for.
+        :param in_values: optional list of values for the IN clause. ``limit``
+            applies to all found rows, not to each of the values.
+        :type in_values: iterable or None
+        :param integer in_column: position of the column in ``columns`` which
+            ``in_values`` are compared to, first one by default.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the request must complete by, :exc:`~.exceptions.DeadlineExceeded`
+            is raised otherwise.
+        :type deadline: number or None
         :rtype: list
 
+        """
+        query = self._find_modify_query(index_id, operation, columns, modify_operation,
+                                        modify_columns, limit, offset, in_values,
+                                        in_column)
+
+        response = self._call(index_id, query, force_index=True, deadline=deadline)
+
+        return response
+
+    def find_modify_many(self, index_id, requests, deadline=None):
+        """Pipelined version of :meth:`~.find_modify`, sends all ``requests``
+        in a single round trip.
+
+        Returns a list of results ordered as ``requests``. Failed requests have
+        an :exc:`~.exceptions.OperationalError` instance in place of the result.
+
+        Raises ``ValueError`` if any of given requests doesn't validate, nothing
+        is sent in that case.
+
+        :param integer index_id: id of opened index.
+        :param iterable requests: list of argument tuples of :meth:`~.find_modify`
+            except ``index_id``:
+            ``(operation, columns, modify_operation[, modify_columns[, limit[, offset[, in_values[, in_column]]]]])``.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole batch must complete by.
+        :type deadline: number or None
+        :rtype: list
+        """
+        queries = [list(self._find_modify_query(index_id, *request))
+                   for request in requests]
+
+        return self._call_many(index_id, queries, force_index=True, deadline=deadline)
+
+    def _find_modify_query(self, index_id, operation, columns, modify_operation,
+                           modify_columns=[], limit=0, offset=0, in_values=None,
+                           in_column=0):
+        """Validates :meth:`~.find_modify` arguments and builds a query out of them.
+        Private method.
+
+        :rtype: iterable
         """
         if operation not in self.FIND_OPERATIONS \
                 or modify_operation not in self.MODIFY_OPERATIONS:
@@ -480,15 +1484,15 @@ class WriteSocket(HandlerSocket):
         query = chain(
             (str(index_id), operation, str(len(columns))),
             map(encode, columns),
-            (str(limit), str(offset), modify_operation),
+            (str(limit), str(offset)),
+            in_clause(in_values, in_column),
+            (modify_operation,),
             map(encode, modify_columns)
         )
 
-        response = self._call(index_id, query, force_index=True)
+        return query
 
-        return response
-
-    def insert(self, index_id, columns):
+    def insert(self, index_id, columns, deadline=None):
         """Inserts single row using opened index.
 
         Raises ``ValueError`` if given data doesn't validate.
@@ -496,16 +1500,51 @@ class WriteSocket(HandlerSocket):
         :param integer index_id: id of opened index.
         :param list columns: list of column values for insertion. List must be
             ordered in the same way as columns are defined in opened index.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the request must complete by, :exc:`~.exceptions.DeadlineExceeded`
+            is raised otherwise.
+        :type deadline: number or None
         :rtype: bool
         """
+        query = self._insert_query(index_id, columns)
+
+        self._call(index_id, query, force_index=True, deadline=deadline)
+
+        return True
+
+    def insert_many(self, index_id, rows, deadline=None):
+        """Pipelined version of :meth:`~.insert`, sends all ``rows`` in a single
+        round trip.
+
+        Returns a list of results ordered as ``rows``: ``True`` for inserted
+        rows and an :exc:`~.exceptions.OperationalError` instance for rows that
+        failed on the server side (e.g. duplicate keys).
+
+        Raises ``ValueError`` if any of given rows doesn't validate, nothing
+        is sent in that case.
+
+        :param integer index_id: id of opened index.
+        :param iterable rows: list of lists of column values, see :meth:`~.insert`.
+        :param deadline: optional time as returned by :func:`time.monotonic`
+            the whole batch must complete by.
+        :type deadline: number or None
+        :rtype: list
+        """
+        queries = [list(self._insert_query(index_id, columns)) for columns in rows]
+
+        responses = self._call_many(index_id, queries, force_index=True, deadline=deadline)
+
+        return [response if isinstance(response, OperationalError) else True
+                for response in responses]
+
+    def _insert_query(self, index_id, columns):
+        """Validates arguments of :meth:`~.insert` and returns its query tokens.
+        Private method.
+        """
         if not check_columns(columns):
             raise ValueError('Columns must be a non-empty iterable.')
 
-        query = chain(
+        return chain(
             (str(index_id), '+', str(len(columns))),
             map(encode, columns)
         )
-
-        self._call(index_id, query, force_index=True)
-
-        return True
@@ -1,11 +1,24 @@
 """Utility functions needed for client operation.
 Should not be used externally.
 """
+import logging
+import math
+import os
+import select
+import weakref
 from functools import wraps
+from itertools import chain
 
 from .exceptions import RecoverableConnectionError
 
 
+log = logging.getLogger(__name__)
+
+# Bounds of integer keys: the lowest signed and the highest unsigned BIGINT
+MIN_KEY = '-9223372036854775808'
+MAX_KEY = '18446744073709551615'
+
+
 def encode(value):
     """Encodes ``value`` for sending to HS according to the protocol.
     Each character within [0x00, 0x0f] range must be added to 0x40.
@@ -66,6 +79,23 @@ def check_columns(columns):
         return False
     return True
 
+def in_clause(values, column=0):
+    """Helper function that builds IN clause tokens of a find request.
+    Returns an empty tuple if no ``values`` are given.
+
+    :param values: values to look up.
+    :type values: iterable or None
+    :param integer column: position of the index column to compare to.
+    :rtype: iterable
+    """
+    if values is None:
+        return ()
+
+    if not check_columns(values):
+        raise ValueError('IN values must be a non-empty iterable.')
+
+    return chain(('@', str(column), str(len(values))), map(encode, values))
+
 def retry_on_failure(func):
     """This decorator catches :exc:`~.exceptions.IndexedConnectionError`
     exception and retries the function once more to try reopening the index
@@ -79,3 +109,91 @@ def retry_on_failure(func):
             result = func(*args, **kwargs)
         return result
     return wrapper
+
+def parse_address(address):
+    """Helper function that converts a ``host:port`` or ``unix:/path/to/socket``
+    string into a server definition tuple accepted by
+    :class:`~.sockets.HandlerSocket`.
+
+    :param string address: address to parse.
+    :rtype: tuple
+    """
+    if address.startswith('unix:'):
+        return ('unix', address[5:])
+
+    host, separator, port = address.rpartition(':')
+    if not separator or not host or not port.isdigit():
+        raise ValueError('Address must be "host:port" or "unix:path", got "%s"' % address)
+    return ('inet', host, int(port))
+
+def wait_for_sockets(readable=(), writable=(), timeout=None):
+    """Helper function that waits until any of the sockets becomes readable
+    or writable, like :func:`select.select`, but isn't limited to file
+    descriptors below ``FD_SETSIZE``. Sockets that were closed or had an
+    error are returned as ready, so the following call on them fails.
+    Raises :exc:`ValueError` if any of the sockets is closed locally.
+
+    :param iterable readable: sockets to wait for readability.
+    :param iterable writable: sockets to wait for writability.
+    :param timeout: max number of seconds to wait, ``None`` waits forever.
+    :type timeout: number or None
+    :rtype: tuple of lists of ready sockets
+    """
+    if not hasattr(select, 'poll'):
+        return select.select(readable, writable, [], timeout)[:2]
+
+    sockets = {}
+    for sock in readable:
+        sockets[sock.fileno()] = (sock, select.POLLIN)
+    for sock in writable:
+        fd = sock.fileno()
+        sockets[fd] = (sock, sockets.get(fd, (sock, 0))[1] | select.POLLOUT)
+    poller = select.poll()
+    for fd, (sock, events) in sockets.items():
+        poller.register(fd, events)
+
+    if timeout is not None:
+        timeout = math.ceil(max(timeout, 0) * 1000)
+    failed = select.POLLERR | select.POLLHUP | select.POLLNVAL
+    ready_to_read, ready_to_write = [], []
+    for fd, events in poller.poll(timeout):
+        sock, registered = sockets[fd]
+        if registered & select.POLLIN and events & (select.POLLIN | failed):
+            ready_to_read.append(sock)
+        if registered & select.POLLOUT and events & (select.POLLOUT | failed):
+            ready_to_write.append(sock)
+    return ready_to_read, ready_to_write
+
+
+class AfterFork(object):
+    """Helper class that calls ``method`` of registered objects in forked
+    child processes, e.g. to replace locks and threads the child inherits but
+    can't use. Objects are called in the order of registration and tracked with
+    weak references. A failure of one object is logged and doesn't affect the
+    others. Does nothing on platforms without :func:`os.register_at_fork`.
+    """
+
+    def __init__(self, method):
+        """
+        :param string method: name of the method to call.
+        """
+        self.method = method
+        self.objects = weakref.WeakKeyDictionary()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def add(self, obj, *args):
+        """Registers ``obj``, its method is called with ``args`` after fork.
+        Registering it again replaces the arguments.
+        """
+        self.objects[obj] = args
+
+    def _after_fork_in_child(self):
+        """Calls the method of all registered objects.
+        Private method.
+        """
+        for obj, args in list(self.objects.items()):
+            try:
+                getattr(obj, self.method)(*args)
+            except Exception:
+                log.exception('Failed to prepare %r after fork', obj)
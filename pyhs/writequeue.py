@@ -0,0 +1,384 @@
+"""Asynchronous inserts through a bounded background queue."""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from .exceptions import ConnectionError, OperationalError
+from .utils import AfterFork, decode, encode
+
+
+log = logging.getLogger(__name__)
+
+POLICIES = ('block', 'drop', 'spill')
+
+
+class WriteQueue(object):
+    """Inserts rows in the background, so callers don't wait for the server.
+
+    Rows are put in a queue of :attr:`~.max_size` items and inserted by
+    :attr:`~.workers` threads, each with its own connection of the manager
+    write socket. A worker takes up to :attr:`~.batch_size` queued rows and
+    inserts rows of the same index in a single pipelined round trip, see
+    :meth:`~.sockets.WriteSocket.insert_many`.
+
+    When the queue is full, :attr:`~.policy` decides what happens to a new row:
+
+    * ``block`` - the caller waits for a free slot;
+    * ``drop`` - the row is discarded;
+    * ``spill`` - the row is appended to the :attr:`~.spill_path` file, spilled
+      rows are inserted once the queue is empty again. Rows left in the file
+      by a previous process are inserted too.
+
+    Rows are inserted in no particular order. Rows rejected by the server and
+    rows of batches that failed on connection errors are logged and counted
+    as failed, they aren't retried, as it's unknown which rows of a batch the
+    server applied before the connection failed.
+
+    Queued rows are flushed on :meth:`~.close`, which is also called when the
+    interpreter exits.
+
+    Workers are started again in forked child processes, rows queued by the
+    parent aren't inherited. A queue with the ``spill`` policy is closed in the
+    child as the spill file can't be shared, create a queue with another spill
+    file there.
+    """
+
+    MAX_SIZE = 10000
+    WORKERS = 2
+    BATCH_SIZE = 100
+    CLOSE_TIMEOUT = 10
+
+    def __init__(self, manager, max_size=None, workers=None, batch_size=None,
+                 policy='block', spill_path=None):
+        """
+        :param manager: manager to insert rows with.
+        :type manager: :class:`~.manager.Manager`
+        :param max_size: max number of queued rows, default is defined in
+            :const:`~.MAX_SIZE`.
+        :type max_size: integer or None
+        :param workers: number of worker threads, default is defined in
+            :const:`~.WORKERS`.
+        :type workers: integer or None
+        :param batch_size: max number of rows inserted in a single round trip,
+            default is defined in :const:`~.BATCH_SIZE`.
+        :type batch_size: integer or None
+        :param string policy: what to do with rows when the queue is full,
+            one of :const:`~.POLICIES`.
+        :param spill_path: path of the file to spill rows to, required by the
+            ``spill`` policy.
+        :type spill_path: string or None
+        """
+        if policy not in POLICIES:
+            raise ValueError('Policy "%s" is not supported.' % policy)
+        if policy == 'spill' and not spill_path:
+            raise ValueError('Spill policy requires a spill file path.')
+
+        self.manager = manager
+        self.max_size = max_size or self.MAX_SIZE
+        self.workers = workers or self.WORKERS
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.policy = policy
+        self.spill_path = spill_path
+
+        self.queue = queue.Queue(self.max_size)
+        self.condition = threading.Condition()
+        self.spill_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.closed = False
+        self.replaying = False
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.lag = 0
+
+        self.spill_file = None
+        if spill_path:
+            self.spill_file = open(spill_path, 'a')
+            replay_path = spill_path + '.replay'
+            if os.path.exists(replay_path):
+                # Replay of a previous process was interrupted
+                with open(replay_path) as stream:
+                    self.spill_file.writelines(stream)
+                self.spill_file.flush()
+                os.remove(replay_path)
+            with open(spill_path) as stream:
+                self.spilled = self.pending = sum(1 for line in stream)
+
+        self._start_workers()
+        atexit.register(self.close, self.CLOSE_TIMEOUT)
+        _queues.add(self)
+
+    def _start_workers(self):
+        """Starts the worker threads.
+        Private method.
+        """
+        self.threads = [threading.Thread(target=self._work, name='pyhs-write-queue')
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def _restart_in_child(self):
+        """Replaces the queue, locks and workers that a forked child inherits
+        but doesn't run. Rows queued by the parent are left to it.
+        Private method.
+        """
+        self.queue = queue.Queue(self.max_size)
+        self.condition = threading.Condition()
+        self.spill_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.replaying = False
+        self.pending = self.spilled = 0
+        self.threads = []
+
+        if self.spill_file is not None:
+            # Both processes would replay the same file
+            self.spill_file = None
+            self.closed = True
+        if self.closed:
+            self.stopped.set()
+            atexit.unregister(self.close)
+        else:
+            self._start_workers()
+
+    def insert(self, db, table, fields, index_name=None):
+        """Queues a row to insert, see :meth:`~.manager.Manager.insert`.
+        Returns ``False`` if the row was dropped as the queue is full.
+        Raises :exc:`~.exceptions.OperationalError` if the queue is closed.
+
+        :param string db: database name.
+        :param string table: table name.
+        :param fields: list of (column, value) pairs to insert into the ``table``.
+        :type fields: list of lists
+        :param index_name: name of the index to open, default is ``PRIMARY``.
+        :type index_name: string or None
+        :rtype: bool
+        """
+        keys, values = list(zip(*fields))
+        item = ((db, table, keys, index_name), values, time.time())
+
+        with self.condition:
+            if self.closed:
+                raise OperationalError('Write queue is closed.')
+            self.pending += 1
+
+        try:
+            self.queue.put(item, self.policy == 'block')
+            return True
+        except queue.Full:
+            if self.policy == 'spill':
+                self._spill([item])
+                return True
+
+        with self.condition:
+            self.dropped += 1
+        self._done(1)
+        return False
+
+    def _work(self):
+        """Worker thread loop that inserts queued and spilled rows.
+        Private method.
+        """
+        self._replay()
+        stop = False
+        while not stop and not self.stopped.is_set():
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            # Once closed, spilled rows are left to the next queue
+            if self.spilled and self.queue.empty() and not self.stopped.is_set():
+                self._replay()
+
+    def _write(self, batch):
+        """Inserts a batch of queued rows, grouped by index.
+        Private method.
+        """
+        groups = {}
+        for target, values, queued in batch:
+            groups.setdefault(target, []).append(values)
+
+        socket = self.manager.write_socket
+        failed = 0
+        for (db, table, keys, index_name), rows in groups.items():
+            try:
+                index_id = socket.get_index_id(db, table, keys, index_name)
+                results = socket.insert_many(index_id, rows)
+            except (ConnectionError, OperationalError) as e:
+                results = [e] * len(rows)
+            except Exception:
+                # Worker must survive anything, otherwise the queue would fill up
+                log.exception('%d rows not inserted into %s.%s', len(rows), db, table)
+                failed += len(rows)
+                continue
+
+            errors = [result for result in results if result is not True]
+            if errors:
+                failed += len(errors)
+                log.warning('%d of %d rows not inserted into %s.%s: %s', len(errors),
+                            len(rows), db, table, errors[0])
+
+        with self.condition:
+            self.written += len(batch) - failed
+            self.failed += failed
+            self.lag = time.time() - min(queued for target, values, queued in batch)
+        self._done(len(batch))
+
+    def _done(self, count):
+        """Accounts ``count`` rows as no longer pending.
+        Private method.
+        """
+        with self.condition:
+            self.pending -= count
+            if not self.pending:
+                self.condition.notify_all()
+
+    def _spill(self, items):
+        """Appends queued items to the spill file.
+        Private method.
+        """
+        lines = []
+        for (db, table, keys, index_name), values, queued in items:
+            tokens = [repr(queued), db, table, index_name or '', ','.join(keys)]
+            lines.append('\t'.join(map(encode, tokens + list(values))) + '\n')
+
+        with self.spill_lock:
+            self.spill_file.write(''.join(lines))
+            self.spill_file.flush()
+            self.spilled += len(items)
+
+    def _replay(self):
+        """Inserts rows from the spill file until it's empty. Rows spilled
+        meanwhile go to a new file. Only one worker replays at a time.
+        Private method.
+        """
+        while self.spill_file is not None:
+            with self.spill_lock:
+                if not self.spilled or self.replaying:
+                    return
+                self.replaying = True
+                count = self.spilled
+                self.spill_file.close()
+                replay_path = self.spill_path + '.replay'
+                os.rename(self.spill_path, replay_path)
+                self.spill_file = open(self.spill_path, 'a')
+                self.spilled = 0
+
+            try:
+                batch = []
+                with open(replay_path) as stream:
+                    for line in stream:
+                        tokens = list(map(decode, line.rstrip('\n').split('\t')))
+                        queued, db, table, index_name, keys = tokens[:5]
+                        batch.append(((db, table, tuple(keys.split(',')), index_name or None),
+                                      tuple(tokens[5:]), float(queued)))
+                        if len(batch) == self.batch_size:
+                            self._write(batch)
+                            count -= len(batch)
+                            batch = []
+                if batch:
+                    self._write(batch)
+                    count -= len(batch)
+                os.remove(replay_path)
+            finally:
+                if count:
+                    # Rows that couldn't be read are lost
+                    self._done(count)
+                with self.spill_lock:
+                    self.replaying = False
+
+    def stats(self):
+        """Returns queue metrics: ``depth`` (number of rows in the queue),
+        ``spilled`` (number of rows in the spill file), ``pending`` (rows not
+        inserted yet, including ones being inserted), numbers of ``written``,
+        ``failed`` and ``dropped`` rows and ``lag`` (number of seconds the
+        oldest row of the last inserted batch spent waiting).
+
+        :rtype: dict
+        """
+        with self.condition:
+            return {
+                'depth': self.queue.qsize(),
+                'spilled': self.spilled,
+                'pending': self.pending,
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'lag': self.lag,
+            }
+
+    def flush(self, timeout=None):
+        """Waits until all queued and spilled rows are inserted (or failed).
+        Returns ``False`` if that didn't happen within ``timeout`` seconds.
+
+        :param timeout: max number of seconds to wait, unlimited by default.
+        :type timeout: number or None
+        :rtype: bool
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending, timeout)
+
+    def close(self, timeout=None):
+        """Stops accepting rows, flushes the queue and stops the workers.
+        Returns ``False`` if rows were left unflushed after ``timeout`` seconds,
+        with the ``spill`` policy queued rows are spilled then, so they are
+        inserted by the next queue that uses the spill file.
+
+        :param timeout: max number of seconds to wait, unlimited by default.
+        :type timeout: number or None
+        :rtype: bool
+        """
+        with self.condition:
+            if self.closed and self.stopped.is_set():
+                return not self.pending
+            self.closed = True
+
+        flushed = self.flush(timeout)
+        self.stopped.set()
+        if not flushed and self.spill_file is not None:
+            items = []
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    items.append(item)
+            if items:
+                self._spill(items)
+
+        for thread in self.threads:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+        if flushed:
+            for thread in self.threads:
+                thread.join()
+
+        with self.spill_lock:
+            if self.spill_file is not None and not self.replaying:
+                self.spill_file.close()
+        atexit.unregister(self.close)
+        return flushed
+
+
+# Queues to restart in child processes
+_queues = AfterFork('_restart_in_child')
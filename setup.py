@@ -63,6 +63,14 @@ def run_setup(with_binary):
             'Topic :: Database',
         ],
 
+        entry_points = {
+            'console_scripts': [
+                'pyhs-export = pyhs.export:main',
+                'pyhs-load = pyhs.load:main',
+                'pyhs-replay = pyhs.replay:main',
+            ],
+        },
+
         cmdclass={'build_ext': ve_build_ext},
         features=features,
     )
@@ -0,0 +1,232 @@
+"""In-memory HandlerSocket server and helpers used by the tests.
+
+Only the subset of the protocol the client library uses is implemented:
+opening indexes, inserts, look ups with comparison operators, limits, offsets
+and IN clauses, and modification of found rows. Every index is keyed by
+a single column, ``id`` for ``PRIMARY`` and the index name otherwise, integer
+keys sort numerically. Rows are stored by ``id``.
+"""
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+import warnings
+
+import pytest
+
+from pyhs import Manager
+
+
+FIELDS = ['id', 'name']
+
+
+def encode(value):
+    if value is None:
+        return '\0'
+    return ''.join('\x01' + chr(ord(c) | 0x40) if c <= '\x0f' else c for c in value)
+
+
+def decode(value):
+    if value == '\0':
+        return None
+    chars = iter(value)
+    return ''.join(chr(ord(next(chars)) ^ 0x40) if c == '\x01' else c for c in chars)
+
+
+def sort_key(value):
+    try:
+        return (0, int(value))
+    except (TypeError, ValueError):
+        return (1, value)
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connects += 1
+            server.clients.add(self.request)
+        indexes = {}
+        try:
+            for line in self.rfile:
+                with server.lock:
+                    server.requests += 1
+                if server.delay:
+                    time.sleep(server.delay)
+                tokens = line.decode().rstrip('\n').split('\t')
+                try:
+                    response = self.process(indexes, tokens)
+                except Exception as e:
+                    response = ['2', '1', 'error_%s' % e]
+                self.wfile.write(('\t'.join(response) + '\n').encode())
+        except OSError:
+            pass
+        finally:
+            with server.lock:
+                server.clients.discard(self.request)
+
+    def process(self, indexes, tokens):
+        server = self.server
+        if tokens[0] == 'P':
+            index_id, db, table, index_name, fields = tokens[1:6]
+            if (db, table) in server.missing:
+                return ['1', '1', 'open_table']
+            key = 'id' if index_name == 'PRIMARY' else index_name
+            indexes[index_id] = (server.table(db, table), key, fields.split(','))
+            return ['0', '1']
+
+        if tokens[0] not in indexes:
+            return ['2', '1', 'stmtnum']
+        rows, key, fields = indexes[tokens[0]]
+        operation, count = tokens[1], int(tokens[2])
+        values = list(map(decode, tokens[3:3 + count]))
+        rest = tokens[3 + count:]
+
+        if operation == '+':
+            row = dict(zip(fields, values))
+            with server.lock:
+                if row.get(key) in rows:
+                    return ['1', '1', '121']
+                rows[row.get(key)] = row
+            return ['0', '1']
+
+        limit, offset = list(map(int, rest[:2])) or [1, 0]
+        rest = rest[2:]
+        starts = values[:1]
+        if rest and rest[0] == '@':
+            # IN clause replaces the first value of the key
+            count = int(rest[2])
+            starts = list(map(decode, rest[3:3 + count]))
+            rest = rest[3 + count:]
+
+        compare = {
+            '=': lambda value, start: value == start,
+            '>': lambda value, start: value > start,
+            '>=': lambda value, start: value >= start,
+            '<': lambda value, start: value < start,
+            '<=': lambda value, start: value <= start,
+        }[operation]
+        with server.lock:
+            ordered = sorted(rows.values(), key=lambda row: sort_key(row.get(key)))
+            if operation.startswith('<'):
+                ordered.reverse()
+            found = []
+            for start in map(sort_key, starts):
+                found.extend(row for row in ordered
+                             if compare(sort_key(row.get(key)), start))
+            # Zero limit means one row, as in HandlerSocket
+            found = found[offset:offset + (limit or 1)]
+            if rest:
+                return self.modify(rows, fields, found, rest[0],
+                                   list(map(decode, rest[1:])))
+        return self.respond(fields, found)
+
+    def modify(self, rows, fields, found, operation, values):
+        original = [dict(row) for row in found]
+        for row in found:
+            if operation.startswith('D'):
+                del rows[row['id']]
+                continue
+            for field, value in zip(fields, values):
+                if operation.startswith('U'):
+                    row[field] = value
+                elif operation.startswith('+'):
+                    row[field] = str(int(row.get(field) or 0) + int(value))
+                else:
+                    row[field] = str(int(row.get(field) or 0) - int(value))
+            if row['id'] not in rows:
+                # Key was updated
+                rows[row['id']] = rows.pop(next(
+                    old for old, other in rows.items() if other is row))
+        if operation.endswith('?'):
+            return self.respond(fields, original)
+        return ['0', '1', str(len(found))]
+
+    def respond(self, fields, rows):
+        response = ['0', str(len(fields))]
+        for row in rows:
+            response.extend(encode(row.get(field)) for field in fields)
+        return response
+
+
+class FakeServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.data = {}
+        self.missing = set()
+        self.delay = 0
+        self.connects = 0
+        self.requests = 0
+        self.clients = set()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return ('inet',) + self.server_address
+
+    def table(self, db, table):
+        with self.lock:
+            return self.data.setdefault((db, table), {})
+
+    def fill(self, keys, db='db', table='t'):
+        """Adds rows with ``id`` and ``name`` fields for given keys."""
+        rows = self.table(db, table)
+        with self.lock:
+            for key in keys:
+                rows[str(key)] = {'id': str(key), 'name': 'name%s' % key}
+
+    def drop_connections(self):
+        """Closes all client connections, as a restarted server would."""
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        self.shutdown()
+        self.drop_connections()
+        self.server_close()
+
+
+def run_in_child(func):
+    """Runs ``func`` in a forked child and returns whether it returned true."""
+    with warnings.catch_warnings():
+        # Forking a process with threads is exactly what is tested
+        warnings.simplefilter('ignore', DeprecationWarning)
+        pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            signal.alarm(10)
+            code = 0 if func() else 1
+        finally:
+            os._exit(code)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+fork_only = pytest.mark.skipif(not hasattr(os, 'register_at_fork'),
+                               reason='fork hooks are not supported')
+
+
+@pytest.fixture
+def server():
+    server = FakeServer()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def manager(server):
+    return Manager([server.address], [server.address])
@@ -0,0 +1,82 @@
+import pytest
+
+from conftest import FIELDS
+from pyhs.exceptions import ConnectionError, OperationalError
+from pyhs.sockets import Connection
+
+
+def test_mixed_operations(server, manager):
+    server.fill(range(5))
+    with manager.batch() as batch:
+        got = batch.get('db', 't', FIELDS, '1')
+        found = batch.find('db', 't', '>=', FIELDS, ['1'], limit=2)
+        inserted = batch.insert('db', 't', [('id', '10'), ('name', 'ten')])
+        duplicate = batch.insert('db', 't', [('id', '2'), ('name', 'two')])
+        updated = batch.update('db', 't', '=', FIELDS, ['0'], ['0', 'zero'])
+        deleted = batch.delete('db', 't', '=', FIELDS, ['4'], return_original=True)
+
+    assert got.result() == [('id', '1'), ('name', 'name1')]
+    assert found.result() == [[('id', '1'), ('name', 'name1')],
+                              [('id', '2'), ('name', 'name2')]]
+    assert inserted.result() is True
+    with pytest.raises(OperationalError):
+        duplicate.result()
+    assert updated.result() == 1
+    assert deleted.result() == [[('id', '4'), ('name', 'name4')]]
+    assert sorted(server.table('db', 't')) == ['0', '1', '10', '2', '3']
+    assert server.table('db', 't')['0']['name'] == 'zero'
+
+
+def test_result_before_execute(server, manager):
+    batch = manager.batch()
+    deferred = batch.get('db', 't', FIELDS, '1')
+    assert not deferred.done()
+    with pytest.raises(OperationalError):
+        deferred.result()
+
+
+def test_connection_error_fails_the_group(server, manager):
+    server.fill([1])
+    batch = manager.batch()
+    first = batch.get('db', 't', FIELDS, '1')
+    second = batch.get('db', 't', FIELDS, '1')
+    server.stop()
+
+    batch.execute()
+
+    for deferred in (first, second):
+        with pytest.raises(ConnectionError):
+            deferred.result()
+
+
+def test_unexpected_error_resolves_everything(server, manager, monkeypatch):
+    server.fill([1])
+    batch = manager.batch()
+    first = batch.get('db', 't', FIELDS, '1')
+    second = batch.get('db', 't', FIELDS, '1')
+
+    def broken(self, deadline=None):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(Connection, 'readline', broken)
+    with pytest.raises(RuntimeError):
+        batch.execute()
+    monkeypatch.undo()
+
+    for deferred in (first, second):
+        with pytest.raises(OperationalError):
+            deferred.result()
+    # Connection with unread responses was dropped
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+
+
+def test_written_keys_are_added_to_bloom_filter(server, manager, tmp_path):
+    server.fill([1])
+    manager.enable_bloom_filter('db', 't', 'id', str(tmp_path / 'filter'),
+                                capacity=1000, build=True)
+    with manager.batch() as batch:
+        batch.insert('db', 't', [('id', '2'), ('name', 'two')])
+        batch.update('db', 't', '=', FIELDS, ['1'], ['3', 'three'])
+
+    assert manager.get('db', 't', FIELDS, '2') == [('id', '2'), ('name', 'two')]
+    assert manager.get('db', 't', FIELDS, '3') == [('id', '3'), ('name', 'three')]
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from conftest import FIELDS
+from pyhs.exceptions import OperationalError
+
+
+def get_concurrently(manager, keys, table='t'):
+    barrier = threading.Barrier(len(keys))
+    results = {}
+
+    def get(key):
+        barrier.wait()
+        try:
+            results[key] = manager.get('db', table, FIELDS, key)
+        except OperationalError as e:
+            results[key] = e
+
+    threads = [threading.Thread(target=get, args=(key,)) for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_gets_share_a_request(server, manager):
+    server.fill(range(10))
+    manager.enable_batching(window=0.5)
+
+    results = get_concurrently(manager, [str(key) for key in range(8)] + ['missing'])
+
+    for key in range(8):
+        assert results[str(key)] == [('id', str(key)), ('name', 'name%d' % key)]
+    assert results['missing'] == []
+    # Index is opened by the leader, then a single IN clause look up is sent
+    assert server.requests == 2
+
+
+def test_full_batch_is_sent_early(server, manager):
+    server.fill(range(4))
+    manager.enable_batching(window=10, max_keys=4)
+
+    start = time.monotonic()
+    results = get_concurrently(manager, ['0', '1', '2', '3'])
+
+    assert time.monotonic() - start < 5
+    assert sorted(results) == ['0', '1', '2', '3']
+    assert results['3'] == [('id', '3'), ('name', 'name3')]
+
+
+def test_errors_reach_every_caller(server, manager):
+    server.missing.add(('db', 'missing'))
+    manager.enable_batching(window=0.2)
+
+    results = get_concurrently(manager, ['0', '1', '2'], table='missing')
+
+    assert all(isinstance(result, OperationalError) for result in results.values())
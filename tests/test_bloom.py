@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from conftest import FIELDS
+from pyhs import Manager
+from pyhs.bloom import BloomFilter
+from pyhs.exceptions import OperationalError
+
+
+class ScanHook(object):
+    """Read socket that calls ``hook`` before the first page of a scan."""
+
+    def __init__(self, read_socket, hook):
+        self.read_socket = read_socket
+        self.hook = hook
+
+    def get_index_id(self, *args):
+        return self.read_socket.get_index_id(*args)
+
+    def find(self, *args):
+        if self.hook is not None:
+            self.hook()
+            self.hook = None
+        return self.read_socket.find(*args)
+
+
+def test_build_adds_all_keys(server, manager, tmp_path):
+    server.fill(range(25))
+    bloom_filter = BloomFilter(str(tmp_path / 'filter'), capacity=1000)
+    assert not bloom_filter.built
+
+    assert bloom_filter.build(manager.read_socket, 'db', 't', 'id', page_size=10) == 25
+
+    assert bloom_filter.built
+    assert all(str(key) in bloom_filter for key in range(25))
+    false_positives = sum(str(key) in bloom_filter for key in range(1000, 2000))
+    assert false_positives < 50
+    assert os.listdir(str(tmp_path)) == ['filter']
+
+
+def test_unbuilt_filter_rules_nothing_out(tmp_path):
+    bloom_filter = BloomFilter(str(tmp_path / 'filter'), capacity=1000)
+    assert 'missing' in bloom_filter
+
+
+def test_enable_refuses_unbuilt_file(server, manager, tmp_path):
+    path = str(tmp_path / 'filter')
+    with pytest.raises(OperationalError):
+        manager.enable_bloom_filter('db', 't', 'id', path, capacity=1000)
+    assert not manager.bloom_filters
+
+    server.fill([1])
+    manager.enable_bloom_filter('db', 't', 'id', path, capacity=1000, build=True)
+    other = Manager([server.address], [server.address])
+    other.enable_bloom_filter('db', 't', 'id', path, capacity=1000)
+
+
+def test_get_skips_ruled_out_keys(server, manager, tmp_path):
+    server.fill([1])
+    manager.enable_bloom_filter('db', 't', 'id', str(tmp_path / 'filter'),
+                                capacity=1000, build=True)
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+
+    requests = server.requests
+    assert manager.get('db', 't', FIELDS, 'missing') == []
+    assert server.requests == requests
+
+    # Keys inserted through the manager are added to the filter
+    manager.insert('db', 't', [('id', 'new'), ('name', 'value')])
+    assert manager.get('db', 't', FIELDS, 'new') == [('id', 'new'), ('name', 'value')]
+
+
+def test_rebuild_is_seen_by_other_handles(server, manager, tmp_path):
+    path = str(tmp_path / 'filter')
+    server.fill(range(10))
+    bloom_filter = BloomFilter(path, capacity=1000)
+    bloom_filter.build(manager.read_socket, 'db', 't', 'id')
+    other = BloomFilter(path, capacity=1000)
+
+    # Written by another client, unknown until the rebuild
+    server.fill(['added'])
+    assert 'added' not in other
+    bloom_filter.build(manager.read_socket, 'db', 't', 'id')
+
+    assert 'added' in other
+    assert all(str(key) in other for key in range(10))
+    assert os.listdir(str(tmp_path)) == ['filter']
+
+
+def test_keys_added_during_rebuild_are_kept(server, manager, tmp_path):
+    path = str(tmp_path / 'filter')
+    server.fill(range(10))
+    bloom_filter = BloomFilter(path, capacity=1000)
+    other = BloomFilter(path, capacity=1000)
+
+    def add():
+        # Another client inserts a key the scan has already passed
+        bloom_filter.add('concurrent')
+        other.add('other')
+
+    bloom_filter.build(ScanHook(manager.read_socket, add), 'db', 't', 'id', page_size=3)
+
+    for handle in (bloom_filter, other):
+        assert 'concurrent' in handle and 'other' in handle
+    assert all(str(key) in other for key in range(10))
+    assert os.listdir(str(tmp_path)) == ['filter']
+
+
+def test_build_is_abandoned_for_a_newer_one(server, manager, tmp_path):
+    server.fill(range(10))
+    bloom_filter = BloomFilter(str(tmp_path / 'filter'), capacity=1000)
+
+    def take_over():
+        # Another process started its own rebuild
+        BloomFilter.BUILDER.pack_into(bloom_filter.map, BloomFilter.BUILDER_OFFSET,
+                                      os.getpid() + 1)
+
+    with pytest.raises(OperationalError):
+        bloom_filter.build(ScanHook(manager.read_socket, take_over), 'db', 't', 'id')
+    assert not bloom_filter.built
+    assert os.listdir(str(tmp_path)) == ['filter']
+
+
+def test_string_keys(server, manager, tmp_path):
+    server.fill(['apple', 'banana'])
+    bloom_filter = manager.enable_bloom_filter('db', 't', 'id', str(tmp_path / 'filter'),
+                                               capacity=1000, build=True, start='')
+    assert 'apple' in bloom_filter and 'banana' in bloom_filter
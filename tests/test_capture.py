@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import FIELDS, FakeServer
+from pyhs import Manager
+from pyhs.capture import CaptureRecorder, read_capture
+from pyhs.hedging import HedgePolicy
+from pyhs.replay import replay
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    recorder = CaptureRecorder(str(tmp_path / 'capture'))
+    yield recorder
+    recorder.close()
+
+
+def test_reads_are_recorded_and_replayed(server, recorder):
+    server.fill(range(3))
+    manager = Manager([server.address], [server.address], recorder=recorder)
+    assert manager.get('db', 't', FIELDS, '1')
+    rows = list(manager.find_iter('db', 't', '>=', FIELDS, ['0'], limit=10))
+    assert manager.insert('db', 't', [('id', '3'), ('name', 'x')])
+
+    captured = list(read_capture(recorder.path))
+    assert [request.tokens[1] for request in captured] == ['=', '>=', '+']
+    assert captured[0].index == ('db', 't', 'id,name', 'PRIMARY')
+    assert captured[0].response_size == len('0\t2\t1\tname1')
+    # Streamed response is measured as a whole line
+    assert captured[1].response_size == len('\t'.join(
+        ['0', '2'] + [value for row in rows for field, value in row]))
+
+    result = replay(recorder.path, [server.address], workers=2, speed=0)
+    assert (result['requests'], result['errors'], result['skipped']) == (2, 0, 1)
+
+
+def test_hedged_read_is_recorded_once(server, recorder):
+    slow_server = FakeServer()
+    try:
+        for fake in (server, slow_server):
+            fake.fill([0])
+        slow_server.delay = 0.2
+        manager = Manager([server.address, slow_server.address], [server.address],
+                          hedge_policy=HedgePolicy(max_delay=0.02), recorder=recorder)
+        for i in range(3):
+            assert manager.get('db', 't', FIELDS, '0')
+    finally:
+        slow_server.stop()
+
+    assert len(list(read_capture(recorder.path))) == 3
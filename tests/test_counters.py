@@ -0,0 +1,102 @@
+import logging
+import time
+
+import pytest
+
+from conftest import FIELDS
+from pyhs import Manager
+from pyhs.exceptions import OperationalError
+from pyhs.sockets import WriteSocket
+
+
+@pytest.fixture
+def counters(server, manager):
+    rows = server.table('db', 't')
+    for key in ('1', '2'):
+        rows[key] = {'id': key, 'hits': '10', 'misses': '10'}
+    counter_buffer = manager.enable_counter_buffer(flush_interval=60)
+    yield counter_buffer
+    counter_buffer.close()
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'multiplex'])
+def pipelined(request, server):
+    manager = Manager([server.address], [server.address], multiplex=request.param)
+    yield manager
+    if request.param:
+        manager.read_socket.pool.close()
+        manager.write_socket.pool.close()
+
+
+def test_call_many_keeps_failed_requests_in_place(server, pipelined):
+    server.fill([1])
+    socket = pipelined.read_socket
+    index_id = socket.get_index_id('db', 't', FIELDS)
+    query = [str(index_id), '=', '1', '1', '1', '0']
+    broken = [str(index_id), '~', '1', '1', '1', '0']
+
+    responses = socket._call_many(index_id, [query, broken, query])
+
+    assert responses[0] == responses[2] == [('1', 'name1')]
+    assert isinstance(responses[1], OperationalError)
+
+
+def test_deltas_are_coalesced(server, manager, counters):
+    requests = server.requests
+    for i in range(10):
+        counters.incr('db', 't', ['hits', 'misses'], ['1'], ['1', '2'])
+        counters.decr('db', 't', ['hits', 'misses'], ['2'], ['0', '1'])
+    counters.decr('db', 't', ['hits'], ['2'], ['3'])
+    assert server.requests == requests
+
+    counters.flush()
+
+    rows = server.table('db', 't')
+    assert (rows['1']['hits'], rows['1']['misses']) == ('20', '30')
+    assert (rows['2']['hits'], rows['2']['misses']) == ('7', '0')
+    assert counters.pending_keys == 0
+
+
+def test_invalid_keys_are_refused(counters):
+    with pytest.raises(ValueError):
+        counters.incr('db', 't', ['hits'], [])
+    with pytest.raises(ValueError):
+        counters.incr('db', 't', [], ['1'])
+    with pytest.raises(ValueError):
+        counters.incr('db', 't', ['hits', 'misses'], ['1'], ['1'])
+    assert not counters.pending
+
+
+def test_failed_flush_keeps_deltas(server, counters, monkeypatch, caplog):
+    def broken(self, index_id, requests, deadline=None):
+        raise RuntimeError('broken')
+
+    counters.incr('db', 't', ['hits'], ['1'])
+    monkeypatch.setattr(WriteSocket, 'find_modify_many', broken)
+    with pytest.raises(RuntimeError):
+        counters.flush()
+    assert counters.pending_keys == 1
+
+    # Background thread logs and keeps running
+    with caplog.at_level(logging.ERROR, logger='pyhs.counters'):
+        counters.wakeup.set()
+        for i in range(50):
+            if 'RuntimeError' in caplog.text:
+                break
+            time.sleep(0.05)
+    assert 'RuntimeError: broken' in caplog.text
+    assert counters.thread.is_alive()
+
+    monkeypatch.undo()
+    counters.incr('db', 't', ['hits'], ['1'])
+    counters.flush()
+    assert server.table('db', 't')['1']['hits'] == '12'
+
+
+def test_close_flushes(server, counters):
+    counters.incr('db', 't', ['hits'], ['1'], ['5'])
+    counters.close()
+
+    assert server.table('db', 't')['1']['hits'] == '15'
+    with pytest.raises(OperationalError):
+        counters.incr('db', 't', ['hits'], ['1'])
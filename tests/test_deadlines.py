@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from conftest import FIELDS
+from pyhs.exceptions import DeadlineExceeded
+
+
+def test_call_within_deadline(server, manager):
+    server.fill([1])
+    deadline = time.monotonic() + 5
+    assert manager.get('db', 't', FIELDS, '1', deadline=deadline) == \
+        [('id', '1'), ('name', 'name1')]
+
+
+def test_passed_deadline(server, manager):
+    with pytest.raises(DeadlineExceeded):
+        manager.get('db', 't', FIELDS, '1', deadline=time.monotonic() - 1)
+
+
+def test_slow_server_does_not_fail(server, manager):
+    server.fill([1])
+    manager.get('db', 't', FIELDS, '1')
+    server.delay = 1
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        manager.get('db', 't', FIELDS, '1', deadline=start + 0.2)
+    assert time.monotonic() - start < 0.9
+
+    # Running out of time isn't the server's fault
+    assert all(conn.is_ready() for conn in manager.read_socket.connections)
+    server.delay = 0
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+
+
+def test_write_deadline(server, manager):
+    server.delay = 1
+    with pytest.raises(DeadlineExceeded):
+        manager.insert('db', 't', [('id', '1'), ('name', 'one')],
+                       deadline=time.monotonic() + 0.2)
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from pyhs import Manager, export
+from pyhs.exceptions import ConnectionError
+from pyhs.export import export_table, key_bounds, split_range
+
+
+def test_split_range():
+    assert split_range(1, 10, 3) == [(1, 3), (4, 6), (7, 10)]
+    assert split_range(5, 6, 4) == [(5, 5), (6, 6)]
+
+
+def test_key_bounds(server, manager):
+    assert key_bounds(manager, 'db', 't', 'id') is None
+    server.fill([-5, 3, 17])
+    assert key_bounds(manager, 'db', 't', 'id') == (-5, 17)
+
+
+def test_export_partitions(server, tmp_path):
+    server.fill(range(100))
+
+    result = export_table([server.address], 'db', 't', ['id', 'name'], str(tmp_path),
+                          format='jsonl', partitions=4, workers=2, page_size=7)
+
+    assert result['rows'] == 100
+    assert len(result['files']) == 4
+    rows = [json.loads(line) for path in result['files'] for line in open(path)]
+    assert [int(row['id']) for row in rows] == list(range(100))
+    assert rows[1] == {'id': '1', 'name': 'name1'}
+
+
+def test_failed_pages_are_retried(server, tmp_path, monkeypatch):
+    server.fill(range(30))
+    monkeypatch.setattr(export, 'RETRY_DELAY', 0)
+    find_iter = Manager.find_iter
+    calls = []
+
+    def flaky(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) % 3 == 2:
+            # Server went away in the middle of a page
+            rows = find_iter(self, *args, **kwargs)
+            yield next(rows)
+            rows.close()
+            raise ConnectionError('Could not connect to any of given servers')
+        for row in find_iter(self, *args, **kwargs):
+            yield row
+
+    monkeypatch.setattr(Manager, 'find_iter', flaky)
+    result = export_table([server.address], 'db', 't', ['id', 'name'], str(tmp_path),
+                          partitions=1, workers=1, page_size=4, low=0, high=29)
+
+    assert result['rows'] == 30
+    with open(result['files'][0]) as stream:
+        assert [int(line.split('\t')[0]) for line in stream] == list(range(30))
+
+
+def test_export_fails_after_retries(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'RETRY_DELAY', 0)
+
+    def broken(self, *args, **kwargs):
+        raise ConnectionError('Could not connect to any of given servers')
+        yield
+
+    monkeypatch.setattr(Manager, 'find_iter', broken)
+    with pytest.raises(ConnectionError):
+        export_table([server.address], 'db', 't', ['id', 'name'], str(tmp_path),
+                     low=0, high=10)
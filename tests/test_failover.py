@@ -0,0 +1,49 @@
+import os
+import socket
+
+import pytest
+
+from conftest import FIELDS
+from pyhs import Manager
+
+
+@pytest.fixture
+def dead_address():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    address = ('inet',) + sock.getsockname()
+    # Nothing listens on the port
+    sock.close()
+    return address
+
+
+@pytest.fixture
+def high_fds():
+    """Takes the lowest descriptors, so new sockets are above FD_SETSIZE."""
+    fds = []
+    fd = os.open(os.devnull, os.O_RDONLY)
+    while fd < 1100:
+        fds.append(fd)
+        fd = os.dup(fd)
+    fds.append(fd)
+    yield
+    for fd in fds:
+        os.close(fd)
+
+
+def test_dead_server_is_skipped(server, dead_address):
+    server.fill([0])
+    manager = Manager([dead_address, server.address], [server.address],
+                      connect_stagger=0.05)
+
+    for i in range(5):
+        manager.read_socket.purge()
+        assert manager.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+
+
+def test_connect_above_fd_setsize(server, high_fds):
+    server.fill([0])
+    manager = Manager([server.address], [server.address], connect_stagger=0.05)
+
+    assert manager.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+    assert manager.read_socket.connections[0].socket.fileno() > 1024
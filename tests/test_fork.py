@@ -0,0 +1,45 @@
+import threading
+
+from conftest import FIELDS, fork_only, run_in_child
+from pyhs import Manager
+
+
+pytestmark = fork_only
+
+
+def test_child_reads_after_fork(server, manager):
+    server.fill([0, 1])
+    assert manager.get('db', 't', FIELDS, '0')
+
+    assert run_in_child(lambda: manager.get('db', 't', FIELDS, '1') ==
+                        [('id', '1'), ('name', 'name1')])
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+
+
+def test_child_is_warmed_up(server, manager):
+    manager.warm([('db', 't', FIELDS)])
+    # Inherited indexes are dropped, so these are opened by the child
+    assert run_in_child(lambda: manager.read_socket.index_cache)
+
+
+def test_fork_from_another_thread_warms_up(server, manager):
+    manager.warm([('db', 't', FIELDS)])
+    results = []
+
+    def fork():
+        results.append(run_in_child(lambda: manager.read_socket.index_cache))
+
+    thread = threading.Thread(target=fork)
+    thread.start()
+    thread.join()
+    assert results == [True]
+
+
+def test_failed_warm_up_does_not_affect_other_pools(server, manager):
+    other = Manager([server.address], [server.address])
+    manager.warm([('db', 'missing', FIELDS)])
+    other.warm([('db', 't', FIELDS)])
+    server.missing.add(('db', 'missing'))
+
+    assert run_in_child(lambda: not manager.read_socket.index_cache and
+                        other.read_socket.index_cache)
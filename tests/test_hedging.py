@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from conftest import FIELDS, FakeServer
+from pyhs import Manager
+from pyhs.hedging import HedgePolicy
+
+
+@pytest.fixture
+def slow_server():
+    server = FakeServer()
+    server.delay = 0.5
+    yield server
+    server.stop()
+
+
+def test_slow_server_is_hedged(server, slow_server):
+    for fake in (server, slow_server):
+        fake.fill([0])
+    manager = Manager([server.address, slow_server.address], [server.address],
+                      hedge_policy=HedgePolicy(max_delay=0.05))
+
+    # Index may be opened on the slow server, opening isn't hedged
+    assert manager.get('db', 't', FIELDS, '0')
+    for i in range(5):
+        started = time.monotonic()
+        assert manager.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+        assert time.monotonic() - started < 0.4
+
+    # Faster server keeps serving the index, the slow one was left
+    assert manager.read_socket.index_map.values()
+    for conn in manager.read_socket.index_map.values():
+        assert conn.address == server.server_address
+
+
+def test_policy_delay_follows_latencies():
+    policy = HedgePolicy(percentile=50, samples=100, max_delay=1)
+    assert policy.delay() == 1
+    for i in range(100):
+        policy.record(0.01 if i % 2 else 0.02)
+    assert policy.delay() in (0.01, 0.02)
@@ -0,0 +1,66 @@
+import logging
+
+from conftest import FIELDS
+from pyhs.hooks import Hook
+
+
+class Recorder(Hook):
+
+    def __init__(self):
+        self.phases = []
+        self.operations = []
+
+    def before(self, phase, context):
+        self.phases.append(('before', phase))
+
+    def after(self, phase, context, elapsed, error):
+        self.phases.append(('after', phase))
+        if context['operation'] == phase:
+            self.operations.append((dict(context), error))
+
+
+def test_phases_of_a_look_up(server, manager):
+    server.fill([1])
+    manager.get('db', 't', FIELDS, '1')
+    recorder = Recorder()
+    manager.hooks.add(recorder)
+
+    manager.get('db', 't', FIELDS, '1')
+
+    (context, error), = recorder.operations
+    assert error is None
+    assert context['index'] == ('db', 't', 'id,name', 'PRIMARY')
+    assert context['op'] == '='
+    assert context['rows'] == 1
+    assert context['address'] == manager.read_socket.connections[0].address
+    assert {'send', 'receive', 'parse'} <= set(context['timings'])
+    # Inner phases are nested in the operation
+    assert recorder.phases[0] == ('before', 'call')
+    assert recorder.phases[-1] == ('after', 'call')
+
+
+def test_removed_hook_is_not_called(server, manager):
+    recorder = Recorder()
+    manager.hooks.add(recorder)
+    manager.hooks.remove(recorder)
+
+    manager.get('db', 't', FIELDS, '1')
+
+    assert recorder.phases == []
+    assert not manager.hooks
+
+
+def test_slow_log(server, manager, caplog):
+    server.fill([1])
+    manager.enable_slow_log(threshold=0.05)
+
+    with caplog.at_level(logging.WARNING, logger='pyhs.hooks'):
+        manager.get('db', 't', FIELDS, '1')
+        assert not [record for record in caplog.records if 'Slow call' in record.message]
+
+        server.delay = 0.1
+        manager.get('db', 't', FIELDS, '1')
+
+    slow = [record.message for record in caplog.records if 'Slow call' in record.message]
+    assert len(slow) == 1
+    assert 'table=t' in slow[0] and 'op== rows=1' in slow[0]
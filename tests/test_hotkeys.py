@@ -0,0 +1,49 @@
+import time
+
+from conftest import FIELDS
+from pyhs.hotkeys import HotKeyTracker
+
+
+def test_top_keys():
+    tracker = HotKeyTracker(top=3)
+    for key, count in [('a', 50), ('b', 5), ('c', 20), ('d', 1), ('e', 30)]:
+        for i in range(count):
+            tracker.record(key)
+
+    top = tracker.top_keys()
+    assert [key for key, estimate in top] == ['a', 'e', 'c']
+    # Estimates may only be too high
+    assert top[0][1] >= 50
+    assert tracker.top_keys(1) == top[:1]
+
+
+def test_counts_decay():
+    tracker = HotKeyTracker(decay_interval=0.05)
+    for i in range(8):
+        tracker.record('a')
+    time.sleep(0.1)
+    assert tracker.record('a') == 5
+
+
+def test_only_hot_keys_are_cached():
+    tracker = HotKeyTracker(threshold=3, ttl=10)
+    for i in range(3):
+        estimate = tracker.record('a')
+        tracker.set('a', 'value', estimate)
+        assert tracker.get('a') == (i == 2 and 'value' or None)
+    assert tracker.get('a', 'other') is None
+
+
+def test_manager_caches_hot_keys(server, manager):
+    server.fill([1, 2])
+    manager.enable_hot_keys(threshold=2, ttl=10)
+
+    manager.get('db', 't', FIELDS, '1')
+    manager.get('db', 't', FIELDS, '1')
+    requests = server.requests
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    assert server.requests == requests
+
+    manager.get('db', 't', FIELDS, '2')
+    assert manager.hot_keys('db', 't') == [('1', 3), ('2', 1)]
+    assert manager.hot_keys('db', 'other') == []
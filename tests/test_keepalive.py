@@ -0,0 +1,85 @@
+import os
+import socket
+import time
+
+from conftest import FIELDS, fork_only, run_in_child
+from pyhs import Manager
+from pyhs.utils import wait_for_sockets
+
+
+def move_to_high_fd(conn):
+    """Moves the connection socket above ``FD_SETSIZE``."""
+    fd = os.dup2(conn.socket.fileno(), 1500)
+    conn.socket.close()
+    conn.socket = socket.socket(fileno=fd)
+
+
+def test_wait_for_sockets_above_fd_setsize():
+    left, right = socket.socketpair()
+    fd = os.dup2(left.fileno(), 1500)
+    left.close()
+    left = socket.socket(fileno=fd)
+    try:
+        assert wait_for_sockets([left], [left], 0) == ([], [left])
+        right.sendall(b'x')
+        assert wait_for_sockets([left], timeout=1) == ([left], [])
+    finally:
+        left.close()
+        right.close()
+
+
+def test_closed_connection_is_detected(server, manager):
+    server.fill([0])
+    assert manager.get('db', 't', FIELDS, '0')
+    conn = manager.read_socket.connections[0]
+    move_to_high_fd(conn)
+
+    conn.last_used -= conn.STALE_CHECK_IDLE
+    assert not conn._is_stale()
+
+    server.drop_connections()
+    time.sleep(0.1)
+    assert conn._is_stale()
+    # Replaced without a failed request
+    assert manager.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+    assert server.connects == 2
+
+
+def test_ping_keeps_socket_above_fd_setsize(server, manager):
+    server.fill([0])
+    assert manager.get('db', 't', FIELDS, '0')
+    conn = manager.read_socket.connections[0]
+    move_to_high_fd(conn)
+    sock = conn.socket
+
+    conn.ping(0)
+
+    assert conn.socket is sock
+    assert server.connects == 1
+
+
+@fork_only
+def test_fork_while_connection_is_locked(server, manager):
+    server.fill([0])
+    assert manager.get('db', 't', FIELDS, '0')
+    conn = manager.read_socket.connections[0]
+
+    # E.g. a ping was in progress in another thread
+    with conn.lock:
+        assert run_in_child(lambda: manager.get('db', 't', FIELDS, '0'))
+
+
+@fork_only
+def test_pinger_runs_in_child(server):
+    manager = Manager([server.address], [server.address], ping_interval=0.05)
+    server.fill([0])
+    assert manager.get('db', 't', FIELDS, '0')
+    assert manager.pinger.thread.is_alive()
+
+    def check():
+        manager.get('db', 't', FIELDS, '0')
+        thread = manager.pinger.thread
+        return thread is not None and thread.is_alive()
+
+    assert run_in_child(check)
+    manager.pinger.stop()
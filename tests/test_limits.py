@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FIELDS
+from pyhs import Manager
+from pyhs.exceptions import ServerOverloadedError
+from pyhs.limits import AdaptiveLimiter, ConcurrencyLimits
+
+
+def test_requests_over_limit_are_rejected():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.saturated()
+    with pytest.raises(ServerOverloadedError):
+        limiter.acquire()
+
+
+def test_waiting_for_a_free_slot():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5)
+    started = limiter.acquire()
+    timer = threading.Timer(0.1, limiter.release, (started,))
+    timer.start()
+
+    limiter.acquire()
+    timer.join()
+    assert limiter.inflight == 1
+
+
+def test_limit_adapts():
+    limiter = AdaptiveLimiter(initial_limit=10)
+    limiter.average_latency = 1
+    for i in range(10):
+        limiter.release(limiter.acquire())
+    assert limiter.limit > 10
+
+    limit = limiter.limit
+    limiter.release(limiter.acquire(), dropped=True)
+    assert limiter.limit == pytest.approx(limit * limiter.backoff)
+
+
+def test_slow_request_backs_off():
+    limiter = AdaptiveLimiter(initial_limit=10)
+    limiter.average_latency = 0.001
+    started = limiter.acquire()
+    time.sleep(0.05)
+    limiter.release(started)
+    assert limiter.limit == pytest.approx(10 * limiter.backoff)
+
+
+def test_backs_off_once_per_round_trip():
+    limiter = AdaptiveLimiter(initial_limit=10)
+    started = [limiter.acquire() for i in range(3)]
+    for start in started:
+        limiter.release(start, dropped=True)
+    assert limiter.limit == pytest.approx(10 * limiter.backoff)
+
+
+def test_manager_tracks_requests(server):
+    server.fill([1])
+    limits = ConcurrencyLimits(initial_limit=5)
+    manager = Manager([server.address], [server.address], concurrency_limits=limits)
+
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    limiter = limits.limiter(manager.read_socket.connections[0].address)
+    assert limiter.inflight == 0
+    assert limiter.average_latency is not None
+
+
+def test_manager_rejects_over_limit(server):
+    limits = ConcurrencyLimits(initial_limit=1)
+    manager = Manager([server.address], [server.address], concurrency_limits=limits)
+    manager.get('db', 't', FIELDS, '1')
+    limiter = limits.limiter(manager.read_socket.connections[0].address)
+    while not limiter.saturated():
+        limiter.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(ServerOverloadedError):
+        manager.get('db', 't', FIELDS, '1')
+    assert time.monotonic() - start < 1
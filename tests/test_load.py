@@ -0,0 +1,83 @@
+import io
+import logging
+
+import pytest
+
+from conftest import FIELDS
+from pyhs import Manager
+from pyhs.exceptions import OperationalError
+from pyhs.load import Loader, load_file, read_rows
+from pyhs.sockets import WriteSocket
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'multiplex'])
+def pipelined(request, server):
+    manager = Manager([server.address], [server.address], multiplex=request.param)
+    yield manager
+    if request.param:
+        manager.read_socket.pool.close()
+        manager.write_socket.pool.close()
+
+
+def test_insert_many_reports_failed_rows(server, pipelined):
+    socket = pipelined.write_socket
+    index_id = socket.get_index_id('db', 't', FIELDS)
+
+    results = socket.insert_many(index_id, [['1', 'a'], ['1', 'b'], ['2', 'c']])
+
+    assert results[0] is True
+    assert isinstance(results[1], OperationalError)
+    assert results[2] is True
+    assert server.table('db', 't')['1']['name'] == 'a'
+    # Responses stay in step with requests after the failure
+    assert pipelined.get('db', 't', FIELDS, '2') == [('id', '2'), ('name', 'c')]
+
+
+def test_insert_many_validates_before_sending(server, pipelined):
+    socket = pipelined.write_socket
+    index_id = socket.get_index_id('db', 't', FIELDS)
+    requests = server.requests
+
+    with pytest.raises(ValueError):
+        socket.insert_many(index_id, [['1', 'a'], []])
+
+    assert server.requests == requests
+    assert not server.table('db', 't')
+
+
+def test_read_rows_unescapes_tsv():
+    names, rows = read_rows(io.StringIO('1\ta\\tb\n2\t\\N\n'))
+    assert names is None
+    assert list(rows) == [['1', 'a\tb'], ['2', None]]
+
+
+def test_load_file_rejects_duplicates_and_short_rows(server, tmp_path):
+    server.fill([1])
+    path = tmp_path / 'input.csv'
+    path.write_text('name,id\none,1\ntwo,2\nshort\nthree,3\n')
+    reject_path = tmp_path / 'rejects'
+
+    result = load_file([server.address], 'db', 't', FIELDS, str(path), format='csv',
+                       mapping=['id', 'name'], reject_path=str(reject_path),
+                       batch_size=2, workers=2)
+
+    assert (result['loaded'], result['rejected']) == (2, 2)
+    assert server.table('db', 't')['3'] == {'id': '3', 'name': 'three'}
+    rejects = sorted(line.split('\t')[0] for line in reject_path.read_text().splitlines())
+    assert rejects == ['1', 'short']
+
+
+def test_unexpected_errors_reject_the_batch(server, caplog, monkeypatch):
+    def broken(self, index_id, rows):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(WriteSocket, 'insert_many', broken)
+    reject_file = io.StringIO()
+    loader = Loader([server.address], 'db', 't', FIELDS, reject_file=reject_file)
+
+    with caplog.at_level(logging.ERROR, logger='pyhs.load'):
+        result = loader.load([['1', 'a'], ['2', 'b']])
+
+    assert (result['loaded'], result['rejected']) == (0, 2)
+    assert reject_file.getvalue().splitlines()[0] == '1\ta\tRuntimeError: broken'
+    assert 'RuntimeError: broken' in caplog.text
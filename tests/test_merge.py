@@ -0,0 +1,58 @@
+import pytest
+
+from conftest import FIELDS, FakeServer
+from pyhs import Manager
+from pyhs.merge import merge_find
+
+
+@pytest.fixture
+def partitions():
+    servers = [FakeServer(), FakeServer()]
+    servers[0].fill(range(0, 30, 2))
+    servers[1].fill(range(1, 30, 2))
+    yield [Manager([server.address], [server.address]) for server in servers]
+    for server in servers:
+        server.stop()
+
+
+def keys(rows):
+    return [int(row[0][1]) for row in rows]
+
+
+def test_ascending_merge(partitions):
+    rows = list(merge_find(partitions, 'db', 't', '>=', FIELDS, ['5'], page_size=4))
+    assert keys(rows) == list(range(5, 30))
+    assert rows[0] == [('id', '5'), ('name', 'name5')]
+
+
+def test_descending_merge(partitions):
+    rows = merge_find(partitions, 'db', 't', '<', FIELDS, ['10'], page_size=3)
+    assert keys(rows) == list(range(9, -1, -1))
+
+
+def test_limit_and_offset(partitions):
+    rows = merge_find(partitions, 'db', 't', '>', FIELDS, ['0'], limit=5, offset=3,
+                      page_size=2)
+    assert keys(rows) == [4, 5, 6, 7, 8]
+
+
+def test_pages_over_duplicate_keys():
+    server = FakeServer()
+    try:
+        rows = server.table('db', 't')
+        for key in range(12):
+            rows[str(key)] = {'id': str(key), 'grp': str(key // 5)}
+        manager = Manager([server.address], [server.address])
+
+        found = merge_find([manager], 'db', 't', '>=', ['grp', 'id'], ['0'],
+                           index_name='grp', page_size=2)
+        assert [row[1][1] for row in found] == [str(key) for key in range(12)]
+    finally:
+        server.stop()
+
+
+def test_invalid_arguments(partitions):
+    with pytest.raises(ValueError):
+        merge_find(partitions, 'db', 't', '=', FIELDS, ['0'])
+    with pytest.raises(ValueError):
+        merge_find(partitions, 'db', 't', '>', FIELDS, ['0'], page_size=0)
@@ -0,0 +1,58 @@
+from conftest import FIELDS
+
+
+def test_update_many_primary_keys_in_one_request(server, manager):
+    server.fill(range(5))
+    requests = server.requests
+
+    assert manager.update_many('db', 't', ['name'], [0, 2, 4, 7], ['x'],
+                               chunk_size=3) == 3
+
+    # Open index and one IN request per chunk
+    assert server.requests == requests + 3
+    names = dict((key, row['name']) for key, row in server.table('db', 't').items())
+    assert names == {'0': 'x', '1': 'name1', '2': 'x', '3': 'name3', '4': 'x'}
+
+
+def test_update_many_per_key_values(server, manager):
+    server.fill(range(3))
+
+    results = manager.update_many('db', 't', FIELDS, [0, 1, 5],
+                                  {0: ['0', 'a'], 1: ['1', 'b'], 5: ['5', 'c']})
+
+    assert results == {0: 1, 1: 1, 5: 0}
+    assert server.table('db', 't')['1']['name'] == 'b'
+
+
+def test_delete_many_returns_original_rows(server, manager):
+    server.fill(range(3))
+
+    rows = manager.delete_many('db', 't', FIELDS, [0, 2], return_original=True)
+
+    assert sorted(rows) == [[('id', '0'), ('name', 'name0')],
+                            [('id', '2'), ('name', 'name2')]]
+    assert list(server.table('db', 't')) == ['1']
+
+
+def test_limit_applies_per_key_of_secondary_index(server, manager):
+    rows = server.table('db', 't')
+    for key, group in enumerate('aabb'):
+        rows[str(key)] = {'id': str(key), 'grp': group, 'name': 'name'}
+
+    assert manager.update_many('db', 't', ['grp', 'name'], ['a', 'b'], ['_', 'x'],
+                               index_name='grp', limit=1) == 2
+
+    updated = sorted(row['grp'] for row in rows.values() if row['name'] == 'x')
+    assert updated == ['_', '_']
+    assert sorted(row['grp'] for row in rows.values()) == ['_', '_', 'a', 'b']
+
+
+def test_updated_keys_are_added_to_bloom_filter(server, manager, tmp_path):
+    server.fill([1, 2])
+    manager.enable_bloom_filter('db', 't', 'id', str(tmp_path / 'filter'),
+                                capacity=1000, build=True)
+
+    manager.update_many('db', 't', FIELDS, [1, 2], {1: ['10', 'a'], 2: ['20', 'b']})
+
+    assert manager.get('db', 't', FIELDS, '10') == [('id', '10'), ('name', 'a')]
+    assert manager.get('db', 't', FIELDS, '20') == [('id', '20'), ('name', 'b')]
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from conftest import FIELDS, fork_only, run_in_child
+from pyhs import Manager
+from pyhs.exceptions import OperationalError
+
+
+@pytest.fixture
+def multiplexed(server):
+    manager = Manager([server.address], [server.address], multiplex=True)
+    yield manager
+    manager.read_socket.pool.close()
+    manager.write_socket.pool.close()
+
+
+def test_responses_go_to_their_threads(server, multiplexed):
+    server.fill(range(50))
+    server.delay = 0.001
+    errors = []
+
+    def read(offset):
+        try:
+            for i in range(50):
+                key = str((i + offset) % 50)
+                assert multiplexed.get('db', 't', FIELDS, key) == \
+                    [('id', key), ('name', 'name' + key)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read, args=(i * 7,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    # All threads share a single connection
+    assert server.connects == 1
+
+
+def test_reconnect_starts_new_generation(server, multiplexed):
+    server.fill([0])
+    assert multiplexed.get('db', 't', FIELDS, '0')
+    mconn = multiplexed.read_socket.pool.connections[0]
+    generation = mconn.generation
+
+    server.drop_connections()
+
+    # Index of the lost generation is reopened on a new connection
+    assert multiplexed.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+    assert mconn.generation > generation
+    assert server.connects == 2
+
+
+def test_open_error_is_not_cached(server, multiplexed):
+    server.missing.add(('db', 't'))
+    with pytest.raises(OperationalError):
+        multiplexed.get('db', 't', FIELDS, '0')
+    assert not multiplexed.read_socket.pool.index_cache
+
+    server.missing.clear()
+    server.fill([0])
+    assert multiplexed.get('db', 't', FIELDS, '0') == [('id', '0'), ('name', 'name0')]
+
+
+def test_insert_and_read_back(server, multiplexed):
+    assert multiplexed.insert('db', 't', [('id', '1'), ('name', 'one')])
+    assert multiplexed.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'one')]
+
+
+@fork_only
+def test_pool_works_after_fork(server, multiplexed):
+    server.fill([0])
+    assert multiplexed.get('db', 't', FIELDS, '0')
+
+    assert run_in_child(lambda: multiplexed.get('db', 't', FIELDS, '0') ==
+                        [('id', '0'), ('name', 'name0')])
+    assert multiplexed.get('db', 't', FIELDS, '0')
+
+
+def test_responses_are_not_left_outstanding(server, multiplexed):
+    server.fill(range(3))
+    for key in ('0', '1', '2'):
+        assert multiplexed.get('db', 't', FIELDS, key)
+    assert multiplexed.read_socket.pool.connections[0].connection.outstanding == 0
+
+
+@fork_only
+def test_fork_while_locks_are_held(server, multiplexed):
+    server.fill([0])
+    assert multiplexed.get('db', 't', FIELDS, '0')
+    pool = multiplexed.read_socket.pool
+
+    with pool.lock, pool.connections[0].lock:
+        assert run_in_child(lambda: multiplexed.get('db', 't', FIELDS, '0') ==
+                            [('id', '0'), ('name', 'name0')])
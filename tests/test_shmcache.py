@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from conftest import FIELDS, fork_only, run_in_child
+from pyhs import shmcache
+from pyhs.shmcache import SharedCache
+
+
+pytestmark = pytest.mark.skipif(shmcache.fcntl is None, reason='fcntl is not available')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SharedCache(str(tmp_path / 'cache'), slots=16, slot_size=128, ttl=10)
+    yield cache
+    cache.close()
+
+
+def test_set_get_delete(cache):
+    assert cache.get(['db', 't', '1']) is None
+    cache.set(['db', 't', '1'], [['id', '1']])
+    assert cache.get(['db', 't', '1']) == [['id', '1']]
+
+    cache.delete(['db', 't', '1'])
+    assert cache.get(['db', 't', '1']) is None
+
+
+def test_values_expire(cache):
+    cache.set('key', 'value', ttl=0.05)
+    assert cache.get('key') == 'value'
+    time.sleep(0.1)
+    assert cache.get('key') is None
+
+
+def test_large_values_are_not_cached(cache):
+    cache.set('key', 'x' * 200)
+    assert cache.get('key') is None
+
+
+def test_layout_must_match(cache):
+    with pytest.raises(ValueError):
+        SharedCache(cache.path, slots=32, slot_size=128)
+
+
+@fork_only
+def test_shared_between_processes(cache):
+    assert run_in_child(lambda: cache.set('key', 'value') or True)
+    assert cache.get('key') == 'value'
+
+
+def test_manager_get_is_cached(server, manager, tmp_path):
+    server.fill([1])
+    manager.enable_shared_cache(str(tmp_path / 'cache'), slots=16)
+
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    requests = server.requests
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    assert server.requests == requests
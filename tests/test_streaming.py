@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import FIELDS
+from pyhs.exceptions import OperationalError
+from pyhs.sockets import Connection
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Tokens and escape sequences get split between received chunks
+    monkeypatch.setattr(Connection, 'RECV_SIZE', 7)
+
+
+def test_rows_match_find(server, manager, small_chunks):
+    server.fill(range(200))
+    server.table('db', 't')['7']['name'] = 'tab\there\x01'
+
+    rows = list(manager.find_iter('db', 't', '>=', FIELDS, ['0'], limit=200))
+
+    assert rows == manager.find('db', 't', '>=', FIELDS, ['0'], limit=200)
+    assert len(rows) == 200
+    assert rows[7] == [('id', '7'), ('name', 'tab\there\x01')]
+
+
+def test_closing_early_drops_connection(server, manager):
+    server.fill(range(50))
+    rows = manager.find_iter('db', 't', '>=', FIELDS, ['0'], limit=50)
+    assert next(rows) == [('id', '0'), ('name', 'name0')]
+    rows.close()
+
+    assert server.connects == 1
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    assert server.connects == 2
+
+
+def test_error_response(server, manager):
+    server.fill([1])
+    server.missing.add(('db', 'missing'))
+    with pytest.raises(OperationalError):
+        list(manager.find_iter('db', 'missing', '>=', FIELDS, ['0']))
+
+    assert manager.get('db', 't', FIELDS, '1') == [('id', '1'), ('name', 'name1')]
+    assert server.connects == 1
@@ -0,0 +1,132 @@
+import logging
+import os
+
+import pytest
+
+from conftest import fork_only, run_in_child
+from pyhs import Manager
+from pyhs.exceptions import OperationalError
+from pyhs.sockets import WriteSocket
+
+
+def inserted(server):
+    return sorted(int(key) for key in server.table('db', 't'))
+
+
+def test_rows_are_inserted_in_background(server, manager):
+    write_queue = manager.enable_write_queue(batch_size=10)
+    for i in range(50):
+        assert manager.insert_async('db', 't', [('id', str(i)), ('name', 'x')])
+
+    assert write_queue.flush(10)
+    assert inserted(server) == list(range(50))
+    stats = write_queue.stats()
+    assert (stats['written'], stats['pending'], stats['failed']) == (50, 0, 0)
+
+    assert write_queue.close(10)
+    with pytest.raises(OperationalError):
+        write_queue.insert('db', 't', [('id', '50'), ('name', 'x')])
+
+
+def test_failed_rows_are_counted(server, manager):
+    server.table('db', 't')['1'] = {'id': '1', 'name': 'x'}
+    write_queue = manager.enable_write_queue(workers=1)
+    for i in range(3):
+        write_queue.insert('db', 't', [('id', str(i)), ('name', 'y')])
+
+    assert write_queue.close(10)
+    stats = write_queue.stats()
+    assert (stats['written'], stats['failed']) == (2, 1)
+
+
+def test_worker_survives_unexpected_errors(server, manager, caplog, monkeypatch):
+    write_queue = manager.enable_write_queue(workers=1)
+    insert_many = WriteSocket.insert_many
+
+    def broken(self, index_id, rows):
+        monkeypatch.setattr(WriteSocket, 'insert_many', insert_many)
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(WriteSocket, 'insert_many', broken)
+    with caplog.at_level(logging.ERROR, logger='pyhs.writequeue'):
+        write_queue.insert('db', 't', [('id', '1'), ('name', 'x')])
+        assert write_queue.flush(10)
+    write_queue.insert('db', 't', [('id', '2'), ('name', 'x')])
+
+    assert write_queue.close(10)
+    assert inserted(server) == [2]
+    assert write_queue.stats()['failed'] == 1
+    assert 'RuntimeError: broken' in caplog.text
+
+
+def test_drop_policy(server, manager):
+    server.delay = 0.05
+    write_queue = manager.enable_write_queue(max_size=1, workers=1, batch_size=1,
+                                             policy='drop')
+    results = [write_queue.insert('db', 't', [('id', str(i)), ('name', 'x')])
+               for i in range(10)]
+
+    assert not all(results)
+    assert write_queue.close(10)
+    assert write_queue.stats()['dropped'] == results.count(False)
+    assert len(inserted(server)) == results.count(True)
+
+
+def test_spilled_rows_are_replayed(server, manager, tmp_path):
+    server.delay = 0.01
+    write_queue = manager.enable_write_queue(max_size=2, workers=1, batch_size=1,
+                                             policy='spill',
+                                             spill_path=str(tmp_path / 'spill'))
+    for i in range(20):
+        assert write_queue.insert('db', 't', [('id', str(i)), ('name', 'x')])
+    assert write_queue.stats()['spilled']
+
+    assert write_queue.close(10)
+    assert inserted(server) == list(range(20))
+    assert write_queue.stats()['spilled'] == 0
+    assert os.path.getsize(str(tmp_path / 'spill')) == 0
+
+
+def test_unflushed_rows_go_to_next_queue(server, manager, tmp_path):
+    spill_path = str(tmp_path / 'spill')
+    server.delay = 0.2
+    write_queue = manager.enable_write_queue(max_size=5, workers=1, batch_size=1,
+                                             policy='spill', spill_path=spill_path)
+    for i in range(10):
+        write_queue.insert('db', 't', [('id', str(i)), ('name', 'x')])
+
+    assert not write_queue.close(0.1)
+    for thread in write_queue.threads:
+        thread.join(10)
+    with open(spill_path) as stream:
+        spilled = sum(1 for line in stream)
+    assert spilled and spilled + len(inserted(server)) == 10
+
+    server.delay = 0
+    other = Manager([server.address], [server.address])
+    next_queue = other.enable_write_queue(policy='spill', spill_path=spill_path)
+    assert next_queue.stats()['pending'] == spilled
+    assert next_queue.close(10)
+    assert inserted(server) == list(range(10))
+
+
+def test_spill_policy_requires_path(manager):
+    with pytest.raises(ValueError):
+        manager.enable_write_queue(policy='spill')
+
+
+@fork_only
+def test_write_queue_runs_in_child(server, manager, tmp_path):
+    write_queue = manager.enable_write_queue()
+    spilling = Manager([server.address], [server.address]).enable_write_queue(
+        policy='spill', spill_path=str(tmp_path / 'spill'))
+
+    def check():
+        write_queue.insert('db', 't', [('id', '1'), ('name', 'child')])
+        # Spill file stays with the parent
+        return write_queue.flush(5) and spilling.closed
+
+    assert run_in_child(check)
+    assert server.table('db', 't')['1']['name'] == 'child'
+    assert not spilling.closed
+    assert write_queue.close(10) and spilling.close(10)